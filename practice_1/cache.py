@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+
+
+# Results of the transcode endpoints, keyed by the hash of the source content and the
+# normalized parameters of the operation. Every entry is a folder of the shared volume with
+# the output files, evicted least recently used first when the cache grows over max_bytes,
+# and when it is older than max_age_seconds
+CACHE_DIR = os.environ.get("CACHE_DIR", "/shared/cache")
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 20 << 30))  # 20 GiB
+CACHE_MAX_AGE = float(os.environ.get("CACHE_MAX_AGE", 7 * 24 * 3600))  # 1 week
+
+
+def cache_key(source_hash: str, operation: str, params: dict) -> str:
+    # Same source, operation and parameters (in any order) -> same key
+    normalized = json.dumps({"source": source_hash, "operation": operation, "params": params}, sort_keys=True)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def folder_size(path: str) -> int:
+    # Subfolders included (segmented renditions have one per stream)
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names)
+
+
+class ResultCache:
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, max_age_seconds: float = CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.index_path = os.path.join(directory, "index.json")
+        self.entries = {}  # key -> {"result", "size_bytes", "created_at", "last_used"}
+        self.pending = {}  # key -> task producing it, shared by identical requests
+        self.metrics = {"hits": 0, "misses": 0, "shared": 0, "evictions": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                entries = json.load(f)
+            self.entries = {key: entry for key, entry in entries.items() if os.path.isdir(self.entry_dir(key))}
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _save_index(self):
+        temporary = self.index_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temporary, self.index_path)
+
+    async def get_or_create(self, source_hash: str, operation: str, params: dict, produce, release=None) -> dict:
+        # produce(output_dir) writes the output files into output_dir and returns the result
+        # dict. The result comes back with "cache": "hit", "miss" or "shared" (an identical
+        # request was already running and its result was reused). release() frees what produce
+        # reads (e.g. the uploaded source): the cache owns it, and calls it once the work is
+        # done, or right away when no work is needed
+        key = cache_key(source_hash, operation, params)
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry["created_at"] <= self.max_age_seconds:
+            if release is not None:
+                release()
+            entry["last_used"] = time.time()
+            self._save_index()  # The LRU order survives restarts
+            self.metrics["hits"] += 1
+            return {**entry["result"], "cache": "hit"}
+
+        if key in self.pending:
+            if release is not None:
+                release()
+            self.metrics["shared"] += 1
+            return {**await asyncio.shield(self.pending[key]), "cache": "shared"}
+
+        self.metrics["misses"] += 1
+        # The work runs in its own task: a requester going away does not cancel it for the
+        # others, nor release its input while it runs
+        task = asyncio.create_task(self._produce(key, produce))
+        self.pending[key] = task
+        task.add_done_callback(lambda _: self.pending.pop(key, None))
+        if release is not None:
+            task.add_done_callback(lambda _: release())
+        return {**await asyncio.shield(task), "cache": "miss"}
+
+    async def _produce(self, key: str, produce) -> dict:
+        output_dir = self.entry_dir(key)
+        shutil.rmtree(output_dir, ignore_errors=True)  # Leftovers of an expired or failed entry
+        os.makedirs(output_dir)
+        try:
+            result = await produce(output_dir)
+        except BaseException:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            raise
+
+        now = time.time()
+        self.entries[key] = {"result": result, "size_bytes": folder_size(output_dir), "created_at": now, "last_used": now}
+        self.evict(keep=key)
+        self._save_index()
+        return result
+
+    def evict(self, keep: str = None):
+        # Expired entries first, then the least recently used ones until the cache fits
+        # (keep is the entry just made, which is being returned)
+        now = time.time()
+        expired = [key for key, entry in self.entries.items() if now - entry["created_at"] > self.max_age_seconds]
+        by_last_use = sorted((key for key in self.entries if key != keep), key=lambda key: self.entries[key]["last_used"])
+        total = sum(entry["size_bytes"] for entry in self.entries.values())
+        for key in expired + by_last_use:
+            if key not in self.entries:
+                continue
+            if key not in expired and total <= self.max_bytes:
+                break
+            total -= self.entries.pop(key)["size_bytes"]
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            self.metrics["evictions"] += 1
+
+    def stats(self) -> dict:
+        lookups = self.metrics["hits"] + self.metrics["misses"] + self.metrics["shared"]
+        return {
+            **self.metrics,
+            "hit_ratio": (self.metrics["hits"] + self.metrics["shared"]) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "size_bytes": sum(entry["size_bytes"] for entry in self.entries.values()),
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age_seconds,
+            "in_progress": len(self.pending)
+        }
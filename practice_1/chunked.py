@@ -0,0 +1,130 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from ffmpeg_runner import run_ffmpeg, queue_when_busy, encoded_frames, encode_stats, FFMPEG_THREADS, PROGRESS_ARGS
+
+
+# Chunked encoding: the source video is cut at its keyframes into segments of about
+# segment_seconds (stream copy, nothing is decoded), the segments are encoded by several
+# ffmpeg processes at the same time and the encoded segments are joined back with the concat
+# demuxer, again with stream copy. Slow single-process encoders (libaom-av1, libx265) then
+# use every core. Only the first video stream is split and encoded: the audio of the source
+# is encoded when joining, other streams (subtitles, more audio tracks) are dropped. The
+# segment encodes are batch work for the ffmpeg scheduler, which may run fewer of them at
+# once than workers.
+# The cuts can only be made at keyframes of the source, so it needs keyframes at most about
+# segment_seconds apart (e.g. a GOP of a few seconds) to give several segments. A source with
+# a single GOP, or keyframes farther apart than the whole video, gives one segment: it is then
+# encoded directly by one ffmpeg with every thread, without the concat pass
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", os.cpu_count() or 1))
+CHUNK_SECONDS = float(os.environ.get("CHUNK_SECONDS", 10))
+
+# Audio codec of each output container, audio is encoded once from the source when joining
+CONTAINER_AUDIO = {".mp4": "aac", ".mov": "aac", ".webm": "libopus", ".mkv": "libopus"}
+
+
+def concat_entry(path: str) -> str:
+    # Line of a concat demuxer list, quotes in the path escaped the shell way
+    return "file '" + path.replace("'", "'\\''") + "'\n"
+
+
+def segment_threads(workers: int, budget: int = FFMPEG_THREADS) -> int:
+    # CPU threads of each segment encode, so all the workers together use the budget
+    return max(1, budget // workers)
+
+
+async def split_at_keyframes(input_path: str, directory: str, segment_seconds: float = CHUNK_SECONDS) -> list:
+    # The segment muxer with stream copy can only cut at keyframes: every segment starts a GOP
+    # and decodes on its own
+    await run_ffmpeg([
+        "ffmpeg", "-y", "-i", input_path, "-map", "0:v:0", "-c", "copy",
+        "-f", "segment", "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+        os.path.join(directory, "source_%05d.mkv")
+    ], priority="batch")
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.startswith("source_"))
+
+
+async def concat_segments(segments: list, input_path: str, output_path: str, list_path: str):
+    # Video joined without re-encoding, the audio of the source (if it has any) encoded on the way
+    with open(list_path, "w") as f:
+        f.writelines(concat_entry(segment) for segment in segments)
+    audio_codec = CONTAINER_AUDIO.get(os.path.splitext(output_path)[1].lower(), "aac")
+    await run_ffmpeg([
+        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-i", input_path,
+        "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy", "-c:a", audio_codec, output_path
+    ], priority="batch")
+
+
+async def direct_encode(input_path: str, output_path: str, video_args, threads: int) -> int:
+    # The source encoded by a single ffmpeg, video and first audio stream like the chunked
+    # path. Returns the frames encoded
+    audio_codec = CONTAINER_AUDIO.get(os.path.splitext(output_path)[1].lower(), "aac")
+    _, _, stderr = await run_ffmpeg(
+        ["ffmpeg", *PROGRESS_ARGS, "-y", "-i", input_path, "-map", "0:v:0", "-map", "0:a:0?"]
+        + video_args(threads) + ["-c:a", audio_codec, output_path], priority="batch"
+    )
+    return encoded_frames(stderr) or 0
+
+
+async def chunked_encode(input_path: str, output_path: str, video_args, workers: int = CHUNK_WORKERS,
+                         segment_seconds: float = CHUNK_SECONDS, progress=None) -> dict:
+    # video_args(threads) gives the ffmpeg arguments encoding one segment (filters and encoder)
+    # with that many threads. progress(fraction) is called as segments are done
+    workers = max(1, workers)
+    threads = segment_threads(workers)
+    start = time.monotonic()
+    directory = tempfile.mkdtemp(prefix="chunks_", dir=os.path.dirname(output_path) or ".")
+    try:
+        segments = await split_at_keyframes(input_path, directory, segment_seconds)
+        if not segments:
+            raise ValueError(f"No video segments in {input_path}")
+        if len(segments) == 1:
+            # Keyframes too far apart to cut: chunking would only add the concat pass
+            threads = segment_threads(1)
+            with queue_when_busy():
+                frames = await direct_encode(input_path, output_path, video_args, threads)
+            if progress is not None:
+                progress(1.0)
+            return {
+                "segments": 1, "workers": 1, "threads_per_segment": threads, "segment_seconds": segment_seconds,
+                "fallback": "direct", **encode_stats(frames, time.monotonic() - start)
+            }
+
+        slots = asyncio.Semaphore(workers)
+        encoded = [os.path.join(directory, f"encoded_{i:05d}.mkv") for i in range(len(segments))]
+        done = 0
+        frames = 0
+
+        async def encode(segment: str, output: str):
+            nonlocal done, frames
+            async with slots:
+                _, _, stderr = await run_ffmpeg(["ffmpeg", *PROGRESS_ARGS, "-y", "-i", segment] + video_args(threads) + ["-an", output], priority="batch")
+            done += 1
+            frames += encoded_frames(stderr) or 0
+            if progress is not None:
+                progress(done / len(segments))
+
+        # Once the split was admitted, the segments and the join wait for the scheduler
+        # instead of being refused one by one (which would throw away the work done)
+        with queue_when_busy():
+            tasks = [asyncio.create_task(encode(segment, output)) for segment, output in zip(segments, encoded)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()  # One failed (or we are cancelled): the other encodes are killed
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            await concat_segments(encoded, input_path, output_path, os.path.join(directory, "segments.txt"))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    # Speed of the whole chunked encode, splitting and joining included
+    return {
+        "segments": len(segments), "workers": workers, "threads_per_segment": threads, "segment_seconds": segment_seconds,
+        **encode_stats(frames, time.monotonic() - start)
+    }
@@ -0,0 +1,109 @@
+import asyncio
+import mimetypes
+import os
+from email.utils import parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+
+# Delivery of the files of the shared volume. Finished files are served with byte ranges
+# (players can seek), ETag / Last-Modified and conditional GETs (304). Files that are still
+# being written, registered with begin_write / end_write, are streamed while they grow, so a
+# player can start on a fragmented MP4 before its encode finishes
+MEDIA_CHUNK_SIZE = int(os.environ.get("MEDIA_CHUNK_SIZE", 1 << 16))
+MEDIA_POLL_SECONDS = float(os.environ.get("MEDIA_POLL_SECONDS", 0.25))
+# Behind nginx, prefix of an internal location serving the shared volume: the response is only
+# a header and nginx sends the file itself with sendfile (zero-copy). Empty: Python sends it
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT", "")
+
+# Streaming formats are not in every mimetypes table
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("application/dash+xml", ".mpd")
+mimetypes.add_type("video/iso.segment", ".m4s")
+mimetypes.add_type("video/mp2t", ".ts")
+
+_writing = {}  # path -> event set when the writer is done
+
+
+def begin_write(path: str):
+    _writing[os.path.realpath(path)] = asyncio.Event()
+
+
+def end_write(path: str):
+    event = _writing.pop(os.path.realpath(path), None)
+    if event is not None:
+        event.set()
+
+
+def is_writing(path: str) -> bool:
+    return os.path.realpath(path) in _writing
+
+
+async def wait_for_file(path: str, writer: asyncio.Task) -> bool:
+    # Until the writer creates path (True) or ends without creating it (False)
+    while not os.path.exists(path):
+        if writer.done():
+            return os.path.exists(path)
+        await asyncio.sleep(MEDIA_POLL_SECONDS / 5)
+    return True
+
+
+async def tail_file(path: str, chunk_size: int = MEDIA_CHUNK_SIZE):
+    # Yields the file as it is written, until its writer is done and everything has been read
+    path = os.path.realpath(path)
+    with open(path, "rb") as f:
+        while True:
+            event = _writing.get(path)
+            chunk = await run_in_threadpool(f.read, chunk_size)
+            if chunk:
+                yield chunk
+            elif event is None:
+                return  # Done before this read, so nothing is left
+            else:
+                try:
+                    await asyncio.wait_for(event.wait(), MEDIA_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+
+def not_modified_since(if_modified_since: str, mtime: float) -> bool:
+    # HTTP dates have whole seconds: the file is unchanged if its mtime, in seconds, is not later
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False  # Invalid date: ignored, as RFC 9110 says
+    if since.tzinfo is None:
+        return False
+    return int(mtime) <= since.timestamp()
+
+
+def media_response(request: Request, path: str, root: str, filename: str = None) -> Response:
+    # path must already be validated to be inside root
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    disposition = {"Content-Disposition": f'attachment; filename="{filename}"'} if filename else {}
+
+    if is_writing(path):
+        # Length unknown yet: chunked, no ranges, not cacheable
+        return StreamingResponse(tail_file(path), media_type=media_type, headers={**disposition, "Cache-Control": "no-store"})
+
+    stat = os.stat(path)
+    response = FileResponse(path, stat_result=stat, media_type=media_type, filename=filename)
+    etag = response.headers["etag"]
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        not_modified = if_modified_since is not None and not_modified_since(if_modified_since, stat.st_mtime)
+    if not_modified:
+        return Response(status_code=304, headers={"ETag": etag, "Last-Modified": response.headers["last-modified"]})
+
+    if MEDIA_ACCEL_REDIRECT:
+        relative = os.path.relpath(path, root)
+        return Response(headers={
+            "X-Accel-Redirect": MEDIA_ACCEL_REDIRECT.rstrip("/") + "/" + relative,
+            "Content-Type": media_type, "ETag": etag, "Last-Modified": response.headers["last-modified"], **disposition
+        })
+    return response
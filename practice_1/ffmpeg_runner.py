@@ -0,0 +1,272 @@
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import re
+
+import ffmpeg
+
+
+# FFmpeg runs as asyncio subprocesses, so the event loop keeps serving other requests
+# (health checks, probes, color conversions) while encodes are running. Every ffmpeg and
+# ffprobe process goes through one scheduler: it starts once the CPU threads it uses fit in
+# FFMPEG_CPU_BUDGET and its kind is under its process limit. Waiting processes start by
+# priority class (interactive before normal before batch), then in arrival order. When
+# FFMPEG_MAX_WAITING processes already wait, new non-interactive ones are refused, unless
+# they run inside queue_when_busy() (background jobs, which have their own bounded queue)
+FFMPEG_CPU_BUDGET = int(os.environ.get("FFMPEG_CPU_BUDGET", os.cpu_count() or 1))
+FFMPEG_CONCURRENCY = int(os.environ.get("FFMPEG_CONCURRENCY", max(1, (os.cpu_count() or 2) // 2)))
+PROBE_CONCURRENCY = int(os.environ.get("PROBE_CONCURRENCY", 8))
+FFMPEG_MAX_WAITING = int(os.environ.get("FFMPEG_MAX_WAITING", 32))
+# CPU threads that the encoders of one ffmpeg process share
+FFMPEG_THREADS = int(os.environ.get("FFMPEG_THREADS", FFMPEG_CPU_BUDGET))
+
+PRIORITIES = ("interactive", "normal", "batch")
+
+# Threads given to one encoder, about as many as it keeps busy. Commands that do not say how
+# many threads they use count as DEFAULT_THREADS
+CODEC_THREADS = {"libx264": 4, "libx265": 4, "libvpx": 2, "libvpx-vp9": 4, "libaom-av1": 8}
+DEFAULT_THREADS = 2
+
+
+# Same error as ffmpeg-python's run(), so callers catch ffmpeg.Error for both
+class FFmpegError(ffmpeg.Error):
+    def __init__(self, cmd, returncode, stdout, stderr):
+        super().__init__(cmd, stdout, stderr)
+        self.returncode = returncode
+
+
+class SchedulerBusyError(Exception):
+    pass
+
+
+_queue_when_busy = contextvars.ContextVar("queue_when_busy", default=False)
+
+
+@contextlib.contextmanager
+def queue_when_busy():
+    # The processes started inside wait for the scheduler however busy it is
+    token = _queue_when_busy.set(True)
+    try:
+        yield
+    finally:
+        _queue_when_busy.reset(token)
+
+
+def codec_threads(encoder: str) -> int:
+    return min(CODEC_THREADS.get(encoder, DEFAULT_THREADS), FFMPEG_CPU_BUDGET)
+
+
+def thread_args(encoder: str, threads: int = None) -> list:
+    # Options limiting encoder to threads (its CODEC_THREADS by default). x265 ignores -threads
+    # and sizes its own thread pool. VP9 and AV1 only keep their threads busy with row based
+    # multithreading and one tile column per thread (given as log2, the encoders lower it to
+    # what the frame width allows)
+    threads = threads or codec_threads(encoder)
+    if encoder == "libx265":
+        return ["-x265-params", f"pools={threads}"]
+    if encoder in ("libvpx-vp9", "libaom-av1"):
+        return ["-threads", str(threads), "-row-mt", "1", "-tile-columns", str(min(6, threads.bit_length() - 1))]
+    return ["-threads", str(threads)]
+
+
+def command_threads(cmd: list) -> int:
+    # CPU threads cmd asks for: every -threads value and x265 pool, DEFAULT_THREADS if none
+    threads = [int(cmd[i + 1]) for i, arg in enumerate(cmd[:-1]) if arg == "-threads" and cmd[i + 1].isdigit()]
+    threads += [int(pools) for arg in cmd for pools in re.findall(r"pools=(\d+)", arg)]
+    return sum(threads) or DEFAULT_THREADS
+
+
+# Global options of the commands whose speed is reported: machine readable progress
+# (key=value lines) on stderr, whatever the log level, instead of the stats line
+PROGRESS_ARGS = ["-progress", "pipe:2", "-nostats"]
+
+
+def encoded_frames(stderr: bytes):
+    # Frames encoded, from the last frame= key of a command run with PROGRESS_ARGS (None if none)
+    frames = re.findall(rb"^frame=(\d+)\s*$", stderr or b"", re.MULTILINE)
+    return int(frames[-1]) if frames else None
+
+
+def encode_stats(frames: int, seconds: float) -> dict:
+    # The speed an encode achieved
+    return {"frames": frames, "seconds": round(seconds, 3), "fps": round(frames / seconds, 2) if frames and seconds > 0 else None}
+
+
+class Scheduler:
+    def __init__(self, cpu_budget: int = FFMPEG_CPU_BUDGET, max_waiting: int = FFMPEG_MAX_WAITING,
+                 limits: dict = None):
+        self.cpu_budget = cpu_budget
+        self.max_waiting = max_waiting
+        self.limits = limits or {"ffmpeg": FFMPEG_CONCURRENCY, "ffprobe": PROBE_CONCURRENCY}
+        self.cpu_used = 0
+        self.running = {kind: 0 for kind in self.limits}
+        self.waiters = []  # [priority rank, arrival, kind, threads, future], sorted
+        self.arrivals = itertools.count()
+        self.metrics = {"started": 0, "rejected": 0}
+
+    def _fits(self, kind: str, threads: int) -> bool:
+        return self.running[kind] < self.limits[kind] and self.cpu_used + threads <= self.cpu_budget
+
+    def _start(self, kind: str, threads: int):
+        self.running[kind] += 1
+        self.cpu_used += threads
+        self.metrics["started"] += 1
+
+    def _release(self, kind: str, threads: int):
+        self.running[kind] -= 1
+        self.cpu_used -= threads
+        self._wake()
+
+    def _wake(self):
+        # Starts the waiters that fit, in order. One that is short of CPU keeps the threads
+        # being freed for itself (nothing behind it starts), so a large batch encode is not
+        # starved by a stream of small ones; one only over its kind's process limit does not
+        for waiter in list(self.waiters):
+            _, _, kind, threads, future = waiter
+            if future.done():
+                self.waiters.remove(waiter)
+            elif self._fits(kind, threads):
+                self.waiters.remove(waiter)
+                self._start(kind, threads)
+                future.set_result(None)
+            elif self.cpu_used + threads > self.cpu_budget:
+                break
+
+    @contextlib.asynccontextmanager
+    async def slot(self, kind: str, threads: int, priority: str = "normal"):
+        # Holds threads of the CPU budget and a process of kind while the block runs
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority}, use one of {PRIORITIES}")
+        threads = max(1, min(threads, self.cpu_budget))
+        if priority != "interactive" and not _queue_when_busy.get() and len(self.waiters) >= self.max_waiting:
+            self.metrics["rejected"] += 1
+            raise SchedulerBusyError(f"FFmpeg is saturated ({len(self.waiters)} processes waiting), try again later")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append([PRIORITIES.index(priority), next(self.arrivals), kind, threads, future])
+        self.waiters.sort(key=lambda waiter: waiter[:2])
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(kind, threads)  # Started just as it was cancelled
+            else:
+                future.cancel()
+                self._wake()
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(kind, threads)
+
+    def status(self) -> dict:
+        waiting = lambda key, value: sum(1 for waiter in self.waiters if waiter[key] == value and not waiter[4].done())
+        return {
+            **{kind: {"limit": limit, "running": self.running[kind], "waiting": waiting(2, kind)} for kind, limit in self.limits.items()},
+            "cpu": {"budget": self.cpu_budget, "used": self.cpu_used},
+            "waiting_by_priority": {priority: waiting(0, rank) for rank, priority in enumerate(PRIORITIES)},
+            "max_waiting": self.max_waiting,
+            **self.metrics
+        }
+
+
+scheduler = Scheduler()
+
+
+async def _run(cmd: list, kind: str, check: bool = True, priority: str = "normal") -> tuple:
+    # Waits for the scheduler, runs cmd and returns (returncode, stdout, stderr). If the
+    # request is cancelled (client gone, shutdown) the process is killed, not left behind
+    threads = command_threads(cmd) if kind == "ffmpeg" else 1
+    async with scheduler.slot(kind, threads, priority):
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+
+    if check and process.returncode != 0:
+        raise FFmpegError(cmd[0], process.returncode, stdout, stderr)
+    return process.returncode, stdout, stderr
+
+
+async def stream_ffmpeg(cmd: list, source, chunk_size: int = 1 << 16, priority: str = "normal"):
+    # Runs cmd with source (async iterable of bytes, e.g. request.stream()) fed into its stdin
+    # and yields its stdout as it is produced, so reading the input, transcoding and sending
+    # the output overlap. Raises FFmpegError at the end if ffmpeg failed. If source fails
+    # (client gone) or the consumer stops iterating, the process is killed
+    async with scheduler.slot("ffmpeg", command_threads(cmd), priority):
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+
+        async def feed():
+            try:
+                async for chunk in source:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # ffmpeg stopped reading, its exit status says why
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                process.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        errors = asyncio.create_task(process.stderr.read())
+        try:
+            while chunk := await process.stdout.read(chunk_size):
+                yield chunk
+            await process.wait()
+            await feeder
+            stderr = await errors
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            feeder.cancel()
+            errors.cancel()
+
+    if process.returncode != 0:
+        raise FFmpegError(cmd[0], process.returncode, b"", stderr)
+
+
+async def run_ffmpeg(cmd, check: bool = True, priority: str = "normal") -> tuple:
+    # cmd is an argument list (["ffmpeg", "-i", ...]) or an ffmpeg-python stream. priority is
+    # "normal" (a request waits on it) or "batch" (long encodes, jobs). "interactive" is kept
+    # for probes: it is never refused and goes ahead of every encode
+    if not isinstance(cmd, (list, tuple)):
+        cmd = ffmpeg.compile(cmd, overwrite_output=True)
+    return await _run(list(cmd), "ffmpeg", check=check, priority=priority)
+
+
+async def probe(path: str, probesize: int = None, analyzeduration: int = None) -> dict:
+    # Same result as ffmpeg.probe(path). probesize (bytes) and analyzeduration (microseconds)
+    # limit how much of the file ffprobe reads
+    cmd = ["ffprobe", "-v", "error"]
+    if probesize is not None:
+        cmd += ["-probesize", str(probesize)]
+    if analyzeduration is not None:
+        cmd += ["-analyzeduration", str(analyzeduration)]
+    cmd += ["-show_format", "-show_streams", "-of", "json", path]
+    _, stdout, _ = await _run(cmd, "ffprobe", priority="interactive")
+    return json.loads(stdout)
+
+
+def split_threads(weights: list, budget: int = FFMPEG_THREADS) -> list:
+    # Threads for each encoder, proportional to how heavy it is, at least 1 each
+    total = sum(weights)
+    return [max(1, round(budget * weight / total)) for weight in weights]
+
+
+def runner_status() -> dict:
+    return scheduler.status()
@@ -1,16 +1,29 @@
-from fastapi import FastAPI, Body, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, Body, File, Form, UploadFile, HTTPException, Header
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from fastapi.staticfiles import StaticFiles
 from fastapi import Request
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from services import ColorTranslator
-import subprocess
+from services import ColorTranslator, PLANAR_FORMATS
+from ffmpeg_runner import (run_ffmpeg, stream_ffmpeg, runner_status, split_threads, codec_threads, thread_args,
+                           queue_when_busy, SchedulerBusyError, encoded_frames, encode_stats, PROGRESS_ARGS)
+from profiles import profile_args, profile_kwargs, ENCODING_PROFILES, DEFAULT_PROFILE
+from jobs import create_job_queue, QueueFullError
+from uploads import save_upload, resolve_shared_path, file_identity, UploadSizeLimit
+from cache import ResultCache
+from metadata import MetadataCache, summarize
+from delivery import media_response, begin_write, end_write, wait_for_file
+from chunked import chunked_encode, CHUNK_WORKERS, CHUNK_SECONDS
 import tempfile
 import os
 import uuid
+import time
 import ffmpeg
+import numpy as np
+import anyio
+import asyncio
 
 # Classes of Seminar 1:
 class RGB(BaseModel):
@@ -23,6 +36,10 @@ class YUV(BaseModel):
     U: int = Body(..., ge=0, le=255)
     V: int = Body(..., ge=0, le=255)
 
+# Batches of pixels as [[R, G, B], ...] or [[Y, U, V], ...], converted in one call
+class PixelBatch(BaseModel):
+    pixels: list[tuple[int, int, int]] = Body(..., min_length=1)
+
 # Classes of Seminar 2:
 class VideoResolution(BaseModel):
     video_filename: str = "big_buck_bunny.mp4"
@@ -33,6 +50,12 @@ class ChromaSubsampling(BaseModel):
     video_filename: str = "big_buck_bunny.mp4"
     pixel_format: str = Body(...)
 
+# Classes of Practice 2:
+class LadderRung(BaseModel):
+    width: int = Body(..., gt=0)
+    height: int = Body(..., gt=0)
+    bitrate: str = Body(..., pattern=r"^\d+[kM]?$")
+
 # Service wrapper functions
 def rgb_to_yuv_service(R: int, G: int, B: int):
     return ColorTranslator.rgb_to_yuv(R, G, B)
@@ -40,7 +63,20 @@ def rgb_to_yuv_service(R: int, G: int, B: int):
 def yuv_to_rgb_service(Y: int, U: int, V: int):
     return ColorTranslator.yuv_to_rgb(Y, U, V)
 
+def pixel_batch_to_frame(pixels: list) -> np.ndarray:
+    values = np.asarray(pixels, dtype=np.int64)
+    if values.min() < 0 or values.max() > 255:
+        raise HTTPException(status_code=400, detail="Pixel components must be in the range [0, 255].")
+    # A batch is converted as a frame of 1 row
+    return values.astype(np.uint8).reshape(1, -1, 3)
+
+def check_pix_fmt(pix_fmt: str):
+    if pix_fmt not in PLANAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid pixel format. Use one of: {list(PLANAR_FORMATS)}")
+
 app = FastAPI(title="FastAPI for Practice 1")
+# Too large uploads are refused before their body is read (see uploads.py)
+app.add_middleware(UploadSizeLimit)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="static")
@@ -50,13 +86,80 @@ SHARED_DIR = "/shared"
 if not os.path.exists(SHARED_DIR):
     os.makedirs(SHARED_DIR)
 
-# Mount shared directory to serve files
-app.mount("/files", StaticFiles(directory=SHARED_DIR), name="files")
+# Files of the shared directory are served by the /files/ endpoint below (ranges, ETags, and
+# files still being written streamed as they grow)
+
+# Outputs of the transcode endpoints are cached by source content and parameters, in the shared volume
+result_cache = ResultCache()
+# Probed metadata, by content hash or path
+metadata_cache = MetadataCache()
+
+def shared_url(path: str) -> str:
+    return "/files/" + os.path.relpath(path, SHARED_DIR)
+
+# Input of the processing endpoints: an upload, or shared_file, a file already in the shared
+# volume (e.g. the output_file of a previous endpoint), used in place with no upload at all
+async def receive_source(file: UploadFile, shared_file: str, directory: str = ".") -> dict:
+    # "key" identifies the content for the caches: the sha256 of an upload, computed while it
+    # is saved, or the path, size and modification time of a shared file
+    if (file is None) == (shared_file is None):
+        raise HTTPException(status_code=400, detail="Send either a file upload or a shared_file reference")
+    if shared_file is not None:
+        path = resolve_shared_path(shared_file, SHARED_DIR)
+        return {"path": path, "filename": os.path.basename(path), "sha256": None, "key": file_identity(path), "owned": False}
+
+    input_path = os.path.join(directory, f"input_{uuid.uuid4()}{os.path.splitext(file.filename)[1]}")
+    saved = await save_upload(file, input_path, hash_algorithm="sha256")
+    return {"path": input_path, "filename": file.filename, "sha256": saved["sha256"], "key": saved["sha256"], "owned": True}
+
+def release_source(source: dict):
+    # Removes the saved upload, shared files are left alone
+    if source["owned"] and os.path.exists(source["path"]):
+        os.remove(source["path"])
+
+# FFmpeg refused new work because too many processes already wait (see ffmpeg_runner.py)
+@app.exception_handler(SchedulerBusyError)
+async def scheduler_busy(request: Request, exc: SchedulerBusyError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "10"})
 
 @app.get("/", include_in_schema=False)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+# FFmpeg runs in subprocesses outside the event loop, this stays responsive during encodes
+@app.get("/health/")
+async def health():
+    return {"status": "ok", "ffmpeg": runner_status(), "jobs": job_queue.stats(), "cache": result_cache.stats(), "metadata": metadata_cache.stats()}
+
+@app.get("/cache/")
+async def cache_stats():
+    return result_cache.stats()
+
+@app.api_route("/files/{file_path:path}", methods=["GET", "HEAD"])
+async def shared_file_download(request: Request, file_path: str):
+    return media_response(request, resolve_shared_path(file_path, SHARED_DIR), SHARED_DIR)
+
+# Tasks that keep running after their request answered (e.g. an encode being streamed)
+background_tasks = set()
+
+def run_in_background(coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Speed/quality tradeoff of the encodes (see profiles.py)
+def check_profile(profile: str):
+    if profile not in ENCODING_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Invalid profile. Use one of: {list(ENCODING_PROFILES)}")
+
+# Options of the endpoints that can encode in chunks (see chunked.py)
+def check_chunking(chunk_workers: int, chunk_seconds: float):
+    if chunk_workers < 1:
+        raise HTTPException(status_code=400, detail="chunk_workers must be at least 1.")
+    if chunk_seconds <= 0:
+        raise HTTPException(status_code=400, detail="chunk_seconds must be positive.")
+
 # Exercise 2 of Seminar 1 Endpoint
 @app.post("/convert/rgb_to_yuv/")
 def convert_rgb_to_yuv(rgb: RGB):
@@ -66,9 +169,87 @@ def convert_rgb_to_yuv(rgb: RGB):
 def convert_yuv_to_rgb(yuv: YUV):
     return yuv_to_rgb_service(yuv.Y, yuv.U, yuv.V)
 
+# Batch versions of the previous endpoints: the whole list is converted in one vectorized call
+# method selects the conversion engine: "float", "fixed" (bit-exact with the single pixel endpoints) or "lut"
+@app.post("/convert/rgb_to_yuv/batch/")
+def convert_rgb_to_yuv_batch(batch: PixelBatch, method: str = "float", standard: str = "bt601", full_range: bool = False):
+    frame = pixel_batch_to_frame(batch.pixels)
+    try:
+        yuv = ColorTranslator.rgb_to_yuv_frame(frame, method=method, standard=standard, full_range=full_range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"count": len(batch.pixels), "pixels": yuv.reshape(-1, 3).tolist()}
+
+@app.post("/convert/yuv_to_rgb/batch/")
+def convert_yuv_to_rgb_batch(batch: PixelBatch, method: str = "float", standard: str = "bt601", full_range: bool = False):
+    frame = pixel_batch_to_frame(batch.pixels)
+    try:
+        rgb = ColorTranslator.yuv_to_rgb_frame(frame, method=method, standard=standard, full_range=full_range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"count": len(batch.pixels), "pixels": rgb.reshape(-1, 3).tolist()}
+
+# Raw frames: packed RGB24 in, planar YUV out (and back), size given in the X-Width / X-Height headers
+@app.post("/convert/rgb_to_yuv/raw/")
+async def convert_rgb_to_yuv_raw(
+    request: Request,
+    x_width: int = Header(..., gt=0),
+    x_height: int = Header(..., gt=0),
+    x_pix_fmt: str = Header("yuv444p"),
+    method: str = "float",
+    standard: str = "bt601",
+    full_range: bool = False
+):
+    check_pix_fmt(x_pix_fmt)
+    body = await request.body()
+    if len(body) != x_width * x_height * 3:
+        raise HTTPException(status_code=400, detail=f"Expected {x_width * x_height * 3} bytes of RGB24 for {x_width}x{x_height}, got {len(body)}")
+
+    frame = np.frombuffer(body, dtype=np.uint8).reshape(x_height, x_width, 3)
+    try:
+        planar = await run_in_threadpool(
+            ColorTranslator.rgb_to_yuv_planar, frame,
+            pix_fmt=x_pix_fmt, method=method, standard=standard, full_range=full_range
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(
+        content=planar.tobytes(),
+        media_type="application/octet-stream",
+        headers={"X-Width": str(x_width), "X-Height": str(x_height), "X-Pix-Fmt": x_pix_fmt}
+    )
+
+@app.post("/convert/yuv_to_rgb/raw/")
+async def convert_yuv_to_rgb_raw(
+    request: Request,
+    x_width: int = Header(..., gt=0),
+    x_height: int = Header(..., gt=0),
+    x_pix_fmt: str = Header("yuv444p"),
+    method: str = "float",
+    standard: str = "bt601",
+    full_range: bool = False
+):
+    check_pix_fmt(x_pix_fmt)
+    body = await request.body()
+
+    try:
+        rgb = await run_in_threadpool(
+            ColorTranslator.yuv_planar_to_rgb, body, x_width, x_height,
+            pix_fmt=x_pix_fmt, method=method, standard=standard, full_range=full_range
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(
+        content=rgb.tobytes(),
+        media_type="application/octet-stream",
+        headers={"X-Width": str(x_width), "X-Height": str(x_height), "X-Pix-Fmt": "rgb24"}
+    )
+
 # Exercise 3 of Seminar 1 Endpoint - Using ffmpeg-python library
 @app.post("/image/resize/")
-async def resize_image(width: int, height: int, file: UploadFile = File(...)):
+async def resize_image(width: int, height: int, file: UploadFile = File(None), shared_file: str = None):
     """Resize an image using ffmpeg-python library"""
     if width <= 0 or height <= 0:
         raise HTTPException(status_code=400, detail="Width and height must be positive.")
@@ -76,32 +257,28 @@ async def resize_image(width: int, height: int, file: UploadFile = File(...)):
     try:
         # Generate unique filenames
         file_id = str(uuid.uuid4())
-        input_filename = f"input_{file_id}{os.path.splitext(file.filename)[1]}"
         output_filename = f"resized_{file_id}.jpg"
         
         # Paths in shared volume (accessible by ffmpeg_tool container too)
         shared_dir = "/shared"
-        input_path = os.path.join(shared_dir, input_filename)
         output_path = os.path.join(shared_dir, output_filename)
         
         # Save uploaded file to shared volume
-        with open(input_path, "wb") as f:
-            f.write(await file.read())
+        source = await receive_source(file, shared_file, shared_dir)
+        input_path = source["path"]
         
         # Use ffmpeg-python to resize the image
         # This will be processed and stored in the shared volume
-        (
+        await run_ffmpeg(
             ffmpeg
             .input(input_path)
             .filter('scale', width, height)
             .output(output_path, y=None)  # y=None means overwrite without asking
             .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
         )
         
         # Clean up input file
-        if os.path.exists(input_path):
-            os.remove(input_path)
+        release_source(source)
         
         download_url = f"/files/{output_filename}" 
 
@@ -116,6 +293,9 @@ async def resize_image(width: int, height: int, file: UploadFile = File(...)):
     except ffmpeg.Error as e:
         error_message = e.stderr.decode() if e.stderr else str(e)
         raise HTTPException(status_code=500, detail=f"FFmpeg error: {error_message}")
+
+    except HTTPException:
+        raise
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -124,111 +304,182 @@ async def resize_image(width: int, height: int, file: UploadFile = File(...)):
 # Exercise 1 of Seminar 2 Endpoint - Change video resolution
 
 @app.post("/video/resize/")
-async def resize_video(width: int,height: int,file: UploadFile = File(...)
+async def resize_video(width: int,height: int,file: UploadFile = File(None), shared_file: str = None,
+                       chunked: bool = False, chunk_workers: int = CHUNK_WORKERS, chunk_seconds: float = CHUNK_SECONDS,
+                       profile: str = DEFAULT_PROFILE
 ):
-    file_id = str(uuid.uuid4())
-    input_ext = os.path.splitext(file.filename)[1]
-    input_path = f"input_{file_id}{input_ext}"
-    output_filename = f"resized_{width}x{height}_{file_id}.mp4"
-    output_path = os.path.join("/shared", output_filename)
-
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
-
-    (
-        ffmpeg
-        .input(input_path)
-        .filter("scale", width, height)
-        .output(output_path, vcodec="libx264", acodec="aac")
-        .overwrite_output()
-        .run(capture_stdout=True, capture_stderr=True)
-    )
+    check_chunking(chunk_workers, chunk_seconds)
+    check_profile(profile)
+    source = await receive_source(file, shared_file)
+    input_path = source["path"]
+
+    async def produce(output_dir: str) -> dict:
+        output_path = os.path.join(output_dir, f"resized_{width}x{height}.mp4")
+        result = {}
+        if chunked:
+            chunking = await chunked_encode(
+                input_path, output_path,
+                lambda threads: ["-vf", f"scale={width}:{height}", "-c:v", "libx264", "-threads", str(threads)] + profile_args("libx264", profile),
+                workers=chunk_workers, segment_seconds=chunk_seconds
+            )
+            result["chunked"] = chunking
+            result["encode"] = {key: chunking[key] for key in ("frames", "seconds", "fps")}
+        else:
+            start = time.monotonic()
+            _, _, stderr = await run_ffmpeg(
+                ffmpeg
+                .input(input_path)
+                .filter("scale", width, height)
+                .output(output_path, vcodec="libx264", acodec="aac", threads=codec_threads("libx264"),
+                        **profile_kwargs("libx264", profile))
+                .global_args(*PROGRESS_ARGS)
+                .overwrite_output()
+            )
+            result["encode"] = encode_stats(encoded_frames(stderr), time.monotonic() - start)
 
-    os.remove(input_path)
-
-    download_url = f"/files/{output_filename}"
+        return {
+            "message": "Video resized successfully",
+            "output_file": os.path.relpath(output_path, SHARED_DIR),
+            "dimensions": {
+                "width": width,
+                "height": height
+            },
+            "saved_in": shared_url(output_path),
+            "profile": profile,
+            **result
+        }
 
-    return {
-        "message": "Video resized successfully",
-        "output_file": output_filename,
-        "dimensions": {
-            "width": width,
-            "height": height
-        },
-        "saved_in": download_url
-    }
+    params = {"width": width, "height": height, "vcodec": "libx264", "acodec": "aac", "profile": profile}
+    if chunked:
+        params["chunked"] = {"workers": chunk_workers, "segment_seconds": chunk_seconds}
+    return await result_cache.get_or_create(source["key"], "resize", params, produce, release=lambda: release_source(source))
 
 # Exercise 2 of Seminar 2 Endpoint - Change chroma subsampling
 
-@app.post("/video/chroma_subsampling/")
-async def chroma_subsampling(pixel_format: str,file: UploadFile = File(...)
-):
-    pixel_format = pixel_format.lower()
-    valid_formats = ["yuv420p", "yuv422p", "yuv444p"]
+CHROMA_PIXEL_FORMATS = ["yuv420p", "yuv422p", "yuv444p"]
 
-    if pixel_format not in valid_formats:
+def check_chroma_format(pixel_format: str) -> str:
+    pixel_format = pixel_format.lower()
+    if pixel_format not in CHROMA_PIXEL_FORMATS:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid pixel format. Use one of: {valid_formats}"
+            detail=f"Invalid pixel format. Use one of: {CHROMA_PIXEL_FORMATS}"
         )
+    return pixel_format
 
-    file_id = str(uuid.uuid4())
-    input_ext = os.path.splitext(file.filename)[1]
-    input_path = f"input_{file_id}{input_ext}"
-    output_filename = f"chroma_{pixel_format}_{file_id}.mp4"
-    output_path = os.path.join("/shared", output_filename)
+@app.post("/video/chroma_subsampling/")
+async def chroma_subsampling(pixel_format: str,file: UploadFile = File(None), shared_file: str = None
+):
+    pixel_format = check_chroma_format(pixel_format)
 
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
-
-    (
-        ffmpeg
-        .input(input_path)
-        .output(
-            output_path,
-            vcodec="libx264",
-            acodec="aac",
-            pix_fmt=pixel_format
+    source = await receive_source(file, shared_file)
+    input_path = source["path"]
+
+    async def produce(output_dir: str) -> dict:
+        output_path = os.path.join(output_dir, f"chroma_{pixel_format}.mp4")
+        await run_ffmpeg(
+            ffmpeg
+            .input(input_path)
+            .output(
+                output_path,
+                vcodec="libx264",
+                acodec="aac",
+                pix_fmt=pixel_format,
+                threads=codec_threads("libx264")
+            )
+            .overwrite_output()
         )
-        .overwrite_output()
-        .run(capture_stdout=True, capture_stderr=True)
-    )
 
-    os.remove(input_path)
+        return {
+            "message": "Chroma subsampling modified successfully",
+            "output_file": os.path.relpath(output_path, SHARED_DIR),
+            "new_pixel_format": pixel_format,
+            "saved_in": shared_url(output_path)
+        }
 
-    download_url = f"/files/{output_filename}"
+    params = {"pix_fmt": pixel_format, "vcodec": "libx264", "acodec": "aac"}
+    return await result_cache.get_or_create(source["key"], "chroma_subsampling", params, produce, release=lambda: release_source(source))
 
-    return {
-        "message": "Chroma subsampling modified successfully",
-        "output_file": output_filename,
-        "new_pixel_format": pixel_format,
-        "saved_in": download_url
-    }
+
+# Pipe mode of the 2 previous endpoints: the request body is the raw video and goes straight
+# into ffmpeg's stdin while it is still being uploaded, so upload, transcode and download
+# overlap. The input has to be readable sequentially (MPEG-TS, Matroska/WebM, or MP4 with the
+# moov atom first). destination=response streams the result back as fragmented MP4,
+# destination=shared writes it to the shared volume like the endpoints above
+
+PIPE_DESTINATIONS = ("response", "shared")
+
+# The request body is read by ffmpeg's feeder while the response streams, so the response must
+# not also read the request messages to watch for a disconnect (a gone client ends the body
+# stream and the send anyway)
+class PipeStreamingResponse(StreamingResponse):
+    async def listen_for_disconnect(self, receive):
+        await anyio.sleep_forever()
+
+async def pipe_transcode(request: Request, output_args: list, output_filename: str, destination: str):
+    if destination not in PIPE_DESTINATIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid destination. Use one of: {list(PIPE_DESTINATIONS)}")
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0"] + output_args
+
+    try:
+        if destination == "shared":
+            output_path = os.path.join(SHARED_DIR, output_filename)
+            async for _ in stream_ffmpeg(cmd + ["-y", output_path], request.stream()):
+                pass
+            return {"message": "Video transcoded successfully", "output_file": output_filename, "saved_in": f"/files/{output_filename}"}
+
+        stream = stream_ffmpeg(cmd + ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov", "pipe:1"], request.stream())
+        # The first chunk is awaited here, so an input ffmpeg cannot read still gets an error status
+        first_chunk = await anext(stream, b"")
+    except ffmpeg.Error as e:
+        error_message = e.stderr.decode() if e.stderr else str(e)
+        raise HTTPException(status_code=500, detail=f"FFmpeg error: {error_message}")
+
+    async def body():
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+
+    return PipeStreamingResponse(
+        body(),
+        media_type="video/mp4",
+        headers={"Content-Disposition": f'attachment; filename="{output_filename}"'}
+    )
+
+@app.post("/video/resize/pipe/")
+async def resize_video_pipe(request: Request, width: int, height: int, destination: str = "response"):
+    if width <= 0 or height <= 0:
+        raise HTTPException(status_code=400, detail="Width and height must be positive.")
+    output_filename = f"resized_{width}x{height}_{uuid.uuid4()}.mp4"
+    return await pipe_transcode(request, ["-vf", f"scale={width}:{height}", "-c:v", "libx264", "-c:a", "aac"], output_filename, destination)
+
+@app.post("/video/chroma_subsampling/pipe/")
+async def chroma_subsampling_pipe(request: Request, pixel_format: str, destination: str = "response"):
+    pixel_format = check_chroma_format(pixel_format)
+    output_filename = f"chroma_{pixel_format}_{uuid.uuid4()}.mp4"
+    return await pipe_transcode(request, ["-c:v", "libx264", "-c:a", "aac", "-pix_fmt", pixel_format], output_filename, destination)
 
     
 # Exercise 3 of Seminar 2 Endpoint - Visualize coding info
 @app.post("/video/info/")
-async def video_info(file: UploadFile = File(...)):
-    file_id = str(uuid.uuid4())
-    input_path = f"input_{file_id}{os.path.splitext(file.filename)[1]}"
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+async def video_info(file: UploadFile = File(None), shared_file: str = None):
+    source = await receive_source(file, shared_file)
 
-    # Read the video info using ffmpeg
-    probe = ffmpeg.probe(input_path)
-    format_info = probe['format']
-    streams_info = probe['streams']
+    # Read the video info using ffmpeg (once per content, then from the metadata cache)
+    try:
+        metadata = await metadata_cache.get(source["path"], content_hash=source["sha256"])
+    finally:
+        release_source(source)
 
     video_info = {
-        "filename": file.filename,
-        "format_name": format_info["format_name"],
-        "duration_sec": float(format_info["duration"]),
-        "size_bytes": int(format_info["size"]),
-        "width": int(streams_info[0]["width"]),
-        "height": int(streams_info[0]["height"]),
-
+        "filename": source["filename"],
+        "format_name": metadata["format_name"],
+        "duration_sec": metadata["duration_sec"],
+        "size_bytes": metadata["size_bytes"],
+        "width": metadata["width"],
+        "height": metadata["height"],
+        "content_hash": source["sha256"]
     }
-    os.remove(input_path)
 
     return {"video_info": video_info}
 
@@ -236,16 +487,14 @@ async def video_info(file: UploadFile = File(...)):
 # Exercise 4 of Seminar 2 Endpoint - Create multitrack video
   
 @app.post("/video/multitrack/")
-async def create_multitrack_video(file: UploadFile = File(...)):
+async def create_multitrack_video(file: UploadFile = File(None), shared_file: str = None):
 
     file_id = str(uuid.uuid4())
-    input_ext = os.path.splitext(file.filename)[1]
-    input_path = f"input_{file_id}{input_ext}"
     output_filename = f"multitrack_{file_id}.mp4"
     output_path = os.path.join("/shared", output_filename)
 
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+    source = await receive_source(file, shared_file)
+    input_path = source["path"]
 
     cmd = [
         'ffmpeg',
@@ -255,7 +504,7 @@ async def create_multitrack_video(file: UploadFile = File(...)):
         '-map', '0:a:0',
         '-map', '0:a:0',
         '-map', '0:a:0',
-        '-c:v', 'libx264',
+        '-c:v', 'libx264', *thread_args('libx264'),
 
         # Audio track 0: AAC mono
         '-c:a:0', 'aac',
@@ -275,9 +524,10 @@ async def create_multitrack_video(file: UploadFile = File(...)):
         output_path
     ]
 
-    subprocess.run(cmd, capture_output=True, text=True, check=True)
-
-    os.remove(input_path)
+    try:
+        await run_ffmpeg(cmd)
+    finally:
+        release_source(source)
 
     download_url = f"/files/{output_filename}"
 
@@ -296,80 +546,85 @@ async def create_multitrack_video(file: UploadFile = File(...)):
 
 # Exercise 5 of Seminar 2 Endpoint - Video streams info
 @app.post("/video/streams/")
-async def video_streams(file: UploadFile = File(...)):
-    file_id = str(uuid.uuid4())
-    input_path = f"input_{file_id}{os.path.splitext(file.filename)[1]}"
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+async def video_streams(file: UploadFile = File(None), shared_file: str = None):
+    source = await receive_source(file, shared_file)
+
+    # Read the video streams using ffmpeg (once per content, then from the metadata cache)
+    try:
+        metadata = await metadata_cache.get(source["path"], content_hash=source["sha256"])
+    finally:
+        release_source(source)
 
-    # Read the video streams using ffmpeg
-    probe = ffmpeg.probe(input_path)
-    streams = probe.get('streams', [])
-    num_streams = len(streams)
+    return {"num_streams": metadata["num_streams"], "streams": metadata["streams"], "content_hash": source["sha256"]}
 
-    os.remove(input_path)
 
-    return {"num_streams": num_streams}
+# Metadata of a video already probed by the 2 endpoints above, by the content_hash they return,
+# without uploading it again. stream selects every ffprobe field of one stream by its index,
+# full gives the whole ffprobe output instead of the summary
+@app.get("/metadata/{content_hash}")
+async def cached_metadata(content_hash: str, stream: int = None, full: bool = False):
+    info = metadata_cache.get_cached_info(f"sha256:{content_hash}")
+    if info is None:
+        raise HTTPException(status_code=404, detail="Unknown content, upload it to /video/info/ or /video/streams/ first")
+    if stream is None:
+        return info if full else summarize(info)
+    for detail in info.get("streams", []):
+        if detail.get("index") == stream:
+            return detail
+    raise HTTPException(status_code=404, detail=f"The video has no stream {stream}")
 
 
 # Exercise 6 of Seminar 2 Endpoint - Video Macroblocks and Motion Vectors Visualization
 
 @app.post("/video/visualize_coding/")
-async def visualize_coding_info(file: UploadFile = File(...)):
+async def visualize_coding_info(file: UploadFile = File(None), shared_file: str = None):
 
-    file_id = str(uuid.uuid4())
-    input_ext = os.path.splitext(file.filename)[1]
-    input_path = f"input_{file_id}{input_ext}"
-    output_filename = f"codecview_{file_id}.mp4"
-    output_path = os.path.join("/shared", output_filename)
-
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+    source = await receive_source(file, shared_file)
+    input_path = source["path"]
 
     # codecview filter
     codecview_filter = "codecview=mv=pf+bf+bb:block=1"
 
-    (
-        ffmpeg
-        .input(input_path, flags2="export_mvs")
-        .output(
-            output_path,
-            vcodec="libx264",
-            vf=codecview_filter,
-            acodec="aac"
+    async def produce(output_dir: str) -> dict:
+        output_path = os.path.join(output_dir, "codecview.mp4")
+        await run_ffmpeg(
+            ffmpeg
+            .input(input_path, flags2="export_mvs")
+            .output(
+                output_path,
+                vcodec="libx264",
+                vf=codecview_filter,
+                acodec="aac",
+                threads=codec_threads("libx264")
+            )
+            .overwrite_output()
         )
-        .overwrite_output()
-        .run(capture_stdout=True, capture_stderr=True)
-    )
 
-    os.remove(input_path)
+        return {
+            "message": "Video with coding info generated successfully",
+            "output_file": os.path.relpath(output_path, SHARED_DIR),
+            "filter_applied": codecview_filter,
+            "saved_in": shared_url(output_path)
+        }
 
-    download_url = f"/files/{output_filename}"
-
-    return {
-        "message": "Video with coding info generated successfully",
-        "output_file": output_filename,
-        "filter_applied": codecview_filter,
-        "saved_in": download_url
-    }
+    params = {"vf": codecview_filter, "vcodec": "libx264", "acodec": "aac"}
+    return await result_cache.get_or_create(source["key"], "visualize_coding", params, produce, release=lambda: release_source(source))
 
 
 # Exercise 7 of Seminar 2 Endpoint - Video YUV Histogram Visualization
 
 @app.post("/video/yuv-histogram/")
-async def video_yuv_histogram(file: UploadFile = File(...)):
+async def video_yuv_histogram(request: Request, file: UploadFile = File(None), shared_file: str = None):
 
     file_id = str(uuid.uuid4())
-    input_filename = f"input_{file_id}{os.path.splitext(file.filename)[1]}"
     output_filename = f"yuv_hist_{file_id}.mp4"
 
     shared_dir = "/shared"
-    input_path = os.path.join(shared_dir, input_filename)
     output_path = os.path.join(shared_dir, output_filename)
 
     # Save video
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+    source = await receive_source(file, shared_file, shared_dir)
+    input_path = source["path"]
 
     # Direct FFmpeg command (simple and safe)
     cmd = [
@@ -381,164 +636,363 @@ async def video_yuv_histogram(file: UploadFile = File(...)):
         "[u]histogram[uh];"
         "[v]histogram[vh];"
         "[yh][uh][vh]vstack=3",
+        *thread_args("libx264"),
+        # Fragmented, so the start of the file plays while the rest is encoded
+        "-movflags", "frag_keyframe+empty_moov",
         output_path
     ]
 
-    subprocess.run(cmd)
+    # The video is streamed as ffmpeg writes it instead of after the whole encode
+    async def encode():
+        try:
+            await run_ffmpeg(cmd, check=False)
+        finally:
+            end_write(output_path)
+            release_source(source)
 
-    os.remove(input_path)
+    begin_write(output_path)
+    encoder = run_in_background(encode())
+    if not await wait_for_file(output_path, encoder):
+        if not encoder.cancelled() and isinstance(encoder.exception(), SchedulerBusyError):
+            raise encoder.exception()  # Refused by the scheduler: 503
+        raise HTTPException(status_code=500, detail="FFmpeg did not produce the histogram video")
 
-    return FileResponse(output_path, media_type="video/mp4", filename=output_filename)
+    return media_response(request, output_path, SHARED_DIR, filename=output_filename)
 
 
 # Exercise 1 of Practice 2 Endpoint - Convert input video to 4 formats
 
-@app.post("/video/convert_video_4_formats/")
-async def convert_codecs(file: UploadFile = File(...)):
-
-    uid = str(uuid.uuid4())
-    ext = os.path.splitext(file.filename)[1]
-    input_path = f"input_{uid}{ext}"
-
-    # Save uploaded file
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
-
+# Output of each codec: (name, encoder, extension, weight). The weight is how heavy the
+# encoder is, the CPU threads of the conversion are shared in proportion
+CODEC_OUTPUTS = [
+    ("vp8", "libvpx", "webm", 1),
+    ("vp9", "libvpx-vp9", "webm", 2),
+    ("h265", "libx265", "mp4", 2),
+    ("av1", "libaom-av1", "mkv", 3),
+]
+
+def codec_output_args(encoder: str, threads: int = None, profile: str = DEFAULT_PROFILE) -> list:
+    return ["-c:v", encoder] + thread_args(encoder, threads) + profile_args(encoder, profile)
+
+# The work of the endpoint, also run as a background job by /jobs/convert_video_4_formats/
+# With fanout the input is decoded once by a single ffmpeg feeding the four encoders, which
+# run side by side, so it takes about as long as the slowest encode. Otherwise one ffmpeg
+# per codec runs after the other. With chunked, each codec is encoded in segments by
+# chunk_workers ffmpeg processes at once, the codecs one after the other. "encode" has the
+# fps each codec achieved (with fanout they all run at the pace of the slowest)
+async def convert_codecs_work(input_path: str, uid: str, progress=None, fanout: bool = True, chunked: bool = False,
+                              chunk_workers: int = CHUNK_WORKERS, chunk_seconds: float = CHUNK_SECONDS,
+                              profile: str = DEFAULT_PROFILE) -> dict:
     # Output paths
-    vp8_output = f"/shared/vp8_{uid}.webm"
-    vp9_output = f"/shared/vp9_{uid}.webm"
-    h265_output = f"/shared/h265_{uid}.mp4"
-    av1_output = f"/shared/av1_{uid}.mkv"
-
-    # ffmpeg commands for each format
-    # VP8
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", input_path, "-c:v", "libvpx", vp8_output],
-        check=True
-    )
-
-    # VP9
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", input_path, "-c:v", "libvpx-vp9", vp9_output],
-        check=True
-    )
-
-    # H.265
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", input_path, "-c:v", "libx265", h265_output],
-        check=True
-    )
-
-    # AV1
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", input_path, "-c:v", "libaom-av1", av1_output],
-        check=True
-    )
-
-    os.remove(input_path)
+    outputs = {name: f"/shared/{name}_{uid}.{ext}" for name, _, ext, _ in CODEC_OUTPUTS}
+    threads = split_threads([weight for *_, weight in CODEC_OUTPUTS])
+    stats = {}
+
+    if chunked:
+        for i, (name, encoder, _, _) in enumerate(CODEC_OUTPUTS):
+            def codec_progress(fraction, i=i):
+                if progress is not None:
+                    progress((i + fraction) / len(CODEC_OUTPUTS))
+            chunking = await chunked_encode(
+                input_path, outputs[name], lambda count, encoder=encoder: codec_output_args(encoder, count, profile),
+                workers=chunk_workers, segment_seconds=chunk_seconds, progress=codec_progress
+            )
+            stats[name] = {key: chunking[key] for key in ("frames", "seconds", "fps")}
+    elif fanout:
+        cmd = ["ffmpeg", *PROGRESS_ARGS, "-y", "-i", input_path]
+        for (name, encoder, _, _), count in zip(CODEC_OUTPUTS, threads):
+            cmd += codec_output_args(encoder, count, profile) + [outputs[name]]
+        start = time.monotonic()
+        _, _, stderr = await run_ffmpeg(cmd, priority="batch")
+        stats = dict.fromkeys(outputs, encode_stats(encoded_frames(stderr), time.monotonic() - start))
+    else:
+        for i, (name, encoder, _, _) in enumerate(CODEC_OUTPUTS):
+            start = time.monotonic()
+            _, _, stderr = await run_ffmpeg(["ffmpeg", *PROGRESS_ARGS, "-y", "-i", input_path] + codec_output_args(encoder, profile=profile) + [outputs[name]], priority="batch")
+            stats[name] = encode_stats(encoded_frames(stderr), time.monotonic() - start)
+            if progress is not None:
+                progress((i + 1) / len(CODEC_OUTPUTS))
 
     return {
         "message": "Video converted to all codecs successfully",
-        "vp8": vp8_output,
-        "vp9": vp9_output,
-        "h265": h265_output,
-        "av1": av1_output
+        **outputs,
+        "profile": profile,
+        "encode": stats
     }
 
+@app.post("/video/convert_video_4_formats/")
+async def convert_codecs(file: UploadFile = File(None), shared_file: str = None, fanout: bool = True,
+                         chunked: bool = False, chunk_workers: int = CHUNK_WORKERS, chunk_seconds: float = CHUNK_SECONDS,
+                         profile: str = DEFAULT_PROFILE):
 
-# Exercise 2 of Practice 2 Endpoint - Encoding ladder
-
-# Reused 2 endpoints as an interal functions
-def resize_video(input_path: str, width: int, height: int) -> str:
-    uid = str(uuid.uuid4())
-    output_path = f"/shared/ladder_{width}x{height}_{uid}.mp4"
-
-    subprocess.run(
-        [
-            "ffmpeg", "-y",
-            "-i", input_path,
-            "-vf", f"scale={width}:{height}",
-            "-c:v", "libx264",
-            output_path
-        ],
-        check=True
-    )
-
-    return output_path
-
-
-# Reused function converted to only H.265
-
-def convert_to_h265(input_path: str, bitrate: str) -> str:
+    check_chunking(chunk_workers, chunk_seconds)
+    check_profile(profile)
     uid = str(uuid.uuid4())
-    output_path = f"/shared/ladder_{bitrate}_{uid}.mp4"
-
-    subprocess.run(
-        [
-            "ffmpeg", "-y",
-            "-i", input_path,
-            "-c:v", "libx265",
-            "-b:v", bitrate,
-            output_path
-        ],
-        check=True
-    )
-
-    return output_path
 
+    # Save uploaded file
+    source = await receive_source(file, shared_file)
 
-# Endpoint that creates an encoding ladder calling the previous 2 functions
+    try:
+        return await convert_codecs_work(source["path"], uid, fanout=fanout, chunked=chunked,
+                                         chunk_workers=chunk_workers, chunk_seconds=chunk_seconds, profile=profile)
+    finally:
+        release_source(source)
 
-@app.post("/video/encoding_ladder/")
-async def encoding_ladder(file: UploadFile = File(...)):
 
-    uid = str(uuid.uuid4())
-    ext = os.path.splitext(file.filename)[1]
-    input_path = f"input_{uid}{ext}"
+# Exercise 2 of Practice 2 Endpoint - Encoding ladder
 
-    # Save uploaded file
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
-
-    # Our ladder will do 3 configurations: 1920x1080@4000k, 1280x720@2500k, 854x480@1000k
-    ladder_config = [
-        {"width": 1920, "height": 1080, "bitrate": "4000k"},
-        {"width": 1280, "height": 720,  "bitrate": "2500k"},
-        {"width": 854,  "height": 480,  "bitrate": "1000k"},
+# Our default ladder does 3 configurations: 1920x1080@4000k, 1280x720@2500k, 854x480@1000k
+LADDER_CONFIG = [
+    {"width": 1920, "height": 1080, "bitrate": "4000k"},
+    {"width": 1280, "height": 720,  "bitrate": "2500k"},
+    {"width": 854,  "height": 480,  "bitrate": "1000k"},
+]
+
+def parse_ladder(ladder: str) -> list:
+    # JSON list of rungs like LADDER_CONFIG, the default ladder if empty
+    if not ladder:
+        return LADDER_CONFIG
+    try:
+        rungs = TypeAdapter(list[LadderRung]).validate_json(ladder)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ladder: {e.errors(include_url=False)}")
+    if not rungs:
+        raise HTTPException(status_code=400, detail="The ladder needs at least one rung")
+    return [rung.model_dump() for rung in rungs]
+
+# packaging "mp4" gives one standalone file per rung. "hls" and "dash" give segmented renditions
+# with keyframes forced at the same times in every rung (so players can switch between them at
+# any segment) and their manifests; "dash" also writes HLS playlists for the same CMAF segments.
+# Segments are written as they are encoded and the manifests updated after each one, so the
+# first segments play while the rest is still encoding
+LADDER_PACKAGINGS = ("mp4", "hls", "dash")
+
+def check_ladder_packaging(packaging: str, segment_seconds: float):
+    if packaging not in LADDER_PACKAGINGS:
+        raise HTTPException(status_code=400, detail=f"Invalid packaging. Use one of: {list(LADDER_PACKAGINGS)}")
+    if segment_seconds <= 0:
+        raise HTTPException(status_code=400, detail="segment_seconds must be positive.")
+
+def ladder_manifest(output_dir: str, packaging: str) -> str:
+    return os.path.join(output_dir, "master.m3u8" if packaging == "hls" else "manifest.mpd")
+
+def packaged_ladder_args(ladder: list, threads: list, has_audio: bool, output_dir: str, packaging: str, segment_seconds: float,
+                         profile: str = DEFAULT_PROFILE) -> list:
+    # The audio of the source is encoded once, as a single rendition every rung plays with
+    args = []
+    for i in range(len(ladder)):
+        args += ["-map", f"[v{i}]"]
+    if has_audio:
+        args += ["-map", "0:a:0"]
+    for i, (level, count) in enumerate(zip(ladder, threads)):
+        # No scene cut keyframes and closed GOPs: only the forced keyframes start a segment
+        args += [f"-c:v:{i}", "libx265", f"-b:v:{i}", level["bitrate"], f"-x265-params:v:{i}", f"pools={count}:scenecut=0:open-gop=0"]
+    args += profile_args("libx265", profile, stream="v") + ["-tag:v", "hvc1", "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})"]
+    if has_audio:
+        args += ["-c:a", "aac", "-b:a", "128k"]
+
+    if packaging == "hls":
+        # Every video variant references the "aud" group, whose only member is the audio playlist
+        stream_map = " ".join(f"v:{i},agroup:aud,name:{i}" if has_audio else f"v:{i},name:{i}" for i in range(len(ladder)))
+        if has_audio:
+            stream_map = "a:0,agroup:aud,name:audio " + stream_map
+        return args + [
+            "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "event",
+            "-hls_segment_type", "fmp4", "-hls_flags", "independent_segments+temp_file",
+            "-master_pl_name", "master.m3u8", "-var_stream_map", stream_map,
+            "-hls_segment_filename", os.path.join(output_dir, "stream_%v", "segment_%05d.m4s"),
+            os.path.join(output_dir, "stream_%v", "playlist.m3u8")
+        ]
+    return args + [
+        "-f", "dash", "-seg_duration", str(segment_seconds), "-use_template", "1", "-use_timeline", "1",
+        "-streaming", "1", "-adaptation_sets", "id=0,streams=v id=1,streams=a" if has_audio else "id=0,streams=v",
+        "-init_seg_name", "init_$RepresentationID$.m4s", "-media_seg_name", "chunk_$RepresentationID$_$Number%05d$.m4s",
+        "-hls_playlist", "1",
+        ladder_manifest(output_dir, packaging)
     ]
 
-    outputs = []
+def packaged_rung_bytes(output_dir: str, packaging: str, index: int) -> int:
+    # Bytes written for one rung: the files of its HLS variant, or its DASH representation
+    if packaging == "hls":
+        directory = os.path.join(output_dir, f"stream_{index}")
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    return sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir)
+               if name == f"init_{index}.m4s" or name.startswith(f"chunk_{index}_"))
+
+# The ladder in a single ffmpeg: the source is decoded once, split and scaled to every rung in
+# one filter graph, and each rung is encoded straight to H.265 at its bitrate, all the encoders
+# running side by side. Used by the endpoint and by /jobs/encoding_ladder/
+async def encoding_ladder_work(input_path: str, progress=None, ladder: list = None, output_dir: str = SHARED_DIR,
+                               packaging: str = "mp4", segment_seconds: float = 4.0, profile: str = DEFAULT_PROFILE) -> dict:
+    ladder = ladder or LADDER_CONFIG
+    uid = str(uuid.uuid4())
 
-    for level in ladder_config:
-        # 1. Resize using internal function
-        resized_path = resize_video(
-            input_path,
-            level["width"],
-            level["height"]
-        )
+    scales = "".join(f'[s{i}]scale={level["width"]}:{level["height"]}[v{i}];' for i, level in enumerate(ladder))
+    filter_graph = f'[0:v]split={len(ladder)}' + "".join(f"[s{i}]" for i in range(len(ladder))) + ";" + scales.rstrip(";")
+
+    cmd = ["ffmpeg", *PROGRESS_ARGS, "-y", "-i", input_path, "-filter_complex", filter_graph]
+    threads = split_threads([level["width"] * level["height"] for level in ladder])
+
+    if packaging != "mp4":
+        metadata = await metadata_cache.get(input_path)
+        has_audio = any(stream["codec_type"] == "audio" for stream in metadata["streams"])
+        if packaging == "hls":
+            for name in [*range(len(ladder)), *(["audio"] if has_audio else [])]:
+                os.makedirs(os.path.join(output_dir, f"stream_{name}"), exist_ok=True)
+        cmd += packaged_ladder_args(ladder, threads, has_audio, output_dir, packaging, segment_seconds, profile)
+
+        start = time.monotonic()
+        _, _, stderr = await run_ffmpeg(cmd, priority="batch")
+        total_seconds = time.monotonic() - start
+        frames = encoded_frames(stderr)
+        if progress is not None:
+            progress(1.0)
+
+        result = {
+            "message": "Encoding ladder packaged successfully",
+            "packaging": packaging,
+            "segment_seconds": segment_seconds,
+            "profile": profile,
+            "total_seconds": round(total_seconds, 3),
+            "encode": encode_stats(frames, total_seconds),
+            "manifest": shared_url(ladder_manifest(output_dir, packaging)),
+            # Every rung encodes every frame of the source, in the shared wall time above
+            "ladder": [{"resolution": f'{level["width"]}x{level["height"]}', "bitrate": level["bitrate"], "frames": frames,
+                        "size_bytes": packaged_rung_bytes(output_dir, packaging, i)} for i, level in enumerate(ladder)]
+        }
+        if packaging == "dash":
+            result["hls_playlist"] = shared_url(os.path.join(output_dir, "master.m3u8"))
+        return result
+    output_paths = []
+    for i, (level, count) in enumerate(zip(ladder, threads)):
+        output_path = os.path.join(output_dir, f'ladder_{level["width"]}x{level["height"]}_{level["bitrate"]}_{uid}.mp4')
+        cmd += [
+            "-map", f"[v{i}]", "-map", "0:a?",
+            "-c:v", "libx265", "-b:v", level["bitrate"], "-x265-params", f"pools={count}", *profile_args("libx265", profile),
+            "-c:a", "aac",
+            output_path
+        ]
+        output_paths.append(output_path)
 
-        # 2. Encode using internal function
-        encoded_path = convert_to_h265(
-            resized_path,
-            level["bitrate"]
-        )
+    start = time.monotonic()
+    _, _, stderr = await run_ffmpeg(cmd, priority="batch")
+    total_seconds = time.monotonic() - start
+    frames = encoded_frames(stderr)
 
+    # Every rung encodes every frame of the source, in the shared wall time
+    outputs = []
+    for level, output_path in zip(ladder, output_paths):
         outputs.append({
             "resolution": f'{level["width"]}x{level["height"]}',
             "bitrate": level["bitrate"],
-            "file": encoded_path
+            "file": output_path,
+            "frames": frames,
+            "size_bytes": os.path.getsize(output_path)
         })
 
-        os.remove(resized_path)
-
-    os.remove(input_path)
+    if progress is not None:
+        progress(1.0)
 
     return {
         "message": "Encoding ladder created successfully",
+        "profile": profile,
+        # The rungs are encoded together by one process: the wall time is shared, the
+        # frames and size of each rung are in the ladder
+        "total_seconds": round(total_seconds, 3),
+        "encode": encode_stats(frames, total_seconds),
         "ladder": outputs
     }
 
+@app.post("/video/encoding_ladder/")
+async def encoding_ladder(file: UploadFile = File(None), shared_file: str = None, ladder: str = Form(None),
+                          packaging: str = "mp4", segment_seconds: float = 4.0, profile: str = DEFAULT_PROFILE):
+    rungs = parse_ladder(ladder)
+    check_ladder_packaging(packaging, segment_seconds)
+    check_profile(profile)
 
+    # Save uploaded file
+    source = await receive_source(file, shared_file)
+
+    return await result_cache.get_or_create(
+        source["key"], "encoding_ladder",
+        {"ladder": rungs, "vcodec": "libx265", "acodec": "aac", "packaging": packaging, "segment_seconds": segment_seconds,
+         "profile": profile},
+        lambda output_dir: encoding_ladder_work(source["path"], ladder=rungs, output_dir=output_dir,
+                                                packaging=packaging, segment_seconds=segment_seconds, profile=profile),
+        release=lambda: release_source(source)
+    )
 
 
+# Background jobs: the long endpoints above submitted to the job queue. They answer right
+# away with the job id, the job is followed with GET /jobs/{job_id} and cancelled with DELETE
+
+job_queue = create_job_queue()
+
+async def run_queued(coroutine):
+    # Jobs already wait in the job queue, their ffmpeg processes are queued rather than refused
+    with queue_when_busy():
+        return await coroutine
+
+async def submit_upload_job(kind: str, file: UploadFile, shared_file: str, work, extra: dict = None) -> dict:
+    # Saves the upload (or takes the shared file), then queues work(input_path, uid, progress).
+    # A saved upload is removed when the job finishes
+    uid = str(uuid.uuid4())
+    source = await receive_source(file, shared_file)
+
+    try:
+        job = job_queue.submit(kind, lambda progress: run_queued(work(source["path"], uid, progress)), cleanup=lambda: release_source(source))
+    except QueueFullError as e:
+        release_source(source)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}", **(extra or {})}
+
+@app.post("/jobs/convert_video_4_formats/", status_code=202)
+async def convert_codecs_job(file: UploadFile = File(None), shared_file: str = None, fanout: bool = True,
+                             chunked: bool = False, chunk_workers: int = CHUNK_WORKERS, chunk_seconds: float = CHUNK_SECONDS,
+                             profile: str = DEFAULT_PROFILE):
+    check_chunking(chunk_workers, chunk_seconds)
+    check_profile(profile)
+    return await submit_upload_job(
+        "convert_video_4_formats", file, shared_file,
+        lambda input_path, uid, progress: convert_codecs_work(input_path, uid, progress, fanout=fanout, chunked=chunked,
+                                                              chunk_workers=chunk_workers, chunk_seconds=chunk_seconds,
+                                                              profile=profile)
+    )
+
+@app.post("/jobs/encoding_ladder/", status_code=202)
+async def encoding_ladder_job(file: UploadFile = File(None), shared_file: str = None, ladder: str = Form(None),
+                              packaging: str = "mp4", segment_seconds: float = 4.0, profile: str = DEFAULT_PROFILE):
+    rungs = parse_ladder(ladder)
+    check_ladder_packaging(packaging, segment_seconds)
+    check_profile(profile)
+    if packaging == "mp4":
+        return await submit_upload_job("encoding_ladder", file, shared_file, lambda input_path, uid, progress: encoding_ladder_work(input_path, progress, ladder=rungs, profile=profile))
+
+    # The manifest location is known now: players can load it while the job is still encoding
+    output_dir = os.path.join(SHARED_DIR, f"ladder_{uuid.uuid4()}")
+    os.makedirs(output_dir)
+    return await submit_upload_job(
+        "encoding_ladder", file, shared_file,
+        lambda input_path, uid, progress: encoding_ladder_work(input_path, progress, ladder=rungs, output_dir=output_dir,
+                                                               packaging=packaging, segment_seconds=segment_seconds, profile=profile),
+        extra={"manifest": shared_url(ladder_manifest(output_dir, packaging))}
+    )
 
+@app.get("/jobs/")
+async def list_jobs(limit: int = 100):
+    return {**job_queue.stats(), "jobs": job_queue.list(limit)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
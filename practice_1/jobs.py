@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Long operations run as jobs: submitting returns an id right away and a pool of worker
+# tasks runs the work in the background. The records (status, progress, result) live in
+# a store, in memory or in a SQLite file so they survive restarts and can be shared
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 32))
+JOB_STORE = os.environ.get("JOB_STORE", "")  # Empty: in memory, otherwise path of a SQLite file
+JOB_TTL = float(os.environ.get("JOB_TTL", 24 * 3600))  # Finished jobs are forgotten after this
+# Fail at startup the unfinished jobs of other processes. Only safe when this is the only
+# process using the store (a shared SQLite file may have jobs running in another worker)
+JOB_RECOVER = os.environ.get("JOB_RECOVER", "0") == "1"
+
+# Process that created a job, so a recovery knows which jobs were not its own
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def new_job(kind: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "status": "queued",
+        "progress": 0.0,
+        "result": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "owner": PROCESS_ID
+    }
+
+
+class MemoryJobStore:
+    def __init__(self, ttl_seconds: float = JOB_TTL):
+        self.jobs = {}
+        self.ttl_seconds = ttl_seconds
+
+    def expire(self):
+        # Removes the jobs finished more than ttl_seconds ago
+        oldest = time.time() - self.ttl_seconds
+        for job_id in [job["id"] for job in self.jobs.values() if job["finished_at"] is not None and job["finished_at"] < oldest]:
+            del self.jobs[job_id]
+
+    def create(self, job: dict):
+        self.expire()
+        self.jobs[job["id"]] = dict(job)
+
+    def update(self, job_id: str, **fields):
+        self.jobs[job_id].update(fields)
+
+    def get(self, job_id: str):
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def list(self, limit: int = 100) -> list:
+        self.expire()
+        jobs = sorted(self.jobs.values(), key=lambda job: job["created_at"], reverse=True)
+        return [dict(job) for job in jobs[:limit]]
+
+
+class SQLiteJobStore:
+    COLUMNS = ("id", "kind", "status", "progress", "result", "error", "created_at", "started_at", "finished_at", "owner")
+
+    def __init__(self, path: str, ttl_seconds: float = JOB_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, status TEXT, progress REAL, "
+                "result TEXT, error TEXT, created_at REAL, started_at REAL, finished_at REAL, owner TEXT)"
+            )
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:  # Store created before jobs had an owner
+                self.connection.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def recover(self, owner: str = PROCESS_ID) -> int:
+        # Fails the unfinished jobs of other processes: their work was in the memory of a
+        # process that is gone. Only call it when no other live process uses this store
+        with self.lock, self.connection:
+            return self.connection.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart', finished_at = ? "
+                "WHERE status IN ('queued', 'running') AND (owner IS NULL OR owner != ?)", (time.time(), owner)
+            ).rowcount
+
+    def _row_to_job(self, row) -> dict:
+        job = dict(zip(self.COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def expire(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl_seconds,))
+
+    def create(self, job: dict):
+        self.expire()
+        values = [json.dumps(job[c]) if c == "result" and job[c] is not None else job[c] for c in self.COLUMNS]
+        with self.lock, self.connection:
+            self.connection.execute(f"INSERT INTO jobs VALUES ({', '.join('?' * len(self.COLUMNS))})", values)
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self.lock, self.connection:
+            self.connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str):
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def list(self, limit: int = 100) -> list:
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+class JobQueue:
+    def __init__(self, store=None, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE):
+        self.store = store if store is not None else MemoryJobStore()
+        self.workers = workers
+        self.max_queued = max_queued
+        self.queue = None
+        self.loop = None
+        self.worker_tasks = []
+        self.waiting = set()  # ids of the queued jobs, not counting the cancelled ones
+        self.running = {}  # job id -> task running it
+        self.cleanups = {}  # job id -> function called once the job is finished, whatever the outcome
+
+    def _start(self):
+        # Workers are started with the first job, inside the running event loop (again if
+        # the loop changed, e.g. between test clients)
+        if self.loop is not asyncio.get_running_loop():
+            self.loop = asyncio.get_running_loop()
+            self.queue = asyncio.Queue()
+            self.waiting.clear()
+            self.worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, kind: str, work, cleanup=None) -> dict:
+        # work is an async function called with a progress(fraction) callback, its return
+        # value is the result of the job. Raises QueueFullError when max_queued jobs wait
+        # (cancelled jobs left in the queue do not count)
+        self._start()
+        if len(self.waiting) >= self.max_queued:
+            raise QueueFullError(f"Too many queued jobs ({self.max_queued}), try again later")
+        job = new_job(kind)
+        self.store.create(job)
+        if cleanup is not None:
+            self.cleanups[job["id"]] = cleanup
+        self.waiting.add(job["id"])
+        self.queue.put_nowait((job["id"], work))
+        return job
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def list(self, limit: int = 100) -> list:
+        return self.store.list(limit)
+
+    def cancel(self, job_id: str):
+        # Queued jobs are skipped by the workers, running ones are cancelled (which kills their ffmpeg)
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+        if job_id in self.running:
+            self.running[job_id].cancel()
+        else:
+            self.waiting.discard(job_id)
+            self._finish(job_id, status="cancelled")
+        return self.store.get(job_id)
+
+    def _finish(self, job_id: str, **fields):
+        self.store.update(job_id, finished_at=time.time(), **fields)
+        cleanup = self.cleanups.pop(job_id, None)
+        if cleanup is not None:
+            cleanup()
+
+    async def _worker(self):
+        while True:
+            job_id, work = await self.queue.get()
+            self.waiting.discard(job_id)
+            try:
+                job = self.store.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue
+
+                def progress(fraction: float):
+                    self.store.update(job_id, progress=round(float(fraction), 4))
+
+                self.store.update(job_id, status="running", started_at=time.time())
+                task = asyncio.create_task(work(progress))
+                self.running[job_id] = task
+                try:
+                    result = await task
+                except asyncio.CancelledError:
+                    if not task.cancelled():
+                        raise  # The worker itself is being cancelled (shutdown)
+                    self._finish(job_id, status="cancelled")
+                except Exception as e:
+                    self._finish(job_id, status="failed", error=str(e) or type(e).__name__)
+                else:
+                    self._finish(job_id, status="done", progress=1.0, result=result)
+                finally:
+                    self.running.pop(job_id, None)
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": len(self.waiting),
+            "running": len(self.running)
+        }
+
+
+def create_job_queue() -> JobQueue:
+    store = SQLiteJobStore(JOB_STORE) if JOB_STORE else MemoryJobStore()
+    if JOB_RECOVER and JOB_STORE:
+        store.recover()
+    return JobQueue(store=store)
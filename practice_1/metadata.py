@@ -0,0 +1,116 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+from ffmpeg_runner import probe
+
+
+# Metadata of the videos, probed once and kept in an LRU cache keyed by the content hash of
+# an upload or by a path (with its size and modification time, so a changed file is probed
+# again). ffprobe only reads the header: probesize and analyzeduration bound how much of the
+# file it looks at, so the latency does not grow with the size of the file
+METADATA_CACHE_SIZE = int(os.environ.get("METADATA_CACHE_SIZE", 1024))
+PROBE_SIZE = int(os.environ.get("PROBE_SIZE", 5_000_000))  # bytes
+PROBE_ANALYZE_DURATION = int(os.environ.get("PROBE_ANALYZE_DURATION", 5_000_000))  # microseconds
+
+# Fields of each stream kept in the summary, by stream type
+STREAM_FIELDS = {
+    "video": ("width", "height", "pix_fmt", "r_frame_rate", "avg_frame_rate", "profile", "level", "field_order"),
+    "audio": ("sample_rate", "channels", "channel_layout", "sample_fmt"),
+    "subtitle": (),
+}
+
+
+def _number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_stream(stream: dict) -> dict:
+    codec_type = stream.get("codec_type")
+    summary = {
+        "index": stream.get("index"),
+        "codec_type": codec_type,
+        "codec_name": stream.get("codec_name"),
+        "bit_rate": _number(stream.get("bit_rate"), int),
+        "duration_sec": _number(stream.get("duration")),
+        "language": stream.get("tags", {}).get("language")
+    }
+    for field in STREAM_FIELDS.get(codec_type, ()):
+        summary[field] = stream.get(field)
+    return summary
+
+
+def summarize(info: dict) -> dict:
+    # The parsed ffprobe output in a stable shape. The video fields come from the first video
+    # stream, wherever it is (None for audio only files)
+    format_info = info.get("format", {})
+    streams = [summarize_stream(stream) for stream in info.get("streams", [])]
+    video = next((stream for stream in streams if stream["codec_type"] == "video"), None)
+    return {
+        "format_name": format_info.get("format_name"),
+        "duration_sec": _number(format_info.get("duration")),
+        "size_bytes": _number(format_info.get("size"), int),
+        "bit_rate": _number(format_info.get("bit_rate"), int),
+        "width": video["width"] if video else None,
+        "height": video["height"] if video else None,
+        "num_streams": len(streams),
+        "streams": streams
+    }
+
+
+class MetadataCache:
+    # The parsed ffprobe output is cached whole (tags, disposition, color and side data
+    # included), the summary is built from it when asked for
+    def __init__(self, max_entries: int = METADATA_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> parsed ffprobe output, least recently used first
+        self.pending = {}  # key -> probe running for it
+        self.metrics = {"hits": 0, "misses": 0}
+
+    def get_cached_info(self, key: str):
+        info = self.entries.get(key)
+        if info is not None:
+            self.entries.move_to_end(key)
+        return info
+
+    def get_cached(self, key: str):
+        info = self.get_cached_info(key)
+        return summarize(info) if info is not None else None
+
+    async def get_info(self, path: str, content_hash: str = None) -> dict:
+        # ffprobe output of the file at path, probed only if neither its content hash nor the path is known
+        key = f"sha256:{content_hash}" if content_hash else self.path_key(path)
+        info = self.get_cached_info(key)
+        if info is not None:
+            self.metrics["hits"] += 1
+            return info
+
+        if key not in self.pending:
+            self.metrics["misses"] += 1
+            self.pending[key] = asyncio.create_task(probe(path, probesize=PROBE_SIZE, analyzeduration=PROBE_ANALYZE_DURATION))
+        try:
+            info = await asyncio.shield(self.pending[key])
+        finally:
+            if self.pending.get(key) is not None and self.pending[key].done():
+                self.pending.pop(key)
+
+        self.entries[key] = info
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return info
+
+    async def get(self, path: str, content_hash: str = None) -> dict:
+        # Summary of the file at path
+        return summarize(await self.get_info(path, content_hash))
+
+    @staticmethod
+    def path_key(path: str) -> str:
+        stat = os.stat(path)
+        return f"path:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def stats(self) -> dict:
+        return {**self.metrics, "entries": len(self.entries), "max_entries": self.max_entries}
@@ -0,0 +1,61 @@
+import os
+
+
+# Encoding profiles: each one is a speed/quality tradeoff, mapped to the speed options of every
+# encoder. realtime encodes faster than playback, fast is for previews, balanced is the
+# default and archive spends the time for the smallest files. The threading options (row
+# based multithreading, tiles) are in ffmpeg_runner.thread_args
+ENCODING_PROFILES = ("realtime", "fast", "balanced", "archive")
+DEFAULT_PROFILE = os.environ.get("ENCODING_PROFILE", "balanced")
+
+PROFILE_ARGS = {
+    "libx264": {
+        "realtime": ["-preset", "ultrafast", "-tune", "zerolatency"],
+        "fast": ["-preset", "veryfast"],
+        "balanced": ["-preset", "medium"],
+        "archive": ["-preset", "slow"],
+    },
+    "libx265": {
+        "realtime": ["-preset", "ultrafast", "-tune", "zerolatency"],
+        "fast": ["-preset", "veryfast"],
+        "balanced": ["-preset", "medium"],
+        "archive": ["-preset", "slow"],
+    },
+    # libvpx defaults to deadline=good with cpu-used=0 (its slowest setting)
+    "libvpx": {
+        "realtime": ["-deadline", "realtime", "-cpu-used", "8"],
+        "fast": ["-deadline", "good", "-cpu-used", "4"],
+        "balanced": ["-deadline", "good", "-cpu-used", "2"],
+        "archive": ["-deadline", "good", "-cpu-used", "0"],
+    },
+    "libvpx-vp9": {
+        "realtime": ["-deadline", "realtime", "-cpu-used", "8"],
+        "fast": ["-deadline", "good", "-cpu-used", "4"],
+        "balanced": ["-deadline", "good", "-cpu-used", "2"],
+        "archive": ["-deadline", "good", "-cpu-used", "0"],
+    },
+    # libaom defaults to cpu-used=1, far slower than real time
+    "libaom-av1": {
+        "realtime": ["-usage", "realtime", "-cpu-used", "8"],
+        "fast": ["-cpu-used", "6"],
+        "balanced": ["-cpu-used", "4"],
+        "archive": ["-cpu-used", "2"],
+    },
+}
+
+
+def profile_args(encoder: str, profile: str = DEFAULT_PROFILE, stream: str = None) -> list:
+    # Speed options of encoder for profile, none for encoders without profiles (audio, copy).
+    # With stream (e.g. "v" or "v:0") they only apply to those output streams
+    if profile not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown profile {profile}, use one of {ENCODING_PROFILES}")
+    args = PROFILE_ARGS.get(encoder, {}).get(profile, [])
+    if stream is None:
+        return list(args)
+    return [f"{arg}:{stream}" if i % 2 == 0 else arg for i, arg in enumerate(args)]
+
+
+def profile_kwargs(encoder: str, profile: str = DEFAULT_PROFILE) -> dict:
+    # The same options as keyword arguments of ffmpeg-python's output()
+    args = profile_args(encoder, profile)
+    return {option.lstrip("-"): value for option, value in zip(args[::2], args[1::2])}
@@ -5,10 +5,403 @@ from scipy.fftpack import dct, idct
 import os
 import unittest
 import pywt
+import functools
+
+
+# BT.601 coefficients of rgb_to_yuv / yuv_to_rgb scaled by 1000, so the frame
+# methods can do the same conversion with integer (fixed-point) math
+FIXED_POINT_SCALE = 1000
+RGB_TO_YUV_COEFFS = np.array([[257, 504, 98],      # Y
+                              [-148, -291, 439],   # U
+                              [439, -368, -71]],   # V
+                             dtype=np.int32)
+RGB_TO_YUV_OFFSETS = np.array([16, 128, 128], dtype=np.int32)
+YUV_TO_RGB_COEFFS = np.array([[1164, 0, 1596],     # R (columns: Y-16, U-128, V-128)
+                              [1164, -391, -813],  # G
+                              [1164, 2018, 0]],    # B
+                             dtype=np.int32)
+YUV_TO_RGB_OFFSETS = np.array([16, 128, 128], dtype=np.int32)
+
+# Planar layouts supported by the frame methods: chroma subsampling factor
+PLANAR_FORMATS = {"yuv444p": 1, "yuv420p": 2}
+
+# Luma weights (Kr, Kb) of the standards the frame methods can convert with
+COLOR_STANDARDS = {"bt601": (0.299, 0.114), "bt709": (0.2126, 0.0722)}
+CONVERSION_METHODS = ("float", "fixed", "lut")
+LUT_SHIFT = 16  # Fractional bits of the lookup table entries
+
+
+def _rgb_to_yuv_float(R, G, B):
+    # Shared by the scalar path and the fixed-point tie fallback so both give the same floats
+    Y = 0.257 * R + 0.504 * G + 0.098 * B + 16
+    U = -0.148 * R - 0.291 * G + 0.439 * B + 128
+    V = 0.439 * R - 0.368 * G - 0.071 * B + 128
+    return Y, U, V
+
+
+def _yuv_to_rgb_float(Y, U, V):
+    R = 1.164 * (Y - 16) + 1.596 * (V - 128)
+    G = 1.164 * (Y - 16) - 0.813 * (V - 128) - 0.391 * (U - 128)
+    B = 1.164 * (Y - 16) + 2.018 * (U - 128)
+    return R, G, B
+
+
+@functools.lru_cache(maxsize=None)
+def color_matrices(standard: str = "bt601", full_range: bool = False) -> tuple:
+    # (RGB->YUV matrix, YUV offsets, YUV->RGB matrix), the inverse is applied to YUV minus the offsets
+    if standard not in COLOR_STANDARDS:
+        raise ValueError(f"Unsupported color standard '{standard}'. Use one of: {list(COLOR_STANDARDS)}")
+
+    if standard == "bt601" and not full_range:
+        # Same rounded coefficients as rgb_to_yuv / yuv_to_rgb
+        forward = RGB_TO_YUV_COEFFS / FIXED_POINT_SCALE
+        inverse = YUV_TO_RGB_COEFFS / FIXED_POINT_SCALE
+        offsets = RGB_TO_YUV_OFFSETS.astype(np.float64)
+    else:
+        kr, kb = COLOR_STANDARDS[standard]
+        kg = 1 - kr - kb
+        forward = np.array([[kr, kg, kb],
+                            [-kr / (2 * (1 - kb)), -kg / (2 * (1 - kb)), 0.5],
+                            [0.5, -kg / (2 * (1 - kr)), -kb / (2 * (1 - kr))]])
+        if full_range:
+            offsets = np.array([0.0, 128.0, 128.0])
+        else:
+            forward *= np.array([[219 / 255], [224 / 255], [224 / 255]])
+            offsets = np.array([16.0, 128.0, 128.0])
+        inverse = np.linalg.inv(forward)
+
+    # Cached and shared between calls
+    for matrix in (forward, offsets, inverse):
+        matrix.setflags(write=False)
+    return forward, offsets, inverse
+
+
+@functools.lru_cache(maxsize=None)
+def _conversion_luts(direction: str, standard: str, full_range: bool) -> np.ndarray:
+    # luts[c][v] holds what input channel c with value v adds to each of the 3 outputs,
+    # so a conversion is 3 table gathers and 2 integer adds per pixel
+    forward, offsets, inverse = color_matrices(standard, full_range)
+    values = np.arange(256, dtype=np.float64)
+
+    if direction == "rgb_to_yuv":
+        luts = values[None, :, None] * forward.T[:, None, :]
+        luts[0] += offsets + 0.5  # Offsets and rounding folded into the first table
+    else:
+        luts = (values[None, :, None] - offsets[:, None, None]) * inverse.T[:, None, :]
+
+    luts = np.round(luts * (1 << LUT_SHIFT)).astype(np.int32)
+    luts.setflags(write=False)
+    return luts
+
+
+def _lut_convert(pixels, luts):
+    acc = np.take(luts[0], pixels[:, 0], axis=0)
+    acc += np.take(luts[1], pixels[:, 1], axis=0)
+    acc += np.take(luts[2], pixels[:, 2], axis=0)
+    acc >>= LUT_SHIFT
+    return acc
+
+
+@functools.lru_cache(maxsize=16)
+def zigzag_indices(height: int, width: int, block_size: int = None) -> np.ndarray:
+    # Flat indices of a (height, width) array in zig-zag order, computed once per shape.
+    # With block_size, each block is scanned on its own (DCT coefficient order) and the
+    # result has shape (n_blocks, block_size**2) with the blocks in raster order
+    if block_size:
+        if height % block_size or width % block_size:
+            raise ValueError(f"A {height}x{width} array can not be split in {block_size}x{block_size} blocks")
+        block_order = zigzag_indices(block_size, block_size).astype(np.int64)
+        block_y, block_x = np.divmod(block_order, block_size)
+        origin_y, origin_x = np.meshgrid(np.arange(0, height, block_size), np.arange(0, width, block_size), indexing="ij")
+        order = (origin_y.reshape(-1, 1) + block_y) * width + origin_x.reshape(-1, 1) + block_x
+    else:
+        y, x = np.indices((height, width)).reshape(2, -1)
+        diagonal = y + x
+        # Odd diagonals go from top to bottom and even ones from bottom to top, as in JPEG
+        order = np.lexsort((np.where(diagonal % 2 == 1, y, -y), diagonal))
+
+    order = order.astype(np.int32 if height * width < 2**31 else np.int64)
+    order.setflags(write=False)
+    return order
+
+
+def zigzag_scan(data: np.ndarray, block_size: int = None) -> np.ndarray:
+    # (H, W) or (H, W, C) array -> pixels in zig-zag order, one gather with the cached indices
+    data = np.asarray(data)
+    height, width = data.shape[:2]
+    order = zigzag_indices(height, width, block_size)
+    return data.reshape(height * width, *data.shape[2:])[order]
+
+
+def inverse_zigzag_scan(scanned: np.ndarray, height: int, width: int, block_size: int = None) -> np.ndarray:
+    # Puts the output of zigzag_scan back in raster order
+    scanned = np.asarray(scanned)
+    channels = scanned.shape[2:] if block_size else scanned.shape[1:]
+    order = zigzag_indices(height, width, block_size)
+    data = np.empty((height * width, *channels), dtype=scanned.dtype)
+    data[order.ravel()] = scanned.reshape(height * width, *channels)
+    return data.reshape(height, width, *channels)
+
+
+def _check_method(method, standard, full_range):
+    if method not in CONVERSION_METHODS:
+        raise ValueError(f"Unsupported conversion method '{method}'. Use one of: {list(CONVERSION_METHODS)}")
+    if method == "fixed" and (standard != "bt601" or full_range):
+        raise ValueError("The fixed-point method only implements the BT.601 limited range coefficients of rgb_to_yuv")
+
+
+def _check_frame_out(out, shape):
+    if out is None:
+        return np.empty(shape, dtype=np.uint8)
+    if out.shape != shape or out.dtype != np.uint8:
+        raise ValueError(f"Output buffer must be uint8 with shape {shape}, got {out.dtype} {out.shape}")
+    return out
+
+
+def _planar_size(width, height, pix_fmt):
+    if pix_fmt not in PLANAR_FORMATS:
+        raise ValueError(f"Unsupported pixel format '{pix_fmt}'. Use one of: {list(PLANAR_FORMATS)}")
+    factor = PLANAR_FORMATS[pix_fmt]
+    chroma_w = -(-width // factor)
+    chroma_h = -(-height // factor)
+    return width * height, chroma_w, chroma_h
+
+
+# Packed RLE format: RLE_MAGIC followed by blocks of at most RLE_BLOCK_RUNS runs, each one
+# varint(number of runs) + one byte per run value + varint(count) per run
+RLE_MAGIC = b"RLE1"
+RLE_BLOCK_RUNS = 1 << 16
+RLE_OUTPUTS = ("tuples", "arrays", "packed")
+
+
+def _as_byte_array(data) -> np.ndarray:
+    # bytes, bytearray and memoryview are wrapped without copying
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(data, dtype=np.uint8)
+    return np.asarray(data, dtype=np.uint8).ravel()
+
+
+def rle_encode(data) -> tuple:
+    # (counts, values) arrays, the run boundaries come from one comparison over the whole input
+    values = _as_byte_array(data)
+    if values.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+
+    starts = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], starts))
+    counts = np.diff(starts, append=values.size)
+    return counts, values[starts]
+
+
+def rle_decode(counts, values) -> np.ndarray:
+    return np.repeat(np.asarray(values, dtype=np.uint8), np.asarray(counts, dtype=np.int64))
+
+
+def _varint_encode(numbers: np.ndarray) -> np.ndarray:
+    # LEB128: 7 bits per byte, the high bit tells that more bytes follow
+    numbers = np.asarray(numbers, dtype=np.uint64)
+    sizes = np.ones(numbers.size, dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += numbers >= np.uint64(1 << shift)
+
+    ends = np.cumsum(sizes)
+    encoded = np.empty(ends[-1] if numbers.size else 0, dtype=np.uint8)
+    starts = ends - sizes
+    for k in range(int(sizes.max()) if numbers.size else 0):
+        present = sizes > k
+        byte = (numbers[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= (sizes[present] > k + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[present] + k] = byte
+    return encoded
+
+
+def _varint_decode(data: np.ndarray, count: int) -> tuple:
+    # Decodes count varints from the start of data: (numbers, bytes used)
+    if count == 0:
+        return np.empty(0, dtype=np.int64), 0
 
+    ends = np.flatnonzero(data[:10 * count] < 0x80)[:count]
+    if ends.size < count:
+        raise ValueError("Truncated RLE data")
 
+    used = int(ends[-1]) + 1
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(used) - np.repeat(starts, ends - starts + 1))
+    payload = (data[:used].astype(np.uint64) & np.uint64(0x7F)) << shifts.astype(np.uint64)
+    return np.add.reduceat(payload, starts).astype(np.int64), used
 
 
+def _rle_pack_block(counts, values) -> bytes:
+    header = _varint_encode([len(counts)])
+    return header.tobytes() + np.asarray(values, dtype=np.uint8).tobytes() + _varint_encode(counts).tobytes()
+
+
+def _rle_unpack_block(data: np.ndarray, position: int) -> tuple:
+    (n_runs,), used = _varint_decode(data[position:position + 10], 1)
+    position += used
+    values = data[position:position + n_runs]
+    if values.size < n_runs:
+        raise ValueError("Truncated RLE data")
+    counts, used = _varint_decode(data[position + n_runs:], n_runs)
+    return counts, values, position + n_runs + used
+
+
+def rle_pack(counts, values) -> bytes:
+    blocks = [RLE_MAGIC]
+    for start in range(0, len(counts), RLE_BLOCK_RUNS):
+        blocks.append(_rle_pack_block(counts[start:start + RLE_BLOCK_RUNS], values[start:start + RLE_BLOCK_RUNS]))
+    return b"".join(blocks)
+
+
+def rle_unpack(packed) -> tuple:
+    data = _as_byte_array(packed)
+    if data[:len(RLE_MAGIC)].tobytes() != RLE_MAGIC:
+        raise ValueError("Data is not in the packed RLE format")
+
+    position = len(RLE_MAGIC)
+    counts, values = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.uint8)]
+    while position < data.size:
+        block_counts, block_values, position = _rle_unpack_block(data, position)
+        counts.append(block_counts)
+        values.append(block_values)
+    return np.concatenate(counts), np.concatenate(values)
+
+
+class RunLengthStreamEncoder:
+    # Incremental rle_pack: feed() chunks of any size, each call returns the list of packed
+    # blocks it finished (the state is updated even if the result is thrown away, and the
+    # magic goes out with the first block, so a stream under one block comes whole from close()).
+    # The open run is carried over chunk boundaries and blocks are cut every RLE_BLOCK_RUNS runs,
+    # so the concatenated output is byte-identical to rle_pack on the whole input
+
+    def __init__(self):
+        self._counts = []
+        self._values = []
+        self._pending = 0  # Closed runs not yet packed
+        self._open_count = 0
+        self._open_value = 0
+        self._started = False
+
+    def feed(self, chunk) -> list:
+        counts, values = rle_encode(chunk)
+        if counts.size == 0:
+            return []
+
+        if self._open_count and values[0] == self._open_value:
+            counts[0] += self._open_count
+        elif self._open_count:
+            self._add_runs([self._open_count], [self._open_value])
+
+        # The last run may continue in the next chunk
+        self._open_count, self._open_value = int(counts[-1]), int(values[-1])
+        self._add_runs(counts[:-1], values[:-1])
+        return self._blocks()
+
+    def close(self) -> list:
+        if self._open_count:
+            self._add_runs([self._open_count], [self._open_value])
+            self._open_count = 0
+        blocks = self._blocks(final=True)
+        if not self._started:
+            self._started = True
+            blocks.insert(0, RLE_MAGIC)  # Empty stream (or everything in the last block)
+        return blocks
+
+    def _add_runs(self, counts, values):
+        if len(counts):
+            self._counts.append(np.asarray(counts, dtype=np.int64))
+            self._values.append(np.asarray(values, dtype=np.uint8))
+            self._pending += len(counts)
+
+    def _blocks(self, final=False) -> list:
+        # Packs the full blocks, and with final also the last partial one
+        if self._pending < RLE_BLOCK_RUNS and not (final and self._pending):
+            return []
+        counts, values = np.concatenate(self._counts), np.concatenate(self._values)
+        blocks, position = [], 0
+        while counts.size - position >= RLE_BLOCK_RUNS or (final and position < counts.size):
+            stop = min(position + RLE_BLOCK_RUNS, counts.size)
+            blocks.append(_rle_pack_block(counts[position:stop], values[position:stop]))
+            position = stop
+        self._counts, self._values = [counts[position:]], [values[position:]]
+        self._pending = counts.size - position
+        if blocks and not self._started:
+            self._started = True
+            blocks.insert(0, RLE_MAGIC)
+        return blocks
+
+
+class RunLengthStreamDecoder:
+    # Mirror of RunLengthStreamEncoder: feed() packed data in chunks of any size, each call
+    # returns the list of decoded pieces, of at most max_output bytes each
+
+    def __init__(self, max_output: int = 1 << 20):
+        self.max_output = max_output
+        self._buffer = bytearray()
+        self._checked_magic = False
+
+    def feed(self, chunk) -> list:
+        self._buffer += chunk
+        if not self._checked_magic:
+            if len(self._buffer) < len(RLE_MAGIC):
+                return []
+            if self._buffer[:len(RLE_MAGIC)] != RLE_MAGIC:
+                raise ValueError("Data is not in the packed RLE format")
+            del self._buffer[:len(RLE_MAGIC)]
+            self._checked_magic = True
+
+        # Decode every complete block, a partial one waits for the next chunk
+        data = np.frombuffer(bytes(self._buffer), dtype=np.uint8)
+        pieces, position = [], 0
+        while position < data.size:
+            try:
+                counts, values, end = _rle_unpack_block(data, position)
+            except ValueError:
+                break
+            pieces.extend(self._expand(counts, values))
+            position = end
+        del self._buffer[:position]
+        return pieces
+
+    def close(self) -> list:
+        # Data left in the buffer is an incomplete block
+        if self._buffer or not self._checked_magic:
+            raise ValueError("Truncated RLE data")
+        return []
+
+    def _expand(self, counts, values):
+        # Long runs are split so no piece is bigger than max_output
+        ends = np.cumsum(counts)
+        emitted, position = 0, 0
+        while position < counts.size:
+            stop = int(np.searchsorted(ends, emitted + self.max_output, side="right"))
+            if stop == position:
+                size = min(self.max_output, int(ends[position]) - emitted)
+                yield np.full(size, values[position], dtype=np.uint8).tobytes()
+                emitted += size
+                if emitted == ends[position]:
+                    position += 1
+            else:
+                piece = counts[position:stop].copy()
+                piece[0] = ends[position] - emitted
+                yield np.repeat(values[position:stop], piece).tobytes()
+                emitted, position = int(ends[stop - 1]), stop
+
+
+def rle_encode_stream(chunks):
+    # Packed RLE of an iterable of chunks, with memory bounded by the chunk size
+    encoder = RunLengthStreamEncoder()
+    for chunk in chunks:
+        yield from encoder.feed(chunk)
+    yield from encoder.close()
+
+
+def rle_decode_stream(chunks, max_output: int = 1 << 20):
+    decoder = RunLengthStreamDecoder(max_output)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
 
 class ColorTranslator:
     def __init__(self):
@@ -19,9 +412,7 @@ class ColorTranslator:
 
     def rgb_to_yuv(R: int, G: int, B: int) -> dict:
 
-        Y = 0.257 * R + 0.504 * G + 0.098 * B + 16
-        U = -0.148 * R - 0.291 * G + 0.439 * B + 128
-        V = 0.439 * R - 0.368 * G - 0.071 * B + 128
+        Y, U, V = _rgb_to_yuv_float(R, G, B)
 
         # The values should be clipped to the range [0, 255]
         Y = np.clip(round(Y), 0, 255)
@@ -32,13 +423,122 @@ class ColorTranslator:
 
     def yuv_to_rgb(Y: int, U: int, V: int) -> dict:
     
-        B = 1.164 * (Y - 16) + 2.018 * (U - 128)
-        G = 1.164 * (Y - 16) - 0.813 * (V - 128) - 0.391 * (U - 128)
-        R = 1.164 * (Y - 16) + 1.596 * (V - 128)
+        R, G, B = _yuv_to_rgb_float(Y, U, V)
 
         return {"R": int(R), "G": int(G), "B": int(B)}
+
+    # Frame versions of rgb_to_yuv / yuv_to_rgb: the whole (H, W, 3) uint8 frame is
+    # converted at once instead of one Python call per pixel. method is "float" (one
+    # matrix product), "fixed" (integer math, bit-exact with the scalar functions) or
+    # "lut" (precomputed tables, see _conversion_luts)
+
+    def rgb_to_yuv_frame(rgb: np.ndarray, out: np.ndarray = None, method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        _check_method(method, standard, full_range)
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        if rgb.ndim != 3 or rgb.shape[2] != 3:
+            raise ValueError(f"Expected an (H, W, 3) frame, got shape {rgb.shape}")
+        out = _check_frame_out(out, rgb.shape)
+        pixels = rgb.reshape(-1, 3)
+
+        if method == "fixed":
+            acc = pixels.astype(np.int32) @ RGB_TO_YUV_COEFFS.T
+            acc += RGB_TO_YUV_OFFSETS * FIXED_POINT_SCALE
+            result, remainder = np.divmod(acc, FIXED_POINT_SCALE)
+            result += remainder > FIXED_POINT_SCALE // 2
+
+            # Exact .5 ties depend on how round() sees the float value, so only
+            # those few pixels are evaluated with the scalar expressions
+            ties = np.nonzero((remainder == FIXED_POINT_SCALE // 2).any(axis=1))[0]
+            if ties.size:
+                R, G, B = pixels[ties].astype(np.float64).T
+                result[ties] = np.rint(np.stack(_rgb_to_yuv_float(R, G, B), axis=1))
+        elif method == "lut":
+            result = _lut_convert(pixels, _conversion_luts("rgb_to_yuv", standard, full_range))
+        else:
+            forward, offsets, _ = color_matrices(standard, full_range)
+            result = pixels.astype(np.float32) @ forward.T.astype(np.float32)
+            result += offsets.astype(np.float32)
+            np.rint(result, out=result)
+
+        np.clip(result, 0, 255, out=result)
+        out[...] = result.reshape(out.shape)
+        return out
+
+    def yuv_to_rgb_frame(yuv: np.ndarray, out: np.ndarray = None, method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        _check_method(method, standard, full_range)
+        yuv = np.asarray(yuv, dtype=np.uint8)
+        if yuv.ndim != 3 or yuv.shape[2] != 3:
+            raise ValueError(f"Expected an (H, W, 3) frame, got shape {yuv.shape}")
+        out = _check_frame_out(out, yuv.shape)
+        pixels = yuv.reshape(-1, 3)
+
+        if method == "fixed":
+            # Truncation towards zero, like int() in yuv_to_rgb
+            acc = (pixels.astype(np.int32) - YUV_TO_RGB_OFFSETS) @ YUV_TO_RGB_COEFFS.T
+            result = np.abs(acc) // FIXED_POINT_SCALE
+            np.negative(result, out=result, where=acc < 0)
+
+            # Exact integers can land just below or above in floating point
+            ties = np.nonzero((acc % FIXED_POINT_SCALE == 0).any(axis=1))[0]
+            if ties.size:
+                Y, U, V = pixels[ties].astype(np.float64).T
+                result[ties] = np.trunc(np.stack(_yuv_to_rgb_float(Y, U, V), axis=1))
+        elif method == "lut":
+            # Floors instead of truncating, which only differs for negatives that are clipped anyway
+            result = _lut_convert(pixels, _conversion_luts("yuv_to_rgb", standard, full_range))
+        else:
+            _, offsets, inverse = color_matrices(standard, full_range)
+            result = pixels.astype(np.float32) - offsets.astype(np.float32)
+            result = result @ inverse.T.astype(np.float32)
+            np.trunc(result, out=result)
+
+        # yuv_to_rgb does not clip, but a uint8 frame has to
+        np.clip(result, 0, 255, out=result)
+        out[...] = result.reshape(out.shape)
+        return out
+
+    def rgb_to_yuv_planar(rgb: np.ndarray, out: np.ndarray = None, pix_fmt: str = "yuv444p", method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        height, width = rgb.shape[:2]
+        luma_size, chroma_w, chroma_h = _planar_size(width, height, pix_fmt)
+        out = _check_frame_out(out, (luma_size + 2 * chroma_w * chroma_h,))
+
+        yuv = ColorTranslator.rgb_to_yuv_frame(rgb, method=method, standard=standard, full_range=full_range)
+        out[:luma_size] = yuv[:, :, 0].ravel()
+
+        factor = PLANAR_FORMATS[pix_fmt]
+        for i, plane in enumerate((yuv[:, :, 1], yuv[:, :, 2])):
+            start = luma_size + i * chroma_w * chroma_h
+            if factor > 1:
+                # Average each factor x factor block (edge pixels repeated for odd sizes)
+                padded = np.pad(plane, ((0, chroma_h * factor - height), (0, chroma_w * factor - width)), mode="edge")
+                blocks = padded.reshape(chroma_h, factor, chroma_w, factor).sum(axis=(1, 3), dtype=np.uint32)
+                plane = (blocks + factor * factor // 2) // (factor * factor)
+            out[start:start + chroma_w * chroma_h] = plane.ravel()
+        return out
+
+    def yuv_planar_to_rgb(planar: np.ndarray, width: int, height: int, out: np.ndarray = None, pix_fmt: str = "yuv444p", method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        planar = np.frombuffer(planar, dtype=np.uint8) if isinstance(planar, (bytes, bytearray, memoryview)) else np.asarray(planar, dtype=np.uint8).ravel()
+        luma_size, chroma_w, chroma_h = _planar_size(width, height, pix_fmt)
+        if planar.size != luma_size + 2 * chroma_w * chroma_h:
+            raise ValueError(f"Planar {pix_fmt} buffer for {width}x{height} must have {luma_size + 2 * chroma_w * chroma_h} bytes, got {planar.size}")
+
+        factor = PLANAR_FORMATS[pix_fmt]
+        yuv = np.empty((height, width, 3), dtype=np.uint8)
+        yuv[:, :, 0] = planar[:luma_size].reshape(height, width)
+        for i in range(2):
+            start = luma_size + i * chroma_w * chroma_h
+            plane = planar[start:start + chroma_w * chroma_h].reshape(chroma_h, chroma_w)
+            if factor > 1:
+                plane = plane.repeat(factor, axis=0).repeat(factor, axis=1)[:height, :width]
+            yuv[:, :, i + 1] = plane
+
+        return ColorTranslator.yuv_to_rgb_frame(yuv, out=out, method=method, standard=standard, full_range=full_range)
+    
     
     
+
+    
     # Exercise 3
 
     def ResizeImages(self, imagePath, outputPath, targetWidth, targetHeight):
@@ -54,25 +554,25 @@ class ColorTranslator:
 
     # Exercise 4
 
-    def Serpentine(self,imagePath) -> int:
+    def Serpentine(self, imagePath, block_size: int = None) -> bytes:
         image = Image.open(imagePath)
         data = np.array(image) 
-        height, width, _ = data.shape
-
-        # Create an array to store pixels in zig-zag diagonal order
-        serpentine = []
 
-        for d in range(width + height - 1):  # iterate over each diagonal
-            for y in range(max(0, d - width + 1), min(height, d + 1)):
-                x = d - y
-                if d % 2 == 0: # even diagonal: top to bottom
-                    serpentine.append(data[y, x])
-                else: # odd diagonal: bottom to top
-                    serpentine.append(data[height - 1 - y, width - 1 - x])  
+        # Pixels in zig-zag diagonal order (or block by block with block_size=8 for DCT coefficients)
+        serpentine = zigzag_scan(data, block_size)
 
         # Convert to bytes
-        byte_data = np.array(serpentine, dtype=np.uint8).tobytes()
-        return len(byte_data)
+        return serpentine.astype(np.uint8, copy=False).tobytes()
+
+    def InverseSerpentine(self, byteData: bytes, width: int, height: int, block_size: int = None) -> np.ndarray:
+        scanned = np.frombuffer(byteData, dtype=np.uint8)
+        channels = scanned.size // (width * height)
+        if channels * width * height != scanned.size:
+            raise ValueError(f"{scanned.size} bytes is not a whole number of {width}x{height} planes")
+
+        shape = (-1, block_size * block_size) if block_size else (width * height,)
+        scanned = scanned.reshape(*shape, channels) if channels > 1 else scanned.reshape(shape)
+        return inverse_zigzag_scan(scanned, height, width, block_size)
     
 
     # Exercise 5a
@@ -90,24 +590,48 @@ class ColorTranslator:
 
     # Exercise 5b
 
-    def run_length_encoding(self, bytes: bytes) -> list:
-        
-        i = 0
-        encoded_bytes = []
-
-        while i < len(bytes):
-            value = bytes[i] # Current byte value
-            count = 1
-            while i + count < len(bytes) and bytes[i] == bytes[i + count]: # Count occurrences
-                count += 1
-
-            encoded_bytes.append((count, value))
-            i += count
-        return encoded_bytes
+    def run_length_encoding(self, bytes: bytes, output: str = "tuples"):
+        # output: "tuples" for a list of (count, value), "arrays" for (counts, values) arrays
+        # or "packed" for the binary format of rle_pack
+        if output not in RLE_OUTPUTS:
+            raise ValueError(f"Unsupported RLE output '{output}'. Use one of: {list(RLE_OUTPUTS)}")
+
+        counts, values = rle_encode(bytes)
+        if output == "arrays":
+            return counts, values
+        if output == "packed":
+            return rle_pack(counts, values)
+        return list(zip(counts.tolist(), values.tolist()))
+
+    def run_length_decoding(self, encoded) -> bytes:
+        # Accepts any of the outputs of run_length_encoding
+        if isinstance(encoded, (bytes, bytearray, memoryview)):
+            counts, values = rle_unpack(encoded)
+        elif isinstance(encoded, tuple):
+            counts, values = encoded
+        else:
+            counts, values = zip(*encoded) if encoded else ((), ())
+        return rle_decode(counts, values).tobytes()
             
     
     # Exercise 6
     
+def _save_decoded(data: np.ndarray, save_path) -> None:
+    # Decoders only write when asked: save_path can be a path or a binary file object (JPEG)
+    if save_path is None:
+        return
+    image = Image.fromarray(np.uint8(data))
+    if isinstance(save_path, (str, os.PathLike)):
+        image.save(save_path)
+    else:
+        image.save(save_path, format="JPEG")
+
+
+def _check_decode_out(out, shape):
+    if out.shape != tuple(shape):
+        raise ValueError(f"Output buffer must have shape {tuple(shape)}, got {out.shape}")
+
+
 class DCT:
     def __init__(self):
         pass
@@ -119,13 +643,23 @@ class DCT:
         dctData = dct(dct(data.T, norm='ortho').T, norm='ortho') # 2D DCT
         return dctData
     
-    def Decode(self, dctData, save_path=None):
-        idctData = idct(idct(dctData.T, norm='ortho').T, norm='ortho') # 2D IDCT
-        idctData = np.clip(idctData, 0, 255)
-        
-        # Decoded image
-        decodedImg = Image.fromarray(np.uint8(idctData))
-        decodedImg.save("/Users/Eric/Downloads/VideoCoding/seminar_1/dct_decoded_image.jpg") # Save the decoded image
+    def _idct2(self, dctData):
+        return idct(idct(dctData.T, norm='ortho').T, norm='ortho') # 2D IDCT
+
+    def Decode(self, dctData, save_path=None, out=None, chunk_columns: int = 256):
+        # Returns the decoded array, written into out if given and saved to save_path
+        # (path or file object) if given. With an (H, W, 3) image the transform never mixes
+        # columns, so out (e.g. a numpy.memmap) is filled one strip of columns at a time
+        if out is None:
+            idctData = np.clip(self._idct2(dctData), 0, 255)
+        else:
+            _check_decode_out(out, dctData.shape)
+            step = chunk_columns if dctData.ndim == 3 else dctData.shape[1]
+            for x in range(0, dctData.shape[1], step):
+                out[:, x:x + step] = np.clip(self._idct2(dctData[:, x:x + step]), 0, 255)
+            idctData = out
+
+        _save_decoded(idctData, save_path)
         return idctData
 
     
@@ -150,7 +684,17 @@ class DWT:
 
         return encoded_coeffs
     
-    def Decode(self, coeffs, save_path=None):
+    def Decode(self, coeffs, save_path=None, out=None):
+        # Returns the decoded array, written into out if given (e.g. a numpy.memmap, one
+        # channel at a time) and saved to save_path (path or file object) if given
+        if out is not None:
+            for i, channel_coeffs in enumerate(coeffs):
+                reconstructed = pywt.waverec2(channel_coeffs, wavelet=self.wavelet) # 2D IDWT
+                # waverec2 can add a row/column for odd sizes, out has the size the caller wants
+                out[:, :, i] = np.clip(reconstructed[:out.shape[0], :out.shape[1]], 0, 255)
+            _save_decoded(out, save_path)
+            return out
+
         decoded_channels = []
         for channel_coeffs in coeffs:
             reconstructed = pywt.waverec2(channel_coeffs, wavelet=self.wavelet) # 2D IDWT
@@ -158,8 +702,5 @@ class DWT:
             decoded_channels.append(reconstructed)
 
         idwtData = np.stack(decoded_channels, axis=-1)  # Reconstruct the image from channels
-        
-        # Decoded image
-        decodedImg = Image.fromarray(np.uint8(idwtData))
-        decodedImg.save("/Users/Eric/Downloads/VideoCoding/seminar_1/dwt_decoded_image.jpg") # Save the decoded image
-        return idwtData
\ No newline at end of file
+        _save_decoded(idwtData, save_path)
+        return idwtData
@@ -1,9 +1,34 @@
 import pytest
-from httpx import AsyncClient
+from httpx import AsyncClient, ASGITransport
 import numpy as np
+from PIL import Image
+import asyncio
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from fastapi import HTTPException, UploadFile
 
-from services import rgb_to_yuv_service, yuv_to_rgb_service, run_length_encoding
-from main import app 
+from services import ColorTranslator, RunLengthStreamEncoder, RunLengthStreamDecoder
+from first_practice import app, metadata_cache, packaged_ladder_args, packaged_rung_bytes, rgb_to_yuv_service, yuv_to_rgb_service
+from jobs import JobQueue, MemoryJobStore, SQLiteJobStore, QueueFullError, new_job
+from uploads import save_upload, resolve_shared_path, UploadSizeLimit, FORM_OVERHEAD_BYTES
+from fastapi import FastAPI, Request
+from cache import ResultCache, cache_key
+import metadata
+from metadata import summarize
+import chunked
+from ffmpeg_runner import Scheduler, SchedulerBusyError, encoded_frames, encode_stats
+from profiles import profile_args
+from delivery import not_modified_since
+
+# The async tests run on asyncio with the anyio pytest plugin
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def client():
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
 
 # Unit tests for the services functions
 
@@ -25,16 +50,325 @@ def test_rgb_to_yuv_service():
 
 def test_run_length_encoding():
     data = bytes([255, 255, 255, 0, 0, 128, 128])
-    rle = run_length_encoding(data)
+    rle = ColorTranslator().run_length_encoding(data)
 
     # Assert the RLE output is as expected
     assert rle == [(3, 255), (2, 0), (2, 128)]
 
-@pytest.mark.asyncio
+def test_run_length_stream_feed_is_eager():
+    # Feeding without using the result still counts the data
+    data = b"aaab" * 100
+    encoder = RunLengthStreamEncoder()
+    encoder.feed(data)
+    packed = b"".join(encoder.close())
+    assert packed == ColorTranslator().run_length_encoding(data, output="packed")
+    assert b"".join(RunLengthStreamDecoder().feed(packed)) == data
+
+def test_serpentine(tmp_path):
+    # Every pixel exactly once, and back to raster order
+    image = np.random.default_rng(0).integers(0, 256, (5, 7, 3), dtype=np.uint8)
+    Image.fromarray(image).save(tmp_path / "image.png")
+    translator = ColorTranslator()
+    scanned = translator.Serpentine(str(tmp_path / "image.png"))
+    assert len(scanned) == image.size
+    assert np.array_equal(translator.InverseSerpentine(scanned, 7, 5), image)
+
+@pytest.mark.anyio
 async def test_api_rgb_to_yuv_success():
-    async with AsyncClient(app=app, base_url="http://test") as ac:
+    async with client() as ac:
         response = await ac.post("/convert/rgb_to_yuv/", json={"R": 255, "G": 0, "B": 0})
     
     assert response.status_code == 200
     # Verify the returned YUV values for pure red
-    assert response.json() == {'Y': 68, 'U': 85, 'V': 255}
\ No newline at end of file
+    assert response.json() == {'Y': 82, 'U': 90, 'V': 240}
+
+@pytest.mark.anyio
+async def test_api_rgb_to_yuv_batch():
+    async with client() as ac:
+        response = await ac.post("/convert/rgb_to_yuv/batch/", json={"pixels": [[255, 0, 0], [0, 0, 0]]})
+
+    assert response.status_code == 200
+    # Same values as the single pixel endpoint
+    assert response.json() == {"count": 2, "pixels": [[82, 90, 240], [16, 128, 128]]}
+
+@pytest.mark.anyio
+async def test_api_health():
+    async with client() as ac:
+        response = await ac.get("/health/")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+    assert response.json()["ffmpeg"]["ffmpeg"]["limit"] >= 1
+
+@pytest.mark.anyio
+async def test_job_queue():
+    queue = JobQueue(workers=1, max_queued=4)
+
+    async def work(progress):
+        progress(0.5)
+        return {"answer": 42}
+
+    job = queue.submit("test", work)
+    assert job["status"] == "queued"
+
+    await queue.queue.join()
+    finished = queue.get(job["id"])
+    assert finished["status"] == "done"
+    assert finished["progress"] == 1.0
+    assert finished["result"] == {"answer": 42}
+
+    # Cancelling a queued job frees its place at once
+    idle = JobQueue(workers=0, max_queued=1)
+    waiting = idle.submit("test", work)
+    with pytest.raises(QueueFullError):
+        idle.submit("test", work)
+    idle.cancel(waiting["id"])
+    assert idle.submit("test", work)["status"] == "queued"
+
+    # Finished jobs are forgotten after the TTL
+    store = MemoryJobStore(ttl_seconds=0)
+    store.create({**finished, "finished_at": 0})
+    assert store.list() == []
+
+def test_sqlite_job_store_recover(tmp_path):
+    # Opening a shared store leaves the jobs of other processes alone, recover() fails
+    # only the jobs this process does not own
+    path = str(tmp_path / "jobs.db")
+    SQLiteJobStore(path).create({**new_job("test"), "owner": "other"})
+    mine = new_job("test")
+    store = SQLiteJobStore(path)
+    store.create(mine)
+    assert [job["status"] for job in store.list()] == ["queued", "queued"]
+
+    assert store.recover() == 1
+    assert store.get(mine["id"])["status"] == "queued"
+    assert sorted(job["status"] for job in store.list()) == ["failed", "queued"]
+
+@pytest.mark.anyio
+async def test_save_upload(tmp_path):
+    data = bytes(range(256)) * 100
+    upload = UploadFile(io.BytesIO(data))
+    saved = await save_upload(upload, str(tmp_path / "upload.bin"), chunk_size=1000, hash_algorithm="sha256")
+
+    assert saved["size_bytes"] == len(data)
+    assert saved["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "upload.bin").read_bytes() == data
+
+    # Over the limit: 413 and no file left behind
+    with pytest.raises(HTTPException) as error:
+        await save_upload(UploadFile(io.BytesIO(data)), str(tmp_path / "big.bin"), max_bytes=1000, chunk_size=100)
+    assert error.value.status_code == 413
+    assert not (tmp_path / "big.bin").exists()
+
+@pytest.mark.anyio
+async def test_upload_size_limit():
+    limited = FastAPI()
+
+    @limited.post("/body/")
+    async def body(request: Request):
+        return {"size": len(await request.body())}
+
+    app_limited = UploadSizeLimit(limited, max_bytes=1000)
+    limit = 1000 + FORM_OVERHEAD_BYTES
+    async with AsyncClient(transport=ASGITransport(app=app_limited), base_url="http://test") as ac:
+        assert (await ac.post("/body/", content=b"x" * 100)).json() == {"size": 100}
+        # Refused by its Content-Length, or while it arrives when it has none
+        assert (await ac.post("/body/", content=b"x" * (limit + 1))).status_code == 413
+
+        async def chunks():
+            for _ in range(limit // 1000 + 2):
+                yield b"x" * 1000
+        assert (await ac.post("/body/", content=chunks())).status_code == 413
+
+@pytest.mark.anyio
+async def test_result_cache(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    calls = []
+
+    async def produce(output_dir):
+        calls.append(output_dir)
+        (tmp_path / os.path.basename(output_dir) / "out.mp4").write_bytes(b"video")
+        return {"file": "out.mp4"}
+
+    # Identical concurrent requests run the work once, parameter order does not matter
+    first, second = await asyncio.gather(
+        cache.get_or_create("abc", "resize", {"width": 2, "height": 2}, produce),
+        cache.get_or_create("abc", "resize", {"height": 2, "width": 2}, produce)
+    )
+    assert (first["cache"], second["cache"]) == ("miss", "shared")
+    assert (await cache.get_or_create("abc", "resize", {"width": 2, "height": 2}, produce))["cache"] == "hit"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+    # The source is released when the work ends, not when its requester goes away
+    released = []
+    started = asyncio.Event()
+
+    async def slow_produce(output_dir):
+        started.set()
+        await asyncio.sleep(0.05)
+        assert not released
+        return {"file": "out.mp4"}
+
+    requester = asyncio.create_task(cache.get_or_create("def", "resize", {}, slow_produce, release=lambda: released.append(1)))
+    await started.wait()
+    requester.cancel()
+    assert (await cache.get_or_create("def", "resize", {}, slow_produce))["cache"] == "shared"
+    assert released == [1]
+
+    # Uses are saved: the LRU order survives a restart
+    last_used = cache.entries[cache_key("abc", "resize", {"width": 2, "height": 2})]["last_used"]
+    assert ResultCache(str(tmp_path)).entries[cache_key("abc", "resize", {"width": 2, "height": 2})]["last_used"] == last_used
+
+def test_metadata_summary():
+    # Audio first: the video fields come from the first video stream, not from streams[0]
+    info = {
+        "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "10.0", "size": "1000"},
+        "streams": [
+            {"index": 0, "codec_type": "audio", "codec_name": "aac", "channels": 2},
+            {"index": 1, "codec_type": "video", "codec_name": "h264", "width": 640, "height": 360},
+        ]
+    }
+    summary = summarize(info)
+    assert (summary["width"], summary["height"]) == (640, 360)
+    assert summary["num_streams"] == 2
+    assert summary["streams"][0]["channels"] == 2
+    assert summarize({"format": {}, "streams": []})["width"] is None
+
+@pytest.mark.anyio
+async def test_metadata_cache_keeps_full_info(monkeypatch):
+    # Fields left out of the summary are still answered from the cache, without a new probe
+    info = {
+        "format": {"format_name": "matroska,webm", "tags": {"title": "clip"}},
+        "streams": [{"index": 0, "codec_type": "video", "codec_name": "vp9", "width": 640, "height": 360,
+                     "color_space": "bt709", "disposition": {"default": 1}}]
+    }
+    probes = []
+
+    async def fake_probe(path, **kwargs):
+        probes.append(path)
+        return info
+
+    monkeypatch.setattr(metadata_cache, "entries", OrderedDict())
+    monkeypatch.setattr(metadata, "probe", fake_probe)
+    assert (await metadata_cache.get("clip.webm", content_hash="abc"))["width"] == 640
+
+    async with client() as ac:
+        detail = (await ac.get("/metadata/abc", params={"stream": 0})).json()
+        full = (await ac.get("/metadata/abc", params={"full": True})).json()
+        summary = (await ac.get("/metadata/abc")).json()
+    assert detail["color_space"] == "bt709" and detail["disposition"] == {"default": 1}
+    assert full["format"]["tags"] == {"title": "clip"}
+    assert summary["num_streams"] == 1
+    assert probes == ["clip.webm"]
+
+def test_packaged_ladder_audio_once(tmp_path):
+    # Two rungs share one audio rendition, in HLS through the audio group of the variants
+    ladder = [{"width": 1280, "height": 720, "bitrate": "3M"}, {"width": 640, "height": 360, "bitrate": "1M"}]
+    for packaging in ("hls", "dash"):
+        args = packaged_ladder_args(ladder, [2, 1], True, str(tmp_path), packaging, 4.0)
+        assert args.count("0:a:0") == 1
+    args_hls = packaged_ladder_args(ladder, [2, 1], True, str(tmp_path), "hls", 4.0)
+    stream_map = args_hls[args_hls.index("-var_stream_map") + 1]
+    assert stream_map == "a:0,agroup:aud,name:audio v:0,agroup:aud,name:0 v:1,agroup:aud,name:1"
+
+def test_packaged_rung_bytes(tmp_path):
+    # The size of a rung counts only its own segments
+    for name, size in [("init_0.m4s", 10), ("chunk_0_00001.m4s", 100), ("chunk_1_00001.m4s", 50), ("manifest.mpd", 5)]:
+        (tmp_path / name).write_bytes(b"x" * size)
+    assert packaged_rung_bytes(str(tmp_path), "dash", 0) == 110
+    assert packaged_rung_bytes(str(tmp_path), "dash", 1) == 50
+    (tmp_path / "stream_0").mkdir()
+    (tmp_path / "stream_0" / "segment_00000.m4s").write_bytes(b"x" * 7)
+    assert packaged_rung_bytes(str(tmp_path), "hls", 0) == 7
+
+def test_resolve_shared_path(tmp_path):
+    (tmp_path / "video.mp4").write_bytes(b"video")
+    assert resolve_shared_path("video.mp4", str(tmp_path)) == str(tmp_path / "video.mp4")
+    assert resolve_shared_path("/files/video.mp4", str(tmp_path)) == str(tmp_path / "video.mp4")
+
+    # Nothing outside the shared folder, nor missing files
+    for reference, status_code in (("../video.mp4", 400), ("/etc/passwd", 400), ("missing.mp4", 404)):
+        with pytest.raises(HTTPException) as error:
+            resolve_shared_path(reference, str(tmp_path))
+        assert error.value.status_code == status_code
+
+@pytest.mark.anyio
+async def test_chunked_encode(tmp_path, monkeypatch):
+    commands = []
+    segment_count = 3
+
+    # Stands in for ffmpeg: the split makes segment_count segments, every other command its output file
+    async def fake_ffmpeg(cmd, check=True, priority="normal"):
+        commands.append(cmd)
+        if "segment" in cmd:
+            for i in range(segment_count):
+                (tmp_path / os.path.basename(os.path.dirname(cmd[-1])) / f"source_{i:05d}.mkv").write_bytes(b"")
+        else:
+            open(cmd[-1], "wb").close()
+        return 0, b"", b""
+
+    monkeypatch.setattr(chunked, "run_ffmpeg", fake_ffmpeg)
+    output = str(tmp_path / "out.mp4")
+    result = await chunked.chunked_encode("in.mp4", output, lambda threads: ["-c:v", "libx265"], workers=2, segment_seconds=5)
+
+    # Split, one encode per segment, then a stream copy join; the temporary folder is removed
+    assert result["segments"] == 3
+    assert len(commands) == 5
+    assert commands[-1][commands[-1].index("-c:v") + 1] == "copy"
+    assert os.listdir(tmp_path) == ["out.mp4"]
+
+    # A single segment (keyframes too far apart) is encoded directly, without a join
+    commands.clear()
+    segment_count = 1
+    result = await chunked.chunked_encode("in.mp4", output, lambda threads: ["-c:v", "libx265"], workers=2, segment_seconds=5)
+    assert (result["segments"], result["fallback"]) == (1, "direct")
+    assert len(commands) == 2
+    assert commands[-1][commands[-1].index("-i") + 1] == "in.mp4"
+    assert os.listdir(tmp_path) == ["out.mp4"]
+
+    # Quotes in the paths of the concat list are escaped
+    assert chunked.concat_entry("/shared/it's.mkv") == "file '/shared/it'\\''s.mkv'\n"
+
+@pytest.mark.anyio
+async def test_scheduler_priorities():
+    scheduler = Scheduler(cpu_budget=4, max_waiting=2, limits={"ffmpeg": 4, "ffprobe": 4})
+    started = []
+
+    async def process(name, threads, priority, kind="ffmpeg"):
+        async with scheduler.slot(kind, threads, priority):
+            started.append(name)
+            await asyncio.sleep(0.01)
+
+    # The first encode takes the whole budget, the others wait and start by priority
+    first = asyncio.create_task(process("first", 4, "batch"))
+    await asyncio.sleep(0)
+    waiting = [asyncio.create_task(process("av1", 2, "batch")), asyncio.create_task(process("resize", 2, "normal"))]
+    await asyncio.sleep(0)
+    with pytest.raises(SchedulerBusyError):
+        await process("refused", 1, "normal")
+    waiting.append(asyncio.create_task(process("probe", 1, "interactive", "ffprobe")))
+
+    await asyncio.gather(first, *waiting)
+    assert started == ["first", "probe", "resize", "av1"]
+    assert scheduler.status()["cpu"]["used"] == 0
+
+def test_encoding_profiles():
+    assert profile_args("libaom-av1", "realtime") == ["-usage", "realtime", "-cpu-used", "8"]
+    assert profile_args("libx265", "fast", stream="v") == ["-preset:v", "veryfast"]
+    assert profile_args("aac", "archive") == []
+    with pytest.raises(ValueError):
+        profile_args("libx264", "turbo")
+
+    # Achieved speed from the last frame= key of ffmpeg's -progress output
+    frames = encoded_frames(b"frame=10\nfps=0.00\nprogress=continue\nframe=250\nfps=50.00\nprogress=end\n")
+    assert encode_stats(frames, 5.0) == {"frames": 250, "seconds": 5.0, "fps": 50.0}
+
+def test_not_modified_since():
+    # Compared as dates, in whole seconds, not as strings
+    mtime = 784111777.5  # Sun, 06 Nov 1994 08:49:37 GMT
+    assert not_modified_since("Sun, 06 Nov 1994 08:49:37 GMT", mtime)
+    assert not_modified_since("Mon, 07 Nov 1994 08:49:37 GMT", mtime)
+    assert not_modified_since("Sunday, 06-Nov-94 08:49:37 GMT", mtime)
+    assert not not_modified_since("Sat, 05 Nov 1994 08:49:37 GMT", mtime)
+    assert not not_modified_since("yesterday", mtime)
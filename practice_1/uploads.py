@@ -0,0 +1,102 @@
+import hashlib
+import os
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+
+# Uploads are copied to disk in chunks, so a request never holds more than one chunk of
+# the file in memory, whatever its size
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1 << 20))  # 1 MiB
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 8 << 30))  # 8 GiB
+# Room for the multipart boundaries and the other form fields around the file
+FORM_OVERHEAD_BYTES = 64 << 10
+
+
+def check_upload_size(size: int, max_bytes: int = MAX_UPLOAD_BYTES):
+    if size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Upload too large, the limit is {max_bytes} bytes")
+
+
+class UploadSizeLimit:
+    # ASGI middleware refusing request bodies over the limit before the multipart parser
+    # spools them to disk: right away when the Content-Length is too large, otherwise as soon
+    # as the data received goes over (chunked transfers, or a lying Content-Length)
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes + FORM_OVERHEAD_BYTES
+
+    def _error(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Upload too large, the limit is {self.max_bytes - FORM_OVERHEAD_BYTES} bytes")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            error = self._error()
+            response = JSONResponse(status_code=error.status_code, content={"detail": error.detail}, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self._error()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def save_upload(file: UploadFile, path: str, max_bytes: int = MAX_UPLOAD_BYTES,
+                      chunk_size: int = UPLOAD_CHUNK_SIZE, hash_algorithm: str = None) -> dict:
+    # Streams file to path. Returns the size and, with hash_algorithm (e.g. "sha256"), the
+    # hex digest computed on the way. Too large uploads raise a 413 and leave no file behind
+    if file.size is not None:
+        check_upload_size(file.size, max_bytes)  # Known before reading anything
+    digest = hashlib.new(hash_algorithm) if hash_algorithm else None
+
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while chunk := await file.read(chunk_size):
+                size += len(chunk)
+                check_upload_size(size, max_bytes)
+                if digest is not None:
+                    digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    saved = {"path": path, "size_bytes": size}
+    if digest is not None:
+        saved[hash_algorithm] = digest.hexdigest()
+    return saved
+
+
+def resolve_shared_path(reference: str, root: str) -> str:
+    # Absolute path of a file referenced relative to root (or as an absolute path in it, or as
+    # its /files/ download URL). Anything that resolves outside root, symlinks included, is refused
+    if reference.startswith("/files/"):
+        reference = reference[len("/files/"):]
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, reference))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=400, detail=f"shared_file must be inside {root}")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"No file {reference} in the shared volume")
+    return path
+
+
+def file_identity(path: str) -> str:
+    # Stands for the content of a file without reading it: it changes when the file is rewritten
+    stat = os.stat(path)
+    return f"path:{path}:{stat.st_size}:{stat.st_mtime_ns}"
@@ -4,11 +4,443 @@ from PIL import Image
 from scipy.fftpack import dct, idct
 import os
 import unittest
+import tempfile
+import struct
 import pywt
+import functools
+import time
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Folder of this file, where the example images are
+SEMINAR_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# BT.601 coefficients of rgb_to_yuv / yuv_to_rgb scaled by 1000, so the frame
+# methods can do the same conversion with integer (fixed-point) math
+FIXED_POINT_SCALE = 1000
+RGB_TO_YUV_COEFFS = np.array([[257, 504, 98],      # Y
+                              [-148, -291, 439],   # U
+                              [439, -368, -71]],   # V
+                             dtype=np.int32)
+RGB_TO_YUV_OFFSETS = np.array([16, 128, 128], dtype=np.int32)
+YUV_TO_RGB_COEFFS = np.array([[1164, 0, 1596],     # R (columns: Y-16, U-128, V-128)
+                              [1164, -391, -813],  # G
+                              [1164, 2018, 0]],    # B
+                             dtype=np.int32)
+YUV_TO_RGB_OFFSETS = np.array([16, 128, 128], dtype=np.int32)
+
+# Planar layouts supported by the frame methods: chroma subsampling factor
+PLANAR_FORMATS = {"yuv444p": 1, "yuv420p": 2}
+
+# Luma weights (Kr, Kb) of the standards the frame methods can convert with
+COLOR_STANDARDS = {"bt601": (0.299, 0.114), "bt709": (0.2126, 0.0722)}
+CONVERSION_METHODS = ("float", "fixed", "lut")
+LUT_SHIFT = 16  # Fractional bits of the lookup table entries
+
+
+def _rgb_to_yuv_float(R, G, B):
+    # Shared by the scalar path and the fixed-point tie fallback so both give the same floats
+    Y = 0.257 * R + 0.504 * G + 0.098 * B + 16
+    U = -0.148 * R - 0.291 * G + 0.439 * B + 128
+    V = 0.439 * R - 0.368 * G - 0.071 * B + 128
+    return Y, U, V
+
+
+def _yuv_to_rgb_float(Y, U, V):
+    R = 1.164 * (Y - 16) + 1.596 * (V - 128)
+    G = 1.164 * (Y - 16) - 0.813 * (V - 128) - 0.391 * (U - 128)
+    B = 1.164 * (Y - 16) + 2.018 * (U - 128)
+    return R, G, B
+
+
+@functools.lru_cache(maxsize=None)
+def color_matrices(standard: str = "bt601", full_range: bool = False) -> tuple:
+    # (RGB->YUV matrix, YUV offsets, YUV->RGB matrix), the inverse is applied to YUV minus the offsets
+    if standard not in COLOR_STANDARDS:
+        raise ValueError(f"Unsupported color standard '{standard}'. Use one of: {list(COLOR_STANDARDS)}")
+
+    if standard == "bt601" and not full_range:
+        # Same rounded coefficients as rgb_to_yuv / yuv_to_rgb
+        forward = RGB_TO_YUV_COEFFS / FIXED_POINT_SCALE
+        inverse = YUV_TO_RGB_COEFFS / FIXED_POINT_SCALE
+        offsets = RGB_TO_YUV_OFFSETS.astype(np.float64)
+    else:
+        kr, kb = COLOR_STANDARDS[standard]
+        kg = 1 - kr - kb
+        forward = np.array([[kr, kg, kb],
+                            [-kr / (2 * (1 - kb)), -kg / (2 * (1 - kb)), 0.5],
+                            [0.5, -kg / (2 * (1 - kr)), -kb / (2 * (1 - kr))]])
+        if full_range:
+            offsets = np.array([0.0, 128.0, 128.0])
+        else:
+            forward *= np.array([[219 / 255], [224 / 255], [224 / 255]])
+            offsets = np.array([16.0, 128.0, 128.0])
+        inverse = np.linalg.inv(forward)
+
+    # Cached and shared between calls
+    for matrix in (forward, offsets, inverse):
+        matrix.setflags(write=False)
+    return forward, offsets, inverse
+
+
+@functools.lru_cache(maxsize=None)
+def _conversion_luts(direction: str, standard: str, full_range: bool) -> np.ndarray:
+    # luts[c][v] holds what input channel c with value v adds to each of the 3 outputs,
+    # so a conversion is 3 table gathers and 2 integer adds per pixel
+    forward, offsets, inverse = color_matrices(standard, full_range)
+    values = np.arange(256, dtype=np.float64)
+
+    if direction == "rgb_to_yuv":
+        luts = values[None, :, None] * forward.T[:, None, :]
+        luts[0] += offsets + 0.5  # Offsets and rounding folded into the first table
+    else:
+        luts = (values[None, :, None] - offsets[:, None, None]) * inverse.T[:, None, :]
+
+    luts = np.round(luts * (1 << LUT_SHIFT)).astype(np.int32)
+    luts.setflags(write=False)
+    return luts
+
+
+def _lut_convert(pixels, luts):
+    acc = np.take(luts[0], pixels[:, 0], axis=0)
+    acc += np.take(luts[1], pixels[:, 1], axis=0)
+    acc += np.take(luts[2], pixels[:, 2], axis=0)
+    acc >>= LUT_SHIFT
+    return acc
+
+
+@functools.lru_cache(maxsize=16)
+def zigzag_indices(height: int, width: int, block_size: int = None) -> np.ndarray:
+    # Flat indices of a (height, width) array in zig-zag order, computed once per shape.
+    # With block_size, each block is scanned on its own (DCT coefficient order) and the
+    # result has shape (n_blocks, block_size**2) with the blocks in raster order
+    if block_size:
+        if height % block_size or width % block_size:
+            raise ValueError(f"A {height}x{width} array can not be split in {block_size}x{block_size} blocks")
+        block_order = zigzag_indices(block_size, block_size).astype(np.int64)
+        block_y, block_x = np.divmod(block_order, block_size)
+        origin_y, origin_x = np.meshgrid(np.arange(0, height, block_size), np.arange(0, width, block_size), indexing="ij")
+        order = (origin_y.reshape(-1, 1) + block_y) * width + origin_x.reshape(-1, 1) + block_x
+    else:
+        y, x = np.indices((height, width)).reshape(2, -1)
+        diagonal = y + x
+        # Odd diagonals go from top to bottom and even ones from bottom to top, as in JPEG
+        order = np.lexsort((np.where(diagonal % 2 == 1, y, -y), diagonal))
+
+    order = order.astype(np.int32 if height * width < 2**31 else np.int64)
+    order.setflags(write=False)
+    return order
+
+
+def zigzag_scan(data: np.ndarray, block_size: int = None) -> np.ndarray:
+    # (H, W) or (H, W, C) array -> pixels in zig-zag order, one gather with the cached indices
+    data = np.asarray(data)
+    height, width = data.shape[:2]
+    order = zigzag_indices(height, width, block_size)
+    return data.reshape(height * width, *data.shape[2:])[order]
+
+
+def inverse_zigzag_scan(scanned: np.ndarray, height: int, width: int, block_size: int = None) -> np.ndarray:
+    # Puts the output of zigzag_scan back in raster order
+    scanned = np.asarray(scanned)
+    channels = scanned.shape[2:] if block_size else scanned.shape[1:]
+    order = zigzag_indices(height, width, block_size)
+    data = np.empty((height * width, *channels), dtype=scanned.dtype)
+    data[order.ravel()] = scanned.reshape(height * width, *channels)
+    return data.reshape(height, width, *channels)
+
+
+def _check_method(method, standard, full_range):
+    if method not in CONVERSION_METHODS:
+        raise ValueError(f"Unsupported conversion method '{method}'. Use one of: {list(CONVERSION_METHODS)}")
+    if method == "fixed" and (standard != "bt601" or full_range):
+        raise ValueError("The fixed-point method only implements the BT.601 limited range coefficients of rgb_to_yuv")
+
+
+def _check_frame_out(out, shape):
+    if out is None:
+        return np.empty(shape, dtype=np.uint8)
+    if out.shape != shape or out.dtype != np.uint8:
+        raise ValueError(f"Output buffer must be uint8 with shape {shape}, got {out.dtype} {out.shape}")
+    return out
+
+
+def _planar_size(width, height, pix_fmt):
+    if pix_fmt not in PLANAR_FORMATS:
+        raise ValueError(f"Unsupported pixel format '{pix_fmt}'. Use one of: {list(PLANAR_FORMATS)}")
+    factor = PLANAR_FORMATS[pix_fmt]
+    chroma_w = -(-width // factor)
+    chroma_h = -(-height // factor)
+    return width * height, chroma_w, chroma_h
+
+
+# Packed RLE format: RLE_MAGIC followed by blocks of at most RLE_BLOCK_RUNS runs, each one
+# varint(number of runs) + one byte per run value + varint(count) per run
+RLE_MAGIC = b"RLE1"
+RLE_BLOCK_RUNS = 1 << 16
+RLE_OUTPUTS = ("tuples", "arrays", "packed")
+
+
+def _as_byte_array(data) -> np.ndarray:
+    # bytes, bytearray and memoryview are wrapped without copying
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(data, dtype=np.uint8)
+    return np.asarray(data, dtype=np.uint8).ravel()
+
+
+def rle_encode(data) -> tuple:
+    # (counts, values) arrays, the run boundaries come from one comparison over the whole input
+    values = _as_byte_array(data)
+    if values.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+
+    starts = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], starts))
+    counts = np.diff(starts, append=values.size)
+    return counts, values[starts]
+
+
+def rle_decode(counts, values) -> np.ndarray:
+    return np.repeat(np.asarray(values, dtype=np.uint8), np.asarray(counts, dtype=np.int64))
+
+
+def _varint_encode(numbers: np.ndarray) -> np.ndarray:
+    # LEB128: 7 bits per byte, the high bit tells that more bytes follow
+    numbers = np.asarray(numbers, dtype=np.uint64)
+    sizes = np.ones(numbers.size, dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += numbers >= np.uint64(1 << shift)
+
+    ends = np.cumsum(sizes)
+    encoded = np.empty(ends[-1] if numbers.size else 0, dtype=np.uint8)
+    starts = ends - sizes
+    for k in range(int(sizes.max()) if numbers.size else 0):
+        present = sizes > k
+        byte = (numbers[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= (sizes[present] > k + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[present] + k] = byte
+    return encoded
+
+
+def _varint_decode(data: np.ndarray, count: int) -> tuple:
+    # Decodes count varints from the start of data: (numbers, bytes used)
+    if count == 0:
+        return np.empty(0, dtype=np.int64), 0
 
+    ends = np.flatnonzero(data[:10 * count] < 0x80)[:count]
+    if ends.size < count:
+        raise ValueError("Truncated RLE data")
 
+    used = int(ends[-1]) + 1
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(used) - np.repeat(starts, ends - starts + 1))
+    payload = (data[:used].astype(np.uint64) & np.uint64(0x7F)) << shifts.astype(np.uint64)
+    return np.add.reduceat(payload, starts).astype(np.int64), used
 
 
+def _rle_pack_block(counts, values) -> bytes:
+    header = _varint_encode([len(counts)])
+    return header.tobytes() + np.asarray(values, dtype=np.uint8).tobytes() + _varint_encode(counts).tobytes()
+
+
+def _rle_unpack_block(data: np.ndarray, position: int) -> tuple:
+    (n_runs,), used = _varint_decode(data[position:position + 10], 1)
+    position += used
+    values = data[position:position + n_runs]
+    if values.size < n_runs:
+        raise ValueError("Truncated RLE data")
+    counts, used = _varint_decode(data[position + n_runs:], n_runs)
+    return counts, values, position + n_runs + used
+
+
+def rle_pack(counts, values) -> bytes:
+    blocks = [RLE_MAGIC]
+    for start in range(0, len(counts), RLE_BLOCK_RUNS):
+        blocks.append(_rle_pack_block(counts[start:start + RLE_BLOCK_RUNS], values[start:start + RLE_BLOCK_RUNS]))
+    return b"".join(blocks)
+
+
+def rle_unpack(packed) -> tuple:
+    data = _as_byte_array(packed)
+    if data[:len(RLE_MAGIC)].tobytes() != RLE_MAGIC:
+        raise ValueError("Data is not in the packed RLE format")
+
+    position = len(RLE_MAGIC)
+    counts, values = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.uint8)]
+    while position < data.size:
+        block_counts, block_values, position = _rle_unpack_block(data, position)
+        counts.append(block_counts)
+        values.append(block_values)
+    return np.concatenate(counts), np.concatenate(values)
+
+
+class RunLengthStreamEncoder:
+    # Incremental rle_pack: feed() chunks of any size, each call returns the list of packed
+    # blocks it finished (the state is updated even if the result is thrown away, and the
+    # magic goes out with the first block, so a stream under one block comes whole from close()).
+    # The open run is carried over chunk boundaries and blocks are cut every RLE_BLOCK_RUNS runs,
+    # so the concatenated output is byte-identical to rle_pack on the whole input
+
+    def __init__(self):
+        self._counts = []
+        self._values = []
+        self._pending = 0  # Closed runs not yet packed
+        self._open_count = 0
+        self._open_value = 0
+        self._started = False
+
+    def feed(self, chunk) -> list:
+        counts, values = rle_encode(chunk)
+        if counts.size == 0:
+            return []
+
+        if self._open_count and values[0] == self._open_value:
+            counts[0] += self._open_count
+        elif self._open_count:
+            self._add_runs([self._open_count], [self._open_value])
+
+        # The last run may continue in the next chunk
+        self._open_count, self._open_value = int(counts[-1]), int(values[-1])
+        self._add_runs(counts[:-1], values[:-1])
+        return self._blocks()
+
+    def close(self) -> list:
+        if self._open_count:
+            self._add_runs([self._open_count], [self._open_value])
+            self._open_count = 0
+        blocks = self._blocks(final=True)
+        if not self._started:
+            self._started = True
+            blocks.insert(0, RLE_MAGIC)  # Empty stream (or everything in the last block)
+        return blocks
+
+    def _add_runs(self, counts, values):
+        if len(counts):
+            self._counts.append(np.asarray(counts, dtype=np.int64))
+            self._values.append(np.asarray(values, dtype=np.uint8))
+            self._pending += len(counts)
+
+    def _blocks(self, final=False) -> list:
+        # Packs the full blocks, and with final also the last partial one
+        if self._pending < RLE_BLOCK_RUNS and not (final and self._pending):
+            return []
+        counts, values = np.concatenate(self._counts), np.concatenate(self._values)
+        blocks, position = [], 0
+        while counts.size - position >= RLE_BLOCK_RUNS or (final and position < counts.size):
+            stop = min(position + RLE_BLOCK_RUNS, counts.size)
+            blocks.append(_rle_pack_block(counts[position:stop], values[position:stop]))
+            position = stop
+        self._counts, self._values = [counts[position:]], [values[position:]]
+        self._pending = counts.size - position
+        if blocks and not self._started:
+            self._started = True
+            blocks.insert(0, RLE_MAGIC)
+        return blocks
+
+
+class RunLengthStreamDecoder:
+    # Mirror of RunLengthStreamEncoder: feed() packed data in chunks of any size, each call
+    # returns the list of decoded pieces, of at most max_output bytes each
+
+    def __init__(self, max_output: int = 1 << 20):
+        self.max_output = max_output
+        self._buffer = bytearray()
+        self._checked_magic = False
+
+    def feed(self, chunk) -> list:
+        self._buffer += chunk
+        if not self._checked_magic:
+            if len(self._buffer) < len(RLE_MAGIC):
+                return []
+            if self._buffer[:len(RLE_MAGIC)] != RLE_MAGIC:
+                raise ValueError("Data is not in the packed RLE format")
+            del self._buffer[:len(RLE_MAGIC)]
+            self._checked_magic = True
+
+        # Decode every complete block, a partial one waits for the next chunk
+        data = np.frombuffer(bytes(self._buffer), dtype=np.uint8)
+        pieces, position = [], 0
+        while position < data.size:
+            try:
+                counts, values, end = _rle_unpack_block(data, position)
+            except ValueError:
+                break
+            pieces.extend(self._expand(counts, values))
+            position = end
+        del self._buffer[:position]
+        return pieces
+
+    def close(self) -> list:
+        # Data left in the buffer is an incomplete block
+        if self._buffer or not self._checked_magic:
+            raise ValueError("Truncated RLE data")
+        return []
+
+    def _expand(self, counts, values):
+        # Long runs are split so no piece is bigger than max_output
+        ends = np.cumsum(counts)
+        emitted, position = 0, 0
+        while position < counts.size:
+            stop = int(np.searchsorted(ends, emitted + self.max_output, side="right"))
+            if stop == position:
+                size = min(self.max_output, int(ends[position]) - emitted)
+                yield np.full(size, values[position], dtype=np.uint8).tobytes()
+                emitted += size
+                if emitted == ends[position]:
+                    position += 1
+            else:
+                piece = counts[position:stop].copy()
+                piece[0] = ends[position] - emitted
+                yield np.repeat(values[position:stop], piece).tobytes()
+                emitted, position = int(ends[stop - 1]), stop
+
+
+def rle_encode_stream(chunks):
+    # Packed RLE of an iterable of chunks, with memory bounded by the chunk size
+    encoder = RunLengthStreamEncoder()
+    for chunk in chunks:
+        yield from encoder.feed(chunk)
+    yield from encoder.close()
+
+
+def rle_decode_stream(chunks, max_output: int = 1 << 20):
+    decoder = RunLengthStreamDecoder(max_output)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+def benchmark_color_conversion(width: int = 1920, height: int = 1080, repeat: int = 5) -> dict:
+    # Throughput in megapixels per second of each conversion method on a random frame
+    translator = ColorTranslator()
+    frame = np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    out = np.empty_like(frame)
+    results = {}
+
+    # The scalar functions are timed on a sample, the full frame would take minutes
+    sample = frame.reshape(-1, 3)[:20000].tolist()
+    results["scalar"] = {}
+    for name, convert in (("rgb_to_yuv", translator.rgb_to_yuv), ("yuv_to_rgb", translator.yuv_to_rgb)):
+        start = time.perf_counter()
+        for a, b, c in sample:
+            convert(a, b, c)
+        results["scalar"][name] = len(sample) / 1e6 / (time.perf_counter() - start)
+
+    for method in CONVERSION_METHODS:
+        results[method] = {}
+        for name, convert in (("rgb_to_yuv", translator.rgb_to_yuv_frame), ("yuv_to_rgb", translator.yuv_to_rgb_frame)):
+            convert(frame, out=out, method=method)  # Warm up (LUTs are built on the first call)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                convert(frame, out=out, method=method)
+                timings.append(time.perf_counter() - start)
+            results[method][name] = width * height / 1e6 / min(timings)
+
+    return results
+
 
 class ColorTranslator:
     def __init__(self):
@@ -19,9 +451,7 @@ class ColorTranslator:
 
     def rgb_to_yuv(self, R: int, G: int, B: int) -> tuple:
 
-        Y = 0.257 * R + 0.504 * G + 0.098 * B + 16
-        U = -0.148 * R - 0.291 * G + 0.439 * B + 128
-        V = 0.439 * R - 0.368 * G - 0.071 * B + 128
+        Y, U, V = _rgb_to_yuv_float(R, G, B)
 
         # The values should be clipped to the range [0, 255]
         Y = np.clip(round(Y), 0, 255)
@@ -32,11 +462,117 @@ class ColorTranslator:
 
     def yuv_to_rgb(self, Y: int, U: int, V: int) -> tuple:
     
-        B = 1.164 * (Y - 16) + 2.018 * (U - 128)
-        G = 1.164 * (Y - 16) - 0.813 * (V - 128) - 0.391 * (U - 128)
-        R = 1.164 * (Y - 16) + 1.596 * (V - 128)
+        R, G, B = _yuv_to_rgb_float(Y, U, V)
 
         return (int(R), int(G), int(B))
+
+    # Frame versions of rgb_to_yuv / yuv_to_rgb: the whole (H, W, 3) uint8 frame is
+    # converted at once instead of one Python call per pixel. method is "float" (one
+    # matrix product), "fixed" (integer math, bit-exact with the scalar functions) or
+    # "lut" (precomputed tables, see _conversion_luts)
+
+    def rgb_to_yuv_frame(self, rgb: np.ndarray, out: np.ndarray = None, method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        _check_method(method, standard, full_range)
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        if rgb.ndim != 3 or rgb.shape[2] != 3:
+            raise ValueError(f"Expected an (H, W, 3) frame, got shape {rgb.shape}")
+        out = _check_frame_out(out, rgb.shape)
+        pixels = rgb.reshape(-1, 3)
+
+        if method == "fixed":
+            acc = pixels.astype(np.int32) @ RGB_TO_YUV_COEFFS.T
+            acc += RGB_TO_YUV_OFFSETS * FIXED_POINT_SCALE
+            result, remainder = np.divmod(acc, FIXED_POINT_SCALE)
+            result += remainder > FIXED_POINT_SCALE // 2
+
+            # Exact .5 ties depend on how round() sees the float value, so only
+            # those few pixels are evaluated with the scalar expressions
+            ties = np.nonzero((remainder == FIXED_POINT_SCALE // 2).any(axis=1))[0]
+            if ties.size:
+                R, G, B = pixels[ties].astype(np.float64).T
+                result[ties] = np.rint(np.stack(_rgb_to_yuv_float(R, G, B), axis=1))
+        elif method == "lut":
+            result = _lut_convert(pixels, _conversion_luts("rgb_to_yuv", standard, full_range))
+        else:
+            forward, offsets, _ = color_matrices(standard, full_range)
+            result = pixels.astype(np.float32) @ forward.T.astype(np.float32)
+            result += offsets.astype(np.float32)
+            np.rint(result, out=result)
+
+        np.clip(result, 0, 255, out=result)
+        out[...] = result.reshape(out.shape)
+        return out
+
+    def yuv_to_rgb_frame(self, yuv: np.ndarray, out: np.ndarray = None, method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        _check_method(method, standard, full_range)
+        yuv = np.asarray(yuv, dtype=np.uint8)
+        if yuv.ndim != 3 or yuv.shape[2] != 3:
+            raise ValueError(f"Expected an (H, W, 3) frame, got shape {yuv.shape}")
+        out = _check_frame_out(out, yuv.shape)
+        pixels = yuv.reshape(-1, 3)
+
+        if method == "fixed":
+            # Truncation towards zero, like int() in yuv_to_rgb
+            acc = (pixels.astype(np.int32) - YUV_TO_RGB_OFFSETS) @ YUV_TO_RGB_COEFFS.T
+            result = np.abs(acc) // FIXED_POINT_SCALE
+            np.negative(result, out=result, where=acc < 0)
+
+            # Exact integers can land just below or above in floating point
+            ties = np.nonzero((acc % FIXED_POINT_SCALE == 0).any(axis=1))[0]
+            if ties.size:
+                Y, U, V = pixels[ties].astype(np.float64).T
+                result[ties] = np.trunc(np.stack(_yuv_to_rgb_float(Y, U, V), axis=1))
+        elif method == "lut":
+            # Floors instead of truncating, which only differs for negatives that are clipped anyway
+            result = _lut_convert(pixels, _conversion_luts("yuv_to_rgb", standard, full_range))
+        else:
+            _, offsets, inverse = color_matrices(standard, full_range)
+            result = pixels.astype(np.float32) - offsets.astype(np.float32)
+            result = result @ inverse.T.astype(np.float32)
+            np.trunc(result, out=result)
+
+        # yuv_to_rgb does not clip, but a uint8 frame has to
+        np.clip(result, 0, 255, out=result)
+        out[...] = result.reshape(out.shape)
+        return out
+
+    def rgb_to_yuv_planar(self, rgb: np.ndarray, out: np.ndarray = None, pix_fmt: str = "yuv444p", method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        height, width = rgb.shape[:2]
+        luma_size, chroma_w, chroma_h = _planar_size(width, height, pix_fmt)
+        out = _check_frame_out(out, (luma_size + 2 * chroma_w * chroma_h,))
+
+        yuv = self.rgb_to_yuv_frame(rgb, method=method, standard=standard, full_range=full_range)
+        out[:luma_size] = yuv[:, :, 0].ravel()
+
+        factor = PLANAR_FORMATS[pix_fmt]
+        for i, plane in enumerate((yuv[:, :, 1], yuv[:, :, 2])):
+            start = luma_size + i * chroma_w * chroma_h
+            if factor > 1:
+                # Average each factor x factor block (edge pixels repeated for odd sizes)
+                padded = np.pad(plane, ((0, chroma_h * factor - height), (0, chroma_w * factor - width)), mode="edge")
+                blocks = padded.reshape(chroma_h, factor, chroma_w, factor).sum(axis=(1, 3), dtype=np.uint32)
+                plane = (blocks + factor * factor // 2) // (factor * factor)
+            out[start:start + chroma_w * chroma_h] = plane.ravel()
+        return out
+
+    def yuv_planar_to_rgb(self, planar: np.ndarray, width: int, height: int, out: np.ndarray = None, pix_fmt: str = "yuv444p", method: str = "float", standard: str = "bt601", full_range: bool = False) -> np.ndarray:
+        planar = np.frombuffer(planar, dtype=np.uint8) if isinstance(planar, (bytes, bytearray, memoryview)) else np.asarray(planar, dtype=np.uint8).ravel()
+        luma_size, chroma_w, chroma_h = _planar_size(width, height, pix_fmt)
+        if planar.size != luma_size + 2 * chroma_w * chroma_h:
+            raise ValueError(f"Planar {pix_fmt} buffer for {width}x{height} must have {luma_size + 2 * chroma_w * chroma_h} bytes, got {planar.size}")
+
+        factor = PLANAR_FORMATS[pix_fmt]
+        yuv = np.empty((height, width, 3), dtype=np.uint8)
+        yuv[:, :, 0] = planar[:luma_size].reshape(height, width)
+        for i in range(2):
+            start = luma_size + i * chroma_w * chroma_h
+            plane = planar[start:start + chroma_w * chroma_h].reshape(chroma_h, chroma_w)
+            if factor > 1:
+                plane = plane.repeat(factor, axis=0).repeat(factor, axis=1)[:height, :width]
+            yuv[:, :, i + 1] = plane
+
+        return self.yuv_to_rgb_frame(yuv, out=out, method=method, standard=standard, full_range=full_range)
     
     
     # Exercise 3
@@ -54,25 +590,25 @@ class ColorTranslator:
 
     # Exercise 4
 
-    def Serpentine(self,imagePath) -> int:
+    def Serpentine(self, imagePath, block_size: int = None) -> bytes:
         image = Image.open(imagePath)
         data = np.array(image) 
-        height, width, _ = data.shape
-
-        # Create an array to store pixels in zig-zag diagonal order
-        serpentine = []
 
-        for d in range(width + height - 1):  # iterate over each diagonal
-            for y in range(max(0, d - width + 1), min(height, d + 1)):
-                x = d - y
-                if d % 2 == 0: # even diagonal: top to bottom
-                    serpentine.append(data[y, x])
-                else: # odd diagonal: bottom to top
-                    serpentine.append(data[height - 1 - y, width - 1 - x])  
+        # Pixels in zig-zag diagonal order (or block by block with block_size=8 for DCT coefficients)
+        serpentine = zigzag_scan(data, block_size)
 
         # Convert to bytes
-        byte_data = np.array(serpentine, dtype=np.uint8).tobytes()
-        return len(byte_data)
+        return serpentine.astype(np.uint8, copy=False).tobytes()
+
+    def InverseSerpentine(self, byteData: bytes, width: int, height: int, block_size: int = None) -> np.ndarray:
+        scanned = np.frombuffer(byteData, dtype=np.uint8)
+        channels = scanned.size // (width * height)
+        if channels * width * height != scanned.size:
+            raise ValueError(f"{scanned.size} bytes is not a whole number of {width}x{height} planes")
+
+        shape = (-1, block_size * block_size) if block_size else (width * height,)
+        scanned = scanned.reshape(*shape, channels) if channels > 1 else scanned.reshape(shape)
+        return inverse_zigzag_scan(scanned, height, width, block_size)
     
 
     # Exercise 5a
@@ -90,80 +626,727 @@ class ColorTranslator:
 
     # Exercise 5b
 
-    def run_length_encoding(self, bytes: bytes) -> list:
-        
-        i = 0
-        encoded_bytes = []
-
-        while i < len(bytes):
-            value = bytes[i] # Current byte value
-            count = 1
-            while i + count < len(bytes) and bytes[i] == bytes[i + count]: # Count occurrences
-                count += 1
-
-            encoded_bytes.append((count, value))
-            i += count
-        return encoded_bytes
+    def run_length_encoding(self, bytes: bytes, output: str = "tuples"):
+        # output: "tuples" for a list of (count, value), "arrays" for (counts, values) arrays
+        # or "packed" for the binary format of rle_pack
+        if output not in RLE_OUTPUTS:
+            raise ValueError(f"Unsupported RLE output '{output}'. Use one of: {list(RLE_OUTPUTS)}")
+
+        counts, values = rle_encode(bytes)
+        if output == "arrays":
+            return counts, values
+        if output == "packed":
+            return rle_pack(counts, values)
+        return list(zip(counts.tolist(), values.tolist()))
+
+    def run_length_decoding(self, encoded) -> bytes:
+        # Accepts any of the outputs of run_length_encoding
+        if isinstance(encoded, (bytes, bytearray, memoryview)):
+            counts, values = rle_unpack(encoded)
+        elif isinstance(encoded, tuple):
+            counts, values = encoded
+        else:
+            counts, values = zip(*encoded) if encoded else ((), ())
+        return rle_decode(counts, values).tobytes()
             
     
     # Exercise 6
     
+def _save_decoded(data: np.ndarray, save_path) -> None:
+    # Decoders only write when asked: save_path can be a path or a binary file object (JPEG)
+    if save_path is None:
+        return
+    image = Image.fromarray(np.uint8(data))
+    if isinstance(save_path, (str, os.PathLike)):
+        image.save(save_path)
+    else:
+        image.save(save_path, format="JPEG")
+
+
+def _check_decode_out(out, shape):
+    if out.shape != tuple(shape):
+        raise ValueError(f"Output buffer must have shape {tuple(shape)}, got {out.shape}")
+
+
+DCT_BACKENDS = ("fftpack", "matrix")
+
+
+@functools.lru_cache(maxsize=32)
+def dct_basis(n: int, dtype=np.float32) -> np.ndarray:
+    # Orthonormal DCT-II matrix C, dct(x, norm='ortho') == C @ x and the inverse is C.T
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    basis = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    basis[0] /= np.sqrt(2)
+    basis = basis.astype(dtype)
+    basis.setflags(write=False)
+    return basis
+
+
+@functools.lru_cache(maxsize=32)
+def dct_basis_2d(block_size: int, dtype=np.float32) -> np.ndarray:
+    # kron(C, C): on a flattened block X it gives C @ X @ C.T, so a stack of
+    # blocks is transformed with a single matrix product
+    basis = np.kron(dct_basis(block_size, dtype), dct_basis(block_size, dtype))
+    basis.setflags(write=False)
+    return basis
+
+
+def _check_backend(backend):
+    if backend not in DCT_BACKENDS:
+        raise ValueError(f"Unsupported DCT backend '{backend}'. Use one of: {list(DCT_BACKENDS)}")
+
+
+def dct_along(x: np.ndarray, axis: int = -1, backend: str = "fftpack", inverse: bool = False, dtype=np.float32) -> np.ndarray:
+    # Orthonormal 1D DCT (or IDCT) along one axis
+    if backend == "fftpack":
+        return (idct if inverse else dct)(x, axis=axis, norm='ortho')
+
+    basis = dct_basis(x.shape[axis], dtype)
+    moved = np.moveaxis(np.asarray(x, dtype=dtype), axis, -1)
+    result = moved.reshape(-1, moved.shape[-1]) @ (basis if inverse else basis.T)
+    return np.moveaxis(result.reshape(moved.shape), -1, axis)
+
+
+def block_dct2(blocks: np.ndarray, backend: str = "fftpack", inverse: bool = False, dtype=np.float32) -> np.ndarray:
+    # 2D DCT (or IDCT) of every block of a (H/b, b, W/b, b) view of a plane, same layout out
+    if backend == "fftpack":
+        transform = idct if inverse else dct
+        return transform(transform(blocks, axis=3, norm='ortho'), axis=1, norm='ortho')
+
+    rows, b, cols, _ = blocks.shape
+    basis = dct_basis_2d(b, dtype)
+    stack = np.asarray(blocks, dtype=dtype).transpose(0, 2, 1, 3).reshape(-1, b * b)
+    result = stack @ (basis if inverse else basis.T)
+    return result.reshape(rows, cols, b, b).transpose(0, 2, 1, 3)
+
+
+def benchmark_dct_backends(width: int = 1920, height: int = 1080, block_size: int = 8, repeat: int = 5) -> list:
+    # Throughput (MP/s) and largest error against a float64 fftpack reference of each backend,
+    # for 8x8 blocks and for a full plane
+    plane = np.random.default_rng(0).uniform(-128, 128, size=(height - height % block_size, width - width % block_size))
+    b = block_size
+    blocks = plane.reshape(plane.shape[0] // b, b, plane.shape[1] // b, b)
+    references = {
+        "blocks": block_dct2(blocks),
+        "plane": dct_along(dct_along(plane, axis=0), axis=1)
+    }
+    transforms = {
+        "blocks": lambda data, backend: block_dct2(data.reshape(blocks.shape), backend=backend),
+        "plane": lambda data, backend: dct_along(dct_along(data, axis=0, backend=backend), axis=1, backend=backend)
+    }
+
+    results = []
+    data = plane.astype(np.float32)
+    for mode, transform in transforms.items():
+        for backend in DCT_BACKENDS:
+            result = transform(data, backend)  # Warm up (basis matrices are built on the first call)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                transform(data, backend)
+                timings.append(time.perf_counter() - start)
+            results.append({
+                "mode": mode,
+                "backend": backend,
+                "mp_per_s": plane.size / 1e6 / min(timings),
+                "max_error": float(np.abs(result - references[mode]).max())
+            })
+    return results
+
+
+# Parallel execution of the transforms: planes are cut in strips that a shared pool of threads
+# transforms straight into one preallocated output. numpy, scipy and pywt release the GIL
+# in their kernels, so the threads run in parallel and share the arrays without copies
+
+def _resolve_workers(workers) -> int:
+    # None means one worker per core
+    workers = (os.cpu_count() or 1) if workers is None else int(workers)
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    return workers
+
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _thread_pool(workers: int) -> ThreadPoolExecutor:
+    # The pool shared by every transform, created on first use with a thread per core (its
+    # threads start as they are needed). A call asking for more workers replaces it by a
+    # bigger one, the old pool finishes its work and its threads exit
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or workers > _pool_size:
+            old = _pool
+            _pool_size = max(workers, _resolve_workers(None))
+            _pool = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="transform")
+            if old is not None:
+                old.shutdown(wait=False)
+        return _pool
+
+
+@atexit.register
+def _shutdown_thread_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _parallel_for(function, items, workers: int):
+    # Runs function on every item, in the shared pool if there is more than one worker. The
+    # items are dealt in (at most) workers batches, so no call uses more threads than asked
+    items = list(items)
+    if workers == 1 or len(items) <= 1:
+        for item in items:
+            function(item)
+    else:
+        def run(batch):
+            for item in batch:
+                function(item)
+        batches = [items[i::workers] for i in range(min(workers, len(items)))]
+        list(_thread_pool(workers).map(run, batches))  # list() raises the errors of the workers
+
+
+def _strips(length: int, parts: int) -> list:
+    # [0, length) cut in (at most) parts slices of about the same size
+    bounds = np.linspace(0, length, min(parts, length) + 1).astype(int)
+    return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def dct2_tiled(data: np.ndarray, backend: str = "fftpack", inverse: bool = False, workers: int = 1) -> np.ndarray:
+    # Same transform as DCT.Encode/_idct2 (along axis 0, then along the last axis). The first
+    # pass runs on strips of columns and the second on strips of rows
+    workers = _resolve_workers(workers)
+    dtype = np.float32 if backend == "matrix" else np.float64
+    columns = np.empty(data.shape, dtype=dtype)
+    out = np.empty(data.shape, dtype=dtype)
+
+    def first_pass(strip):
+        columns[:, strip] = dct_along(data[:, strip], axis=0, backend=backend, inverse=inverse)
+
+    def second_pass(strip):
+        out[strip] = dct_along(columns[strip], axis=-1, backend=backend, inverse=inverse)
+
+    _parallel_for(first_pass, _strips(data.shape[1], workers), workers)
+    _parallel_for(second_pass, _strips(data.shape[0], workers), workers)
+    return out
+
+
 class DCT:
-    def __init__(self):
-        pass
+    def __init__(self, backend: str = "fftpack", workers: int = 1):
+        # "fftpack" (float64, scipy) or "matrix" (cached basis matrices, float32).
+        # With more than one worker (None: one per core) the transform runs in strips on a thread pool
+        _check_backend(backend)
+        self.backend = backend
+        self.workers = _resolve_workers(workers)
 
     def Encode(self, inputPath):
-        image = Image.open(inputPath)
-        data = np.array(image)
+        data = inputPath if isinstance(inputPath, np.ndarray) else np.array(Image.open(inputPath))
+        if self.workers > 1:
+            return dct2_tiled(data, backend=self.backend, workers=self.workers)
 
-        dctData = dct(dct(data.T, norm='ortho').T, norm='ortho') # 2D DCT
+        dctData = dct_along(dct_along(data.T, backend=self.backend).T, backend=self.backend) # 2D DCT
         return dctData
     
-    def Decode(self, dctData, save_path=None):
-        idctData = idct(idct(dctData.T, norm='ortho').T, norm='ortho') # 2D IDCT
-        idctData = np.clip(idctData, 0, 255)
-        
-        # Decoded image
-        decodedImg = Image.fromarray(np.uint8(idctData))
-        decodedImg.save("/Users/Eric/Downloads/VideoCoding/seminar_1/dct_decoded_image.jpg") # Save the decoded image
+    def _idct2(self, dctData, workers=None):
+        workers = self.workers if workers is None else workers
+        if workers > 1:
+            return dct2_tiled(dctData, backend=self.backend, inverse=True, workers=workers)
+        return dct_along(dct_along(dctData.T, backend=self.backend, inverse=True).T, backend=self.backend, inverse=True) # 2D IDCT
+
+    def Decode(self, dctData, save_path=None, out=None, chunk_columns: int = 256):
+        # Returns the decoded array, written into out if given and saved to save_path
+        # (path or file object) if given. With an (H, W, 3) image the transform never mixes
+        # columns, so out (e.g. a numpy.memmap) is filled one strip of columns at a time
+        if out is None:
+            idctData = np.clip(self._idct2(dctData), 0, 255)
+        else:
+            _check_decode_out(out, dctData.shape)
+            if dctData.ndim == 3:
+                # Strips of columns are independent, the workers decode them side by side
+                def decode_strip(x):
+                    out[:, x:x + chunk_columns] = np.clip(self._idct2(dctData[:, x:x + chunk_columns], workers=1), 0, 255)
+                _parallel_for(decode_strip, range(0, dctData.shape[1], chunk_columns), self.workers)
+            else:
+                out[...] = np.clip(self._idct2(dctData), 0, 255)
+            idctData = out
+
+        _save_decoded(idctData, save_path)
         return idctData
 
     
+# Exercise 6 (block codec): JPEG-style 8x8 DCT with quantization and a zig-zag + RLE entropy stage
+
+# Quantization tables of the JPEG standard (Annex K), for quality 50
+JPEG_LUMA_QUANTIZATION = np.array([
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99]])
+JPEG_CHROMA_QUANTIZATION = np.array([
+    [17, 18, 24, 47, 99, 99, 99, 99],
+    [18, 21, 26, 66, 99, 99, 99, 99],
+    [24, 26, 56, 99, 99, 99, 99, 99],
+    [47, 66, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99]])
+
+
+def quantization_table(base: np.ndarray, quality: int) -> np.ndarray:
+    # Scales a quality 50 table like libjpeg does
+    quality = int(np.clip(quality, 1, 100))
+    scale = 5000 / quality if quality < 50 else 200 - 2 * quality
+    return np.clip(np.floor((np.asarray(base) * scale + 50) / 100), 1, 255)
+
+
+def pack_coefficients(coeffs: np.ndarray) -> bytes:
+    # Quantized int16 coefficients -> packed RLE. Signs are folded into the lowest bit
+    # (0, -1, 1, -2, ... -> 0, 1, 2, 3, ...) and the low and high bytes are stored as two
+    # planes, so the zeros of the high frequencies become long runs
+    coeffs = np.asarray(coeffs, dtype=np.int16).ravel()
+    folded = ((coeffs << 1) ^ (coeffs >> 15)).view(np.uint16)
+    planes = np.concatenate(((folded & 0xFF).astype(np.uint8), (folded >> 8).astype(np.uint8)))
+    return rle_pack(*rle_encode(planes))
+
+
+def unpack_coefficients(packed: bytes) -> np.ndarray:
+    planes = rle_decode(*rle_unpack(packed))
+    low, high = np.split(planes, 2)
+    folded = low.astype(np.uint16) | (high.astype(np.uint16) << 8)
+    return ((folded >> 1).astype(np.int16) ^ -(folded & 1).astype(np.int16))
+
+
+def _load_rgb(image) -> np.ndarray:
+    # Path or array -> (H, W, 3) uint8
+    if isinstance(image, np.ndarray):
+        return np.asarray(image, dtype=np.uint8)
+    return np.array(Image.open(image).convert('RGB'))
+
+
+class BlockDCT:
+    def __init__(self, quality: int = 50, block_size: int = 8, luma_table: np.ndarray = None, chroma_table: np.ndarray = None, backend: str = "fftpack"):
+        # Tables default to the JPEG ones scaled to the quality, custom ones must be block_size x block_size
+        _check_backend(backend)
+        self.quality = quality
+        self.block_size = block_size
+        self.backend = backend
+        if (luma_table is None or chroma_table is None) and block_size != 8:
+            raise ValueError("Default quantization tables are 8x8, pass luma_table and chroma_table for other block sizes")
+        self.luma_table = np.asarray(luma_table if luma_table is not None else quantization_table(JPEG_LUMA_QUANTIZATION, quality), dtype=np.float64)
+        self.chroma_table = np.asarray(chroma_table if chroma_table is not None else quantization_table(JPEG_CHROMA_QUANTIZATION, quality), dtype=np.float64)
+        self.translator = ColorTranslator()
+
+    def _blocks_view(self, plane, b: int):
+        # (H, W) -> (H/b, b, W/b, b) view, every block is [i, :, j, :]
+        return plane.reshape(plane.shape[0] // b, b, plane.shape[1] // b, b)
+
+    def Encode(self, inputPath) -> dict:
+        data = _load_rgb(inputPath)
+        height, width = data.shape[:2]
+        b = self.block_size
+
+        # JPEG works on full range YCbCr
+        yuv = self.translator.rgb_to_yuv_frame(data, full_range=True)
+        pad_h, pad_w = -height % b, -width % b
+        yuv = np.pad(yuv, ((0, pad_h), (0, pad_w), (0, 0)), mode="edge")
+
+        planes = []
+        for i, table in enumerate((self.luma_table, self.chroma_table, self.chroma_table)):
+            plane = yuv[:, :, i].astype(np.float32) - 128
+
+            # DCT of all the blocks at once along the two block axes of the view
+            blocks = self._blocks_view(plane, b)
+            coeffs = block_dct2(blocks, backend=self.backend)
+            quantized = np.rint(coeffs / table[None, :, None, :]).astype(np.int16)
+
+            # Zig-zag each block, then group the same frequency of all blocks together
+            scanned = zigzag_scan(quantized.reshape(plane.shape), block_size=b).T.copy()
+            scanned[0, 1:] = np.diff(scanned[0])  # DC as the difference with the previous block
+            planes.append(pack_coefficients(scanned))
+
+        return {
+            "width": width,
+            "height": height,
+            "quality": self.quality,
+            # The decoder needs the same block size and tables, whatever its own settings
+            "block_size": b,
+            "luma_table": self.luma_table.tolist(),
+            "chroma_table": self.chroma_table.tolist(),
+            "planes": planes,
+            "size_bytes": sum(len(plane) for plane in planes)
+        }
+
+    def Decode(self, encoded: dict, save_path=None, out: np.ndarray = None, band_rows: int = 32) -> np.ndarray:
+        # The image is rebuilt in bands of band_rows block rows written straight into out
+        # (allocated if not given, can be a numpy.memmap), so only one band of pixels is
+        # in memory at a time. save_path (path or file object) is only written if given.
+        # Block size and tables are the ones of the encoder, stored in encoded
+        b = encoded["block_size"]
+        width, height = encoded["width"], encoded["height"]
+        padded_h, padded_w = height + (-height % b), width + (-width % b)
+        blocks_per_row = padded_w // b
+        luma_table = np.asarray(encoded["luma_table"], dtype=np.float64)
+        chroma_table = np.asarray(encoded["chroma_table"], dtype=np.float64)
+        tables = (luma_table, chroma_table, chroma_table)
+
+        if out is None:
+            out = np.empty((height, width, 3), dtype=np.uint8)
+        _check_decode_out(out, (height, width, 3))
+
+        scanned_planes = []
+        for packed in encoded["planes"]:
+            scanned = unpack_coefficients(packed).reshape(b * b, -1)
+            scanned[0] = np.cumsum(scanned[0], dtype=np.int16)
+            scanned_planes.append(scanned)
+
+        for top in range(0, padded_h // b, band_rows):
+            rows = min(band_rows, padded_h // b - top)
+            first, last = top * blocks_per_row, (top + rows) * blocks_per_row
+
+            yuv = np.empty((rows * b, padded_w, 3), dtype=np.uint8)
+            for i, (scanned, table) in enumerate(zip(scanned_planes, tables)):
+                quantized = inverse_zigzag_scan(scanned[:, first:last].T, rows * b, padded_w, block_size=b)
+                coeffs = self._blocks_view(quantized.astype(np.float32), b) * table[None, :, None, :].astype(np.float32)
+                blocks = block_dct2(coeffs, backend=self.backend, inverse=True)
+                yuv[:, :, i] = np.clip(np.rint(blocks.reshape(rows * b, padded_w) + 128), 0, 255)
+
+            y0 = top * b
+            y1 = min(y0 + rows * b, height)
+            self.translator.yuv_to_rgb_frame(yuv[:y1 - y0, :width], out=out[y0:y1], full_range=True)
+
+        _save_decoded(out, save_path)
+        return out
+
+
+def psnr(original: np.ndarray, decoded: np.ndarray) -> float:
+    mse = np.mean((np.asarray(original, dtype=np.float64) - np.asarray(decoded, dtype=np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+
+def benchmark_block_dct(inputPath, sizes=(256, 512, 1024, 2048), quality: int = 50) -> list:
+    # Size and speed of BlockDCT for the image resized to each width, both should grow linearly with the pixels
+    codec = BlockDCT(quality=quality)
+    image = Image.open(inputPath).convert('RGB')
+    results = []
+    for width in sizes:
+        height = round(width * image.height / image.width)
+        data = np.array(image.resize((width, height)))
+
+        start = time.perf_counter()
+        encoded = codec.Encode(data)
+        encode_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = codec.Decode(encoded)
+        decode_seconds = time.perf_counter() - start
+
+        megapixels = width * height / 1e6
+        results.append({
+            "resolution": f"{width}x{height}",
+            "size_bytes": encoded["size_bytes"],
+            "bits_per_pixel": 8 * encoded["size_bytes"] / (width * height),
+            "encode_mp_per_s": megapixels / encode_seconds,
+            "decode_mp_per_s": megapixels / decode_seconds,
+            "psnr_db": psnr(data, decoded)
+        })
+    return results
+
+    
     # Exercise 7
 
+# Compressed DWT blob: header, wavelet name, per-level quantization steps, then the packed
+# coefficients of each channel (uint32 length + pack_coefficients bytes)
+DWT_MAGIC = b"DWT2"
+DWT_HEADER = struct.Struct("<4sIIBBB")  # magic, height, width, channels, level, wavelet name length
+THRESHOLD_MODES = ("hard", "soft")
+DWT_THRESHOLD = 10.0
+DWT_STEP = 1.0
+
+# Subbands of a level: horizontal, vertical and diagonal details ('a' is the approximation,
+# only at the coarsest level). pywt.coeffs_to_array names them by the filter along each axis
+DWT_SUBBANDS = ("h", "v", "d")
+PYWT_SUBBANDS = {"da": "h", "ad": "v", "dd": "d"}
+
+
+def _per_level(value, level):
+    # A number, or one value per level from the coarsest to the finest
+    values = np.broadcast_to(np.asarray(value, dtype=np.float64), (level,))
+    return [float(v) for v in values]
+
+
+def _subband_keys(level) -> list:
+    # (level, band) of every subband, levels from 0 (the coarsest) on
+    return [(0, "a")] + [(i, band) for i in range(level) for band in DWT_SUBBANDS]
+
+
+def _per_subband(value, level, default, approx=None) -> dict:
+    # {(level, band): value} from a number or one value per level (the approximation takes
+    # approx, None: the value of the coarsest level), a dict keyed by (level, band) (the
+    # missing subbands take default, or approx for the approximation) or a callable(level, band)
+    keys = _subband_keys(level)
+    if callable(value):
+        return {key: float(value(*key)) for key in keys}
+    if isinstance(value, dict):
+        unknown = set(value) - set(keys)
+        if unknown:
+            raise ValueError(f"Unknown subbands {sorted(unknown)}, use (level, band) with band in 'a', 'h', 'v', 'd'")
+        fallback = lambda key: approx if key[1] == "a" and approx is not None else default
+        return {key: float(value.get(key, fallback(key))) for key in keys}
+    per_level = _per_level(value, level)
+    return {key: approx if key[1] == "a" and approx is not None else per_level[key[0]] for key in keys}
+
+
+def _subband_regions(slices) -> list:
+    # ((level, band), region of the coeffs_to_array array) of every subband
+    regions = [((0, "a"), slices[0])]
+    for level, subbands in enumerate(slices[1:]):
+        regions += [((level, PYWT_SUBBANDS[name]), region) for name, region in subbands.items()]
+    return regions
+
+
+def dwt_tiled(plane: np.ndarray, wavelet: str, axis: int, workers: int = 1) -> tuple:
+    # pywt.dwt along one axis of a 2D plane, the other axis cut in strips. Every line is
+    # transformed on its own, so the strips need no overlap and give the exact pywt result
+    other = 1 - axis
+    length = pywt.dwt_coeff_len(plane.shape[axis], pywt.Wavelet(wavelet).dec_len, 'symmetric')
+    shape = list(plane.shape)
+    shape[axis] = length
+    approx, detail = np.empty(shape), np.empty(shape)
+
+    def transform(strip):
+        index = (slice(None), strip) if other == 1 else (strip, slice(None))
+        approx[index], detail[index] = pywt.dwt(plane[index], wavelet, axis=axis)
+
+    _parallel_for(transform, _strips(plane.shape[other], workers), workers)
+    return approx, detail
+
+
+def idwt_tiled(approx: np.ndarray, detail: np.ndarray, wavelet: str, axis: int, workers: int = 1) -> np.ndarray:
+    other = 1 - axis
+    shape = list(detail.shape)
+    shape[axis] = pywt.idwt(np.zeros(detail.shape[axis]), np.zeros(detail.shape[axis]), wavelet).shape[0]
+    out = np.empty(shape)
+
+    def transform(strip):
+        index = (slice(None), strip) if other == 1 else (strip, slice(None))
+        out[index] = pywt.idwt(approx[index], detail[index], wavelet, axis=axis)
+
+    _parallel_for(transform, _strips(detail.shape[other], workers), workers)
+    return out
+
+
+def wavedec2_tiled(plane: np.ndarray, wavelet: str, level: int, workers: int = 1) -> list:
+    # Same coefficients as pywt.wavedec2, each level done as separable passes in strips
+    if workers == 1:
+        return pywt.wavedec2(plane, wavelet=wavelet, level=level)
+    approx = np.asarray(plane, dtype=np.float64)
+    details = []
+    for _ in range(level):
+        low, high = dwt_tiled(approx, wavelet, axis=0, workers=workers)
+        approx, cV = dwt_tiled(low, wavelet, axis=1, workers=workers)
+        cH, cD = dwt_tiled(high, wavelet, axis=1, workers=workers)
+        details.append((cH, cV, cD))
+    return [approx] + details[::-1]
+
+
+def waverec2_tiled(coeffs: list, wavelet: str, workers: int = 1) -> np.ndarray:
+    # Same image as pywt.waverec2
+    if workers == 1:
+        return pywt.waverec2(coeffs, wavelet=wavelet)
+    approx = coeffs[0]
+    for cH, cV, cD in coeffs[1:]:
+        approx = approx[:cH.shape[0], :cH.shape[1]]  # Odd sizes leave an extra row/column
+        low = idwt_tiled(approx, cV, wavelet, axis=1, workers=workers)
+        high = idwt_tiled(cH, cD, wavelet, axis=1, workers=workers)
+        approx = idwt_tiled(low, high, wavelet, axis=0, workers=workers)
+    return approx
+
+
 class DWT:
-    def __init__(self, wavelet='haar', level=1):
-        # Choosing the wavelet type and decomposition level
+    def __init__(self, wavelet='haar', level=1, workers=1):
+        # Choosing the wavelet type and decomposition level. With more than one worker
+        # (None: one per core) every plane is transformed in strips on a thread pool
         self.wavelet = wavelet
         self.level = level
+        self.workers = _resolve_workers(workers)
 
     def Encode(self, inputPath):
-        image = Image.open(inputPath).convert('RGB')  # Ensure image is in RGB mode
-        data = np.array(image)
+        data = _load_rgb(inputPath)  # Ensure image is in RGB mode
 
         # Separate channels
         channels = [data[:, :, i] for i in range(3)]
         encoded_coeffs = []
         for channel in channels:
-            coeffs = pywt.wavedec2(channel, wavelet=self.wavelet, level=self.level) # 2D DWT
+            coeffs = wavedec2_tiled(channel, wavelet=self.wavelet, level=self.level, workers=self.workers) # 2D DWT
             encoded_coeffs.append(coeffs)
 
         return encoded_coeffs
     
-    def Decode(self, coeffs, save_path=None):
+    def Decode(self, coeffs, save_path=None, out=None):
+        # Returns the decoded array, written into out if given (e.g. a numpy.memmap, one
+        # channel at a time) and saved to save_path (path or file object) if given
+        if out is not None:
+            for i, channel_coeffs in enumerate(coeffs):
+                reconstructed = waverec2_tiled(channel_coeffs, wavelet=self.wavelet, workers=self.workers) # 2D IDWT
+                # waverec2 can add a row/column for odd sizes, out has the size the caller wants
+                out[:, :, i] = np.clip(reconstructed[:out.shape[0], :out.shape[1]], 0, 255)
+            _save_decoded(out, save_path)
+            return out
+
         decoded_channels = []
         for channel_coeffs in coeffs:
-            reconstructed = pywt.waverec2(channel_coeffs, wavelet=self.wavelet) # 2D IDWT
+            reconstructed = waverec2_tiled(channel_coeffs, wavelet=self.wavelet, workers=self.workers) # 2D IDWT
             reconstructed = np.clip(reconstructed, 0, 255) # Clipping values to valid range
             decoded_channels.append(reconstructed)
 
         idwtData = np.stack(decoded_channels, axis=-1)  # Reconstruct the image from channels
-        
-        # Decoded image
-        decodedImg = Image.fromarray(np.uint8(idwtData))
-        decodedImg.save("/Users/Eric/Downloads/VideoCoding/seminar_1/dwt_decoded_image.jpg") # Save the decoded image
+        _save_decoded(idwtData, save_path)
         return idwtData
 
+    # Compression mode: the coefficients of all the channels in one contiguous array,
+    # thresholded and quantized per subband and serialized into a compact blob
+
+    def _coeff_slices(self, height, width):
+        # Layout of pywt.coeffs_to_array for an image size, found without transforming anything
+        shapes = pywt.wavedecn_shapes((height, width), self.wavelet, level=self.level)
+        zeros = [np.zeros(shapes[0])] + [{key: np.zeros(shape) for key, shape in level.items()} for level in shapes[1:]]
+        array, slices = pywt.coeffs_to_array(zeros)
+        return array.shape, slices
+
+    def ToArray(self, inputPath) -> tuple:
+        # (channels, H', W') array with the coefficients of every channel, and the slices of each subband
+        data = _load_rgb(inputPath)
+        shape, slices = self._coeff_slices(*data.shape[:2])
+        array = np.empty((data.shape[2], *shape))
+        for i in range(data.shape[2]):
+            coeffs = wavedec2_tiled(data[:, :, i], wavelet=self.wavelet, level=self.level, workers=self.workers)
+            array[i] = pywt.coeffs_to_array(coeffs)[0]
+        return array, slices
+
+    def Compress(self, inputPath, threshold=DWT_THRESHOLD, step=DWT_STEP, mode: str = "hard") -> bytes:
+        # threshold and step are a number, one value per level (coarsest first), a dict keyed
+        # by (level, band) with band 'a', 'h', 'v' or 'd' (level 0 is the coarsest) or a
+        # callable(level, band). Every subband is thresholded and quantized with its own
+        # values. With a number or a list the approximation is not thresholded and takes the
+        # step of the coarsest level
+        if mode not in THRESHOLD_MODES:
+            raise ValueError(f"Unsupported threshold mode '{mode}'. Use one of: {list(THRESHOLD_MODES)}")
+        data = _load_rgb(inputPath)
+        height, width, channels = data.shape
+        array, slices = self.ToArray(data)
+        thresholds = _per_subband(threshold, self.level, DWT_THRESHOLD, approx=0.0)
+        steps = _per_subband(step, self.level, DWT_STEP)
+
+        quantized = np.zeros(array.shape, dtype=np.int64)
+        for key, subband in _subband_regions(slices):
+            region = (slice(None),) + subband
+            coefficients = pywt.threshold(array[region], thresholds[key], mode=mode)
+            quantized[region] = np.rint(coefficients / steps[key])
+
+        if np.abs(quantized).max(initial=0) > np.iinfo(np.int16).max:
+            raise ValueError("Quantized coefficients do not fit in 16 bits, use a bigger step")
+
+        wavelet = self.wavelet.encode()
+        parts = [DWT_HEADER.pack(DWT_MAGIC, height, width, channels, self.level, len(wavelet)), wavelet,
+                 np.asarray([steps[key] for key in _subband_keys(self.level)], dtype="<f4").tobytes()]
+        for channel in quantized.astype(np.int16):
+            packed = pack_coefficients(channel)
+            parts += [struct.pack("<I", len(packed)), packed]
+        return b"".join(parts)
+
+    def Decompress(self, blob: bytes, save_path=None, out=None) -> np.ndarray:
+        magic, height, width, channels, level, name_length = DWT_HEADER.unpack_from(blob)
+        if magic != DWT_MAGIC:
+            raise ValueError("Data is not a compressed DWT blob")
+        position = DWT_HEADER.size
+        wavelet = blob[position:position + name_length].decode()
+        position += name_length
+        keys = _subband_keys(level)
+        steps = dict(zip(keys, np.frombuffer(blob, dtype="<f4", count=len(keys), offset=position)))
+        position += 4 * len(keys)
+
+        # The blob says how it was made, independently of this instance
+        decoder = DWT(wavelet=wavelet, level=level, workers=self.workers)
+        shape, slices = decoder._coeff_slices(height, width)
+
+        if out is None:
+            out = np.empty((height, width, channels), dtype=np.uint8)
+        _check_decode_out(out, (height, width, channels))
+        for i in range(channels):
+            (length,) = struct.unpack_from("<I", blob, position)
+            position += 4
+            array = unpack_coefficients(blob[position:position + length]).reshape(shape).astype(np.float64)
+            position += length
+
+            for key, subband in _subband_regions(slices):
+                array[subband] *= steps[key]
+
+            coeffs = pywt.array_to_coeffs(array, slices, output_format='wavedec2')
+            reconstructed = waverec2_tiled(coeffs, wavelet=wavelet, workers=self.workers)
+            out[:, :, i] = np.clip(np.rint(reconstructed[:height, :width]), 0, 255)
+
+        _save_decoded(out, save_path)
+        return out
+
+    def RateDistortion(self, inputPath, thresholds=(0, 5, 10, 20, 40, 80), step=1.0, mode: str = "hard") -> list:
+        # Compression ratio against PSNR for each threshold
+        data = _load_rgb(inputPath)
+        results = []
+        for threshold in thresholds:
+            start = time.perf_counter()
+            blob = self.Compress(data, threshold=threshold, step=step, mode=mode)
+            encode_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            decoded = self.Decompress(blob)
+            decode_seconds = time.perf_counter() - start
+            results.append({
+                "threshold": threshold,
+                "size_bytes": len(blob),
+                "compression_ratio": data.nbytes / len(blob),
+                "psnr_db": psnr(data, decoded),
+                "encode_seconds": encode_seconds,
+                "decode_seconds": decode_seconds
+            })
+        return results
+
+
+def benchmark_parallel_transforms(width: int = 3840, height: int = 2160, workers=(1, 2, 4, 8), repeat: int = 3) -> list:
+    # Throughput (MP/s) of the DCT and DWT of an RGB frame for each worker count, and the
+    # speedup against one worker
+    frame = np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    transforms = {
+        "dct": lambda count: DCT(workers=count).Encode(frame),
+        "dwt": lambda count: DWT(wavelet='db2', level=3, workers=count).Encode(frame)
+    }
+
+    results = []
+    for name, transform in transforms.items():
+        baseline = None
+        for count in workers:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                transform(count)
+                timings.append(time.perf_counter() - start)
+            seconds = min(timings)
+            baseline = baseline or seconds
+            results.append({
+                "transform": name,
+                "workers": count,
+                "mp_per_s": width * height / 1e6 / seconds,
+                "speedup": baseline / seconds
+            })
+    return results
+
 
     # Exercise 8: Unit tests
 
@@ -171,9 +1354,9 @@ class TestColorTranslator(unittest.TestCase):
     def setUp(self):
         self.translator = ColorTranslator()
         
-        self.test_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
-        self.output_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT_test_output.jpg"
-        self.bw_output_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT_bw_test.jpg"
+        self.test_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
+        self.output_path = os.path.join(SEMINAR_DIR, "GOAT_test_output.jpg")
+        self.bw_output_path = os.path.join(SEMINAR_DIR, "GOAT_bw_test.jpg")
 
     def tearDown(self):
         # Clean up created files
@@ -190,6 +1373,37 @@ class TestColorTranslator(unittest.TestCase):
         self.assertAlmostEqual(G, G2, delta=2)
         self.assertAlmostEqual(B, B2, delta=2)
 
+    def test_frame_conversion_matches_scalar(self):
+        frame = np.random.default_rng(0).integers(0, 256, size=(32, 48, 3), dtype=np.uint8)
+        yuv = self.translator.rgb_to_yuv_frame(frame, method="fixed")
+        rgb = self.translator.yuv_to_rgb_frame(frame, method="fixed")
+        for y, x in [(0, 0), (5, 17), (31, 47), (20, 3)]:
+            self.assertEqual(tuple(yuv[y, x]), self.translator.rgb_to_yuv(*map(int, frame[y, x])))
+            self.assertEqual(tuple(rgb[y, x]), tuple(np.clip(self.translator.yuv_to_rgb(*map(int, frame[y, x])), 0, 255)))
+
+        # Float path may only differ on rounding ties
+        self.assertLessEqual(np.abs(self.translator.rgb_to_yuv_frame(frame).astype(int) - yuv).max(), 1)
+
+    def test_lut_conversion(self):
+        frame = np.random.default_rng(1).integers(0, 256, size=(16, 16, 3), dtype=np.uint8)
+        for standard, full_range in [("bt601", False), ("bt601", True), ("bt709", False), ("bt709", True)]:
+            for convert in (self.translator.rgb_to_yuv_frame, self.translator.yuv_to_rgb_frame):
+                reference = convert(frame, standard=standard, full_range=full_range).astype(int)
+                lut = convert(frame, method="lut", standard=standard, full_range=full_range)
+                self.assertLessEqual(np.abs(lut - reference).max(), 1)
+
+        with self.assertRaises(ValueError):
+            self.translator.rgb_to_yuv_frame(frame, method="fixed", standard="bt709")
+
+    def test_planar_round_trip(self):
+        frame = np.full((9, 7, 3), (200, 40, 90), dtype=np.uint8)
+        out = np.empty_like(frame)
+        planar = self.translator.rgb_to_yuv_planar(frame, pix_fmt="yuv420p")
+        self.assertEqual(planar.size, 9 * 7 + 2 * 5 * 4)
+        decoded = self.translator.yuv_planar_to_rgb(planar.tobytes(), 7, 9, out=out, pix_fmt="yuv420p")
+        self.assertIs(decoded, out)
+        self.assertLessEqual(np.abs(decoded.astype(int) - frame).max(), 2)
+
     # Exercise 3
     def test_resize_images(self):
         self.translator.ResizeImages(self.test_image_path, self.output_path, 50, 50)
@@ -199,10 +1413,26 @@ class TestColorTranslator(unittest.TestCase):
 
     # Exercise 4
     def test_serpentine(self):
-        byte_len = self.translator.Serpentine(self.test_image_path)
+        byte_data = self.translator.Serpentine(self.test_image_path)
         img = Image.open(self.test_image_path)
         width, height = img.size
-        self.assertEqual(byte_len, width * height * 3)  
+        self.assertEqual(len(byte_data), width * height * 3)  
+
+        # Inverse scan gives back the image
+        restored = self.translator.InverseSerpentine(byte_data, width, height)
+        self.assertTrue(np.array_equal(restored, np.array(img)))
+
+    def test_zigzag_order(self):
+        # Start of the JPEG zig-zag order of an 8x8 block
+        self.assertEqual(zigzag_indices(8, 8)[:10].tolist(), [0, 1, 8, 16, 9, 2, 3, 10, 17, 24])
+        self.assertIs(zigzag_indices(8, 8), zigzag_indices(8, 8))
+
+        plane = np.arange(16 * 24).reshape(16, 24)
+        blocks = zigzag_scan(plane, block_size=8)
+        self.assertEqual(blocks.shape, (6, 64))
+        self.assertEqual(blocks[1, :3].tolist(), [8, 9, 32])
+        self.assertTrue(np.array_equal(inverse_zigzag_scan(blocks, 16, 24, block_size=8), plane))
+        self.assertTrue(np.array_equal(inverse_zigzag_scan(zigzag_scan(plane), 16, 24), plane))
 
     # Exercise 5a
     def test_blackwhite_compression(self):
@@ -217,13 +1447,48 @@ class TestColorTranslator(unittest.TestCase):
         rle = self.translator.run_length_encoding(data)
         self.assertEqual(rle, [(3, 255), (2, 0), (2, 128)])
 
+    def test_run_length_packed(self):
+        # Runs longer than 127 need multi-byte varint counts
+        data = bytearray([7] * 300 + [0] + [9] * 20000)
+        counts, values = self.translator.run_length_encoding(memoryview(data), output="arrays")
+        self.assertEqual(counts.tolist(), [300, 1, 20000])
+        self.assertEqual(values.tolist(), [7, 0, 9])
+
+        packed = self.translator.run_length_encoding(data, output="packed")
+        self.assertEqual(len(packed), len(RLE_MAGIC) + 1 + 3 + 2 + 1 + 3)
+        self.assertEqual(self.translator.run_length_decoding(packed), bytes(data))
+        self.assertEqual(self.translator.run_length_decoding([(3, 255), (2, 0)]), bytes([255, 255, 255, 0, 0]))
+
+    def test_run_length_stream(self):
+        # Enough runs for several blocks, split at arbitrary points
+        data = np.random.default_rng(0).integers(0, 2, size=3 * RLE_BLOCK_RUNS, dtype=np.uint8).tobytes()
+        chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+        packed = b"".join(rle_encode_stream(chunks))
+        self.assertEqual(packed, self.translator.run_length_encoding(data, output="packed"))
+
+        pieces = list(rle_decode_stream([packed[i:i + 333] for i in range(0, len(packed), 333)], max_output=4096))
+        self.assertTrue(all(len(piece) <= 4096 for piece in pieces))
+        self.assertEqual(b"".join(pieces), data)
+
+    def test_run_length_stream_feed_is_eager(self):
+        # The runs are taken when feed() is called, even if its result is thrown away
+        data = b"aaab" * 100
+        encoder = RunLengthStreamEncoder()
+        encoder.feed(data)
+        packed = b"".join(encoder.close())
+        self.assertEqual(packed, self.translator.run_length_encoding(data, output="packed"))
+
+        decoder = RunLengthStreamDecoder()
+        self.assertEqual(b"".join(decoder.feed(packed)), data)
+        self.assertEqual(decoder.close(), [])
+
 
 class TestDCT(unittest.TestCase):
     # We do a similar setup for the other created class in exercise 6
     def setUp(self):
         self.converter = DCT()
-        self.test_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
-        self.decoded_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/decoded_image_test.jpg"
+        self.test_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
+        self.decoded_path = os.path.join(SEMINAR_DIR, "decoded_image_test.jpg")
 
     def tearDown(self):
         # Clean up created files
@@ -234,14 +1499,78 @@ class TestDCT(unittest.TestCase):
         dct_data = self.converter.Encode(self.test_image_path)
         idct_data = self.converter.Decode(dct_data, save_path=self.decoded_path)
         self.assertTrue(np.all((idct_data >= 0) & (idct_data <= 255))) # Ensure values are in valid range
+        self.assertTrue(os.path.exists(self.decoded_path))
+
+    def test_decode_to_memmap(self):
+        dct_data = self.converter.Encode(self.test_image_path)
+        with tempfile.TemporaryDirectory() as tmp:
+            out = np.lib.format.open_memmap(os.path.join(tmp, "decoded.npy"), mode="w+", dtype=np.uint8, shape=dct_data.shape)
+            decoded = self.converter.Decode(dct_data, out=out, chunk_columns=100)
+            self.assertIs(decoded, out)
+            self.assertTrue(np.array_equal(out, np.uint8(self.converter.Decode(dct_data))))
+            del decoded, out
+
+    def test_parallel(self):
+        # Strips on 3 workers give the same transform as the whole frame
+        image = np.random.default_rng(0).integers(0, 256, size=(61, 47, 3), dtype=np.uint8)
+        gray = image[:, :, 0]
+        for backend in DCT_BACKENDS:
+            serial, parallel = DCT(backend=backend), DCT(backend=backend, workers=3)
+            for data in (image, gray):
+                coeffs = parallel.Encode(data)
+                self.assertTrue(np.allclose(coeffs, serial.Encode(data), atol=1e-2))
+                out = np.empty(data.shape, dtype=np.uint8)
+                parallel.Decode(coeffs, out=out, chunk_columns=10)
+                self.assertTrue(np.array_equal(out, np.uint8(serial.Decode(coeffs))))
+
+        # Every transform reuses the same pool
+        pool = _thread_pool(3)
+        DWT(workers=3).Encode(image)
+        self.assertIs(_thread_pool(3), pool)
+
+
+class TestBlockDCT(unittest.TestCase):
+    def test_encode_decode(self):
+        # Smooth gradient with an odd size, so the last blocks are padded
+        y, x = np.mgrid[0:37, 0:53]
+        image = np.stack([x * 4, y * 6, (x + y) * 2], axis=-1).astype(np.uint8)
+
+        codec = BlockDCT(quality=75)
+        encoded = codec.Encode(image)
+        decoded = codec.Decode(encoded)
+        self.assertEqual(decoded.shape, image.shape)
+        self.assertLess(encoded["size_bytes"], image.nbytes)
+        self.assertGreater(psnr(image, decoded), 30)
+        self.assertEqual(codec.Encode(image), encoded)  # The coded data only, no timings
+
+        # Decoding band by band into a buffer gives the same image
+        out = np.zeros_like(image)
+        self.assertIs(codec.Decode(encoded, out=out, band_rows=1), out)
+        self.assertTrue(np.array_equal(out, decoded))
+
+        # The tables come with the encoded image: another quality decodes it the same
+        self.assertTrue(np.array_equal(BlockDCT(quality=10).Decode(encoded), decoded))
+
+    def test_matrix_backend(self):
+        blocks = np.random.default_rng(0).uniform(-128, 128, size=(3, 8, 5, 8))
+        coeffs = block_dct2(blocks, backend="matrix")
+        self.assertEqual(coeffs.dtype, np.float32)
+        self.assertTrue(np.allclose(coeffs, block_dct2(blocks), atol=1e-3))
+        self.assertTrue(np.allclose(block_dct2(coeffs, backend="matrix", inverse=True), blocks, atol=1e-3))
+        self.assertTrue(np.allclose(dct_along(blocks, axis=1, backend="matrix"), dct_along(blocks, axis=1), atol=1e-3))
+        self.assertIs(dct_basis(8), dct_basis(8))
+
+    def test_coefficient_packing(self):
+        coeffs = np.array([0, -1, 1, 32767, -32768, 5, 0, 0], dtype=np.int16)
+        self.assertTrue(np.array_equal(unpack_coefficients(pack_coefficients(coeffs)), coeffs))
 
 
 class TestDWT(unittest.TestCase):
     # We do a similar setup for the other created class in exercise 7
     def setUp(self):
         self.converter = DWT(wavelet='haar', level=1)
-        self.test_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
-        self.decoded_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/dwt_decoded_image_test.jpg"
+        self.test_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
+        self.decoded_path = os.path.join(SEMINAR_DIR, "dwt_decoded_image_test.jpg")
 
     def tearDown(self):
         # Clean up created files
@@ -252,6 +1581,54 @@ class TestDWT(unittest.TestCase):
         dwt_data = self.converter.Encode(self.test_image_path)
         idwt_data = self.converter.Decode(dwt_data, save_path=self.decoded_path)
         self.assertTrue(np.all((idwt_data >= 0) & (idwt_data <= 255))) # Ensure values are in valid range
+        self.assertTrue(os.path.exists(self.decoded_path))
+
+        # Decoding into a buffer of the original size
+        out = np.empty((371, 660, 3), dtype=np.uint8)
+        self.assertIs(self.converter.Decode(dwt_data, out=out), out)
+
+    def test_compress_decompress(self):
+        converter = DWT(wavelet='db2', level=3)
+        image = np.array(Image.open(self.test_image_path).convert('RGB'))
+        lossless = converter.Decompress(converter.Compress(image, threshold=0, step=1))
+        self.assertGreater(psnr(image, lossless), 45)
+
+        # Strips on 3 workers give exactly the pywt coefficients
+        parallel = DWT(wavelet='db2', level=3, workers=3)
+        for expected, coeffs in zip(converter.Encode(image), parallel.Encode(image)):
+            self.assertTrue(np.array_equal(expected[0], coeffs[0]))
+            for expected_details, details in zip(expected[1:], coeffs[1:]):
+                self.assertTrue(all(np.array_equal(a, b) for a, b in zip(expected_details, details)))
+        self.assertTrue(np.array_equal(parallel.Decompress(converter.Compress(image)), converter.Decompress(converter.Compress(image))))
+
+        results = converter.RateDistortion(image, thresholds=(5, 40), mode="soft")
+        self.assertEqual(len(results), 2)
+        # More thresholding, smaller blob and lower quality
+        self.assertGreater(results[1]["compression_ratio"], results[0]["compression_ratio"])
+        self.assertLess(results[1]["psnr_db"], results[0]["psnr_db"])
+
+    def test_compress_per_subband(self):
+        # Each subband is thresholded and quantized with its own values
+        converter = DWT(wavelet='haar', level=2)
+        image = np.array(Image.open(self.test_image_path).convert('RGB'))
+        plain = converter.Compress(image, threshold=5, step=2)
+        self.assertEqual(converter.Compress(image, threshold={}, step={}), converter.Compress(image, threshold=10, step=1))
+        self.assertEqual(converter.Compress(image, threshold=lambda level, band: 0 if band == "a" else 5, step=lambda level, band: 2), plain)
+
+        # Coarse diagonal details at the finest level only: smaller and still close
+        diagonal = converter.Compress(image, threshold=5, step=lambda level, band: 16 if (level, band) == (1, "d") else 2)
+        self.assertLess(len(diagonal), len(plain))
+        # Subbands missing from a dict take the default step
+        self.assertEqual(converter.Compress(image, threshold=5, step={(1, "d"): 16}),
+                         converter.Compress(image, threshold=5, step=lambda level, band: 16 if (level, band) == (1, "d") else DWT_STEP))
+        horizontal = converter.Compress(image, threshold=5, step=lambda level, band: 16 if (level, band) == (1, "h") else 2)
+        self.assertNotEqual(horizontal, diagonal)
+        self.assertGreater(psnr(image, converter.Decompress(diagonal)), 30)
+
+        # A thresholded approximation changes the output
+        self.assertNotEqual(converter.Compress(image, threshold={(0, "a"): 50}), converter.Compress(image, threshold=10))
+        with self.assertRaises(ValueError):
+            converter.Compress(image, step={(2, "h"): 1})
 
 
 
@@ -292,10 +1669,15 @@ if __name__ == "__main__":
     print(f"\nOriginal RGB: ({R_in}, {G_in}, {B_in})")
     print(f"Final RGB:    ({R_out}, {G_out}, {B_out})")
 
+    # Throughput of the scalar functions and the frame methods on a 1080p frame
+    print("\nColor conversion throughput (MP/s):")
+    for method, throughput in benchmark_color_conversion().items():
+        print(f"{method:>7}: rgb_to_yuv {throughput['rgb_to_yuv']:8.1f}   yuv_to_rgb {throughput['yuv_to_rgb']:8.1f}")
+
 
     # Exercise 3
-    input_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
-    output_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT_resized.jpg"
+    input_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
+    output_image_path = os.path.join(SEMINAR_DIR, "GOAT_resized.jpg")
     target_width = int(input("Enter target width: "))
     target_height = int(input("Enter target height: "))
     translator.ResizeImages(input_image_path, output_image_path, target_width, target_height)
@@ -303,14 +1685,14 @@ if __name__ == "__main__":
 
 
     # Exercise 4
-    input_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
+    input_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
     serpentine_data = translator.Serpentine(input_image_path)
-    print(f"Serpentine byte data length: {(serpentine_data)}")
+    print(f"Serpentine byte data length: {len(serpentine_data)}")
 
 
     # Exercise 5a
-    input_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
-    bw_output_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT_bw_compressed.jpg"
+    input_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
+    bw_output_image_path = os.path.join(SEMINAR_DIR, "GOAT_bw_compressed.jpg")
     translator.BlackWhiteCompression(input_image_path, bw_output_image_path)
     print(f"Black and white compressed image saved to: {bw_output_image_path}")
 
@@ -324,31 +1706,54 @@ if __name__ == "__main__":
     rle_encoded = translator.run_length_encoding(input_data)
     print("\nCodification by RLE:")
     print(rle_encoded)
+    print("Packed RLE:", translator.run_length_encoding(input_data, output="packed"))
 
 
     # Exercise 6
-    input_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
+    input_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
 
     converter = DCT()
     encoded = converter.Encode(input_image_path)
-    decoded = converter.Decode(encoded)
+    decoded = converter.Decode(encoded, save_path=os.path.join(SEMINAR_DIR, "dct_decoded_image.jpg"))
 
     print("\nOriginal Data:\n", np.array(Image.open(input_image_path)))
     print("\nDCT Encoded:\n", encoded)
     print("\nDecoded Data:\n", decoded)
 
+    # Accuracy and throughput of the DCT backends
+    print("\nDCT backends (1080p):")
+    for result in benchmark_dct_backends():
+        print(f"{result['mode']:>7} {result['backend']:>8}: {result['mp_per_s']:8.1f} MP/s, max error {result['max_error']:.2e}")
+
+    # Block DCT codec: size and speed for growing resolutions
+    print("\nBlock DCT codec (quality 50):")
+    for result in benchmark_block_dct(input_image_path):
+        print(f"{result['resolution']:>10}: {result['size_bytes']:>8} bytes ({result['bits_per_pixel']:.2f} bpp), "
+              f"encode {result['encode_mp_per_s']:.1f} MP/s, decode {result['decode_mp_per_s']:.1f} MP/s, PSNR {result['psnr_db']:.1f} dB")
+
 
     # Exercise 7
-    input_image_path = "/Users/Eric/Downloads/VideoCoding/seminar_1/GOAT.jpg"
+    input_image_path = os.path.join(SEMINAR_DIR, "GOAT.jpg")
 
     converter = DWT(wavelet='haar', level=1)
     encoded = converter.Encode(input_image_path)
-    decoded = converter.Decode(encoded)
+    decoded = converter.Decode(encoded, save_path=os.path.join(SEMINAR_DIR, "dwt_decoded_image.jpg"))
 
     print("\nOriginal Data:\n", np.array(Image.open(input_image_path)))
     print("\nDWT Encoded:\n", encoded)
     print("\nDecoded Data:\n", decoded)
 
+    # Compression mode: ratio against PSNR for growing thresholds
+    print("\nDWT compression (db2, 3 levels):")
+    for result in DWT(wavelet='db2', level=3).RateDistortion(input_image_path):
+        print(f"threshold {result['threshold']:>3}: {result['size_bytes']:>7} bytes, "
+              f"ratio {result['compression_ratio']:5.1f}, PSNR {result['psnr_db']:.1f} dB")
+
+    # Scaling of the transforms with the number of workers on a 4K frame
+    print("\nParallel transforms (4K):")
+    for result in benchmark_parallel_transforms():
+        print(f"{result['transform']} x{result['workers']}: {result['mp_per_s']:6.1f} MP/s, speedup {result['speedup']:.2f}")
+
 
     # Exercise 8 - Run unit tests
     #unittest.main()
\ No newline at end of file